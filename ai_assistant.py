@@ -1,27 +1,83 @@
 from PyQt6.QtCore import QObject, pyqtSignal
-import json
+import itertools
 import threading
-import requests
-import time
+from collections import deque
+from statistics import median
+from ai_client import AIClientError, StreamCancelled
+from ai_backends import create_backend
+from ai_scheduler import RequestScheduler, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH, PRIORITY_BULK
+from translation_cache import TranslationCache, normalize_text
+from batch_translator import BatchTranslator
+from ai_prefetcher import Prefetcher, HIT, IN_FLIGHT, MISS
+from chat_context import ConversationContext, compact_prompt
+
+# 提示詞版本，修改提示詞後需要增加版本號，舊的緩存不再使用；語法分析結果與翻譯共用緩存
+TRANSLATION_PROMPT_VERSION = 1
+GRAMMAR_PROMPT_VERSION = 1
+
+# 提示詞大小和首個 token 等待時間只統計最近的這麼多次請求
+STATS_WINDOW = 1000
+
+
+def request_key(kind, text, *parts):
+    """翻譯和語法分析請求的調度鍵，文本與緩存鍵一樣正規化，預取和用戶請求的同一句才能合併"""
+    return (kind, normalize_text(text)) + parts
+
 
 class AIAssistant(QObject):
     """AI助手類，負責處理與AI模型的通信和用戶互動"""
     
     # 定義信號
-    response_ready = pyqtSignal(str)  # AI回覆準備好信號
+    # 聊天和語法分析的回覆帶有編號，同時進行的回覆和已取消的回覆不會混在一起
+    response_ready = pyqtSignal(int, str)  # AI回覆準備好信號 (回覆編號, 完整回覆)
+    response_chunk = pyqtSignal(int, str)  # 流式回覆的一段文本 (回覆編號, 文本)
+    response_ended = pyqtSignal(int)  # 回覆被取消或失敗，不會再收到這個編號的文本
     translation_ready = pyqtSignal(str, str)  # 翻譯準備好信號 (原文, 翻譯)
     error_occurred = pyqtSignal(str)  # 錯誤信號
     
-    def __init__(self):
-        """初始化AI助手"""
+    def __init__(self, backend=None):
+        """初始化AI助手
+        
+        Args:
+            backend: AI 後端（見 ai_backends），默認根據環境變量創建，設置有誤時改用 OpenAI
+        """
         super().__init__()
-        # 設置API密鑰和端點 (實際應用應從配置文件或環境變量獲取)
-        self.api_key = "Yourkey:)"
-        self.api_url = "https://api.openai.com/v1/chat/completions"
-        # 學習歷史記錄
-        self.chat_history = []
-        # 上下文管理
-        self.context_size = 10  # 保留最近10條消息作為上下文
+        # 後端設置錯誤的提示，由界面顯示；None 表示沒有錯誤
+        self.backend_error = None
+        if backend is None:
+            try:
+                backend = create_backend()
+            except ValueError as e:
+                # 設置錯誤不應導致程序無法啟動
+                self.backend_error = f"AI 後端設置有誤（{e}），已改用 OpenAI"
+                print(self.backend_error)
+                backend = create_backend("openai")
+        # 聊天、翻譯和語法分析都通過後端調用模型，可以換成本機服務或本地模型
+        self.backend = backend
+        # 所有請求由固定數量的工作線程處理，聊天優先於批量任務，並發數由後端決定
+        self.scheduler = RequestScheduler(max_workers=self.backend.max_concurrency)
+        self.scheduler.start()
+        # 翻譯結果的持久化緩存
+        self.translation_cache = TranslationCache()
+        # 整條字幕軌的批量翻譯，與單句翻譯共用後端、調度器和緩存
+        self.batch_translator = BatchTranslator(self.backend, self.scheduler, self.translation_cache,
+                                                self.backend.translation_model,
+                                                max_batch_tokens=self.backend.max_batch_tokens,
+                                                max_batch_cues=self.backend.max_batch_cues)
+        # 播放時預先翻譯即將出現的字幕
+        self.prefetcher = Prefetcher(self)
+        # 學習歷史記錄，多個工作線程會同時寫入
+        self._history_lock = threading.Lock()
+        # 回覆編號 -> 未完成的聊天和語法分析請求
+        self._reply_ids = itertools.count(1)
+        self._replies = {}
+        self._replies_lock = threading.Lock()
+        # 上下文管理：提示詞不超過預算，放不下的舊對話壓縮成摘要
+        self.context = ConversationContext(budget=2000)
+        self.prompt_tokens = deque(maxlen=STATS_WINDOW)  # 最近每次聊天請求的提示詞 token 數
+        # 流式回覆統計：最近每次回覆的首個 token 等待時間（秒）
+        self.stream = self.backend.stream
+        self.first_token_times = deque(maxlen=STATS_WINDOW)
     
     def ask_question(self, question, context=None): 
         """向AI模型提問
@@ -33,16 +89,9 @@ class AIAssistant(QObject):
         if not question:
             return
         
-        # 添加用戶問題到歷史記錄
-        self.chat_history.append({"role": "user", "content": question})
-        
-        # 保持歷史記錄在合理大小
-        if len(self.chat_history) > self.context_size:
-            self.chat_history = self.chat_history[-self.context_size:]
-        
         # 構建消息列表，使用小瑤的人設
-        messages = [
-            {"role": "system", "content": """你是可愛的日語學習助手「小瑤」，幫助學習者理解日語內容、語法和文化背景。
+        system_messages = [
+            {"role": "system", "content": compact_prompt("""你是可愛的日語學習助手「小瑤」，幫助學習者理解日語內容、語法和文化背景。
             
             小瑤的個性設定：
             - 活潑可愛的少女形象
@@ -53,21 +102,47 @@ class AIAssistant(QObject):
             - 不會太嚴肅，語氣始終保持輕快活潑
             
             回答請使用繁體中文。經常使用如(✿◠‿◠)、(｡･ω･｡)、(っ●ω●)っ♡、(ﾉ◕ヮ◕)ﾉ*:･ﾟ✧等顏文字增添可愛感。
-            在專業解釋中保持正確性，但表達方式要活潑有趣。"""}
+            在專業解釋中保持正確性，但表達方式要活潑有趣。""")}
         ]
         
         # 加入當前上下文 (如字幕)
         if context:
             context_message = f"用戶正在觀看的視頻當前字幕是: {context}"
-            messages.append({"role": "system", "content": context_message})
+            system_messages.append({"role": "system", "content": context_message})
+        
+        # 添加用戶問題到歷史記錄，按預算加入最近的對話
+        with self._history_lock:
+            self.context.add("user", question)
+            messages, tokens, overflow = self.context.build(system_messages)
+        self.prompt_tokens.append(tokens)
+        print(f"AI 請求提示詞約 {tokens} tokens（{len(messages)} 條消息，預算 {self.context.budget}）")
+        if overflow:
+            self._summarize_history(overflow)
+        
+        # 每個問題都不同，不合併請求
+        self._submit_chat(None, messages, group='chat')
+    
+    def _summarize_history(self, count):
+        """在後台把放不下的舊對話壓縮成摘要，同一時間只進行一次"""
+        key = ('summary',)
+        if self.scheduler.get(key):
+            return
+        with self._history_lock:
+            turns = self.context.turns[:count]
+            messages = self.context.summary_messages(turns)
         
-        # 添加歷史記錄
-        messages.extend(self.chat_history)
+        def on_summary(summary):
+            with self._history_lock:
+                self.context.fold(turns, summary)
+                length = len(self.context.summary)
+            print(f"已把 {len(turns)} 條舊對話壓縮成摘要（{length} 字）")
         
-        # 使用線程調用API避免UI凍結
-        thread = threading.Thread(target=self._query_api, args=(messages,))
-        thread.daemon = True
-        thread.start()
+        self.scheduler.submit(
+            key, lambda: self.backend.chat(messages, model=self.backend.chat_model, temperature=0.3,
+                                           max_tokens=self.context.summary_budget),
+            priority=PRIORITY_BULK, group='summary',
+            callback=on_summary,
+            error_callback=lambda e: print(f"壓縮對話歷史失敗: {e}"))
     
     def translate_text(self, text, source_lang="ja", target_lang="zh-TW"):
         """翻譯文本
@@ -80,96 +155,167 @@ class AIAssistant(QObject):
         if not text:
             return
         
-        # 構建消息，使用小瑤的人設
-        messages = [
-            {"role": "system", "content": f"""你是小瑤，一位可愛活潑的翻譯專家，負責將{source_lang}翻譯成{target_lang}。
+        # 已經翻譯過的句子直接使用緩存
+        cached = self.translation_cache.get(text, source_lang, target_lang,
+                                            self.backend.translation_model, TRANSLATION_PROMPT_VERSION)
+        if cached is not None:
+            self.prefetcher.record('translate', HIT)
+            self.scheduler.cancel_group('translate')
+            self.translation_ready.emit(text, cached)
+            return
+        
+        # 重複點擊同一句只請求一次，換到另一句時取消之前未完成的翻譯
+        key, translate = self._translation_job(text, source_lang, target_lang)
+        self.scheduler.cancel_group('translate', keep=key)
+        request = self.scheduler.get(key)
+        if request and request.group == 'translate':
+            return
+        # 正在預取的句子合併到預取請求，提升為最高優先級
+        self.prefetcher.record('translate', IN_FLIGHT if request else MISS)
+        self.scheduler.submit(
+            key, translate,
+            priority=PRIORITY_INTERACTIVE, group='translate',
+            callback=lambda translated_text: self.translation_ready.emit(text, translated_text),
+            error_callback=lambda e: self.error_occurred.emit(f"翻譯請求錯誤: {str(e)}"))
+    
+    def prefetch_translation(self, text, source_lang="ja", target_lang="zh-TW"):
+        """以低優先級預先翻譯，結果只寫入緩存；已有緩存或請求時返回 False"""
+        if self.translation_cache.get(text, source_lang, target_lang,
+                                      self.backend.translation_model, TRANSLATION_PROMPT_VERSION) is not None:
+            return False
+        key, translate = self._translation_job(text, source_lang, target_lang)
+        return self._prefetch(key, translate)
+    
+    def _prefetch(self, key, func):
+        """提交預取請求"""
+        if self.scheduler.get(key):
+            return False
+        self.scheduler.submit(
+            key, func, priority=PRIORITY_PREFETCH, group='prefetch',
+            error_callback=lambda e: print(f"預取失敗: {e}"))
+        return True
+    
+    def _translation_job(self, text, source_lang, target_lang):
+        """返回翻譯請求的鍵和在工作線程中執行的函數"""
+        messages = self._translation_messages(text, source_lang, target_lang)
+        
+        def translate():
+            translated_text = self._translate_api_call(messages)
+            # 即使請求已被取消，結果仍然保存下來供下次使用
+            self.translation_cache.put(text, source_lang, target_lang,
+                                       self.backend.translation_model, TRANSLATION_PROMPT_VERSION, translated_text)
+            return translated_text
+        
+        return request_key('translate', text, source_lang, target_lang), translate
+    
+    def _translation_messages(self, text, source_lang, target_lang):
+        """構建翻譯請求的消息，使用小瑤的人設"""
+        return [
+            {"role": "system", "content": compact_prompt(f"""你是小瑤，一位可愛活潑的翻譯專家，負責將{source_lang}翻譯成{target_lang}。
             請提供準確的翻譯，並在翻譯後加入一個簡短的可愛備註，使用顏文字如(✿◠‿◠)、(｡･ω･｡)等增添親切感。
             格式如下：
             
             翻譯：[準確翻譯內容]
             
-            小瑤備註：[簡短的備註，可以是關於這句話的文化背景、使用場景、語法特點等] [顏文字]"""},
+            小瑤備註：[簡短的備註，可以是關於這句話的文化背景、使用場景、語法特點等] [顏文字]""")},
             {"role": "user", "content": text}
         ]
+    
+    def _submit_chat(self, key, messages, group):
+        """提交聊天請求，回答加入歷史記錄"""
+        return self._submit_reply(key, lambda on_chunk: self._query_api(messages, on_chunk), group)
+    
+    def _submit_reply(self, key, func, group):
+        """提交以流式顯示的請求，func(on_chunk) 在工作線程中執行並返回完整回覆"""
+        reply_id = next(self._reply_ids)
+        request = None
+        
+        def on_chunk(chunk):
+            # 請求已被取消時中止接收
+            if request is not None and request.cancelled:
+                raise StreamCancelled()
+            self.response_chunk.emit(reply_id, chunk)
         
-        # 使用線程調用API避免UI凍結
-        thread = threading.Thread(target=self._translate_api_call, args=(text, messages))
-        thread.daemon = True
-        thread.start()
+        def on_done(response):
+            self._finish_reply(reply_id)
+            self._on_chat_response(response, reply_id)
+        
+        def on_error(error):
+            self._finish_reply(reply_id)
+            self.response_ended.emit(reply_id)
+            self._on_chat_error(error)
+        
+        # 持有鎖直到登記完成，請求很快完成時回調也會等待登記
+        with self._replies_lock:
+            request = self.scheduler.submit(
+                key, lambda: func(on_chunk),
+                priority=PRIORITY_INTERACTIVE, group=group,
+                callback=on_done, error_callback=on_error)
+            self._replies[reply_id] = request
+        return request
+    
+    def _finish_reply(self, reply_id):
+        """回覆完成或失敗時取消登記"""
+        with self._replies_lock:
+            self._replies.pop(reply_id, None)
+    
+    def _cancel_replies(self, group, keep=None):
+        """取消分組中的請求，並通知界面結束被取消的回覆"""
+        self.scheduler.cancel_group(group, keep=keep)
+        with self._replies_lock:
+            reply_ids = [reply_id for reply_id, request in self._replies.items() if request.cancelled]
+            for reply_id in reply_ids:
+                del self._replies[reply_id]
+        for reply_id in reply_ids:
+            self.response_ended.emit(reply_id)
     
-    def _query_api(self, messages):
-        """調用API獲取回答"""
-        max_retries = 3
-        retry_delay = 5  # 初始延遲 5 秒
+    def _on_chat_response(self, assistant_response, reply_id=None):
+        """聊天請求完成回調，在工作線程中調用"""
+        # 添加回答到歷史記錄
+        with self._history_lock:
+            self.context.add("assistant", assistant_response)
         
-        for attempt in range(max_retries):
-            try:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}"
-                }
-                
-                data = {
-                    "model": "gpt-3.5-turbo-1106",
-                    "messages": messages,
-                    "temperature": 0.7
-                }
-                
-                response = requests.post(self.api_url, headers=headers, json=data)
-                response.raise_for_status()
-                
-                response_data = response.json()
-                assistant_response = response_data["choices"][0]["message"]["content"]
-                
-                # 添加回答到歷史記錄
-                self.chat_history.append({"role": "assistant", "content": assistant_response})
-                
-                # 發送回答信號
-                self.response_ready.emit(assistant_response)
-                
-                return  # 成功則退出函數
-                
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 429:
-                    if attempt < max_retries - 1:  # 如果不是最後一次嘗試
-                        print(f"遇到限流錯誤，{retry_delay} 秒後重試...")
-                        time.sleep(retry_delay)
-                        retry_delay *= 2  # 指數退避
-                    else:
-                        self.error_occurred.emit(f"API 請求限流，請稍後再試")
-                else:
-                    self.error_occurred.emit(f"AI請求錯誤: {str(e)}")
-                    break
-            except Exception as e:
-                self.error_occurred.emit(f"AI請求錯誤: {str(e)}")
-                break
-    
-    def _translate_api_call(self, original_text, messages):
+        # 發送回答信號
+        if reply_id is None:
+            reply_id = next(self._reply_ids)
+        self.response_ready.emit(reply_id, assistant_response)
+    
+    def _on_chat_error(self, error):
+        """聊天請求失敗回調"""
+        if isinstance(error, StreamCancelled):
+            return
+        if isinstance(error, AIClientError) and error.status_code == 429:
+            self.error_occurred.emit("API 請求限流，請稍後再試")
+        else:
+            self.error_occurred.emit(f"AI請求錯誤: {str(error)}")
+    
+    def _query_api(self, messages, on_chunk=None):
+        """調用API獲取回答，提供 on_chunk 時以流式接收"""
+        if not self.stream or on_chunk is None:
+            return self.backend.chat(messages, model=self.backend.chat_model, temperature=0.7)
+        
+        response, first_token_time = self.backend.chat_stream(
+            messages, model=self.backend.chat_model, on_chunk=on_chunk, temperature=0.7)
+        if first_token_time is not None:
+            self.first_token_times.append(first_token_time)
+            print(f"AI 首個 token 等待時間: {first_token_time * 1000:.0f} ms")
+        return response
+    
+    def report_stream_stats(self):
+        """輸出流式回覆的首個 token 等待時間和提示詞大小統計"""
+        if self.prompt_tokens:
+            print(f"AI 聊天請求 {len(self.prompt_tokens)} 次，提示詞中位數 {median(self.prompt_tokens):.0f} tokens，"
+                  f"最大 {max(self.prompt_tokens)} tokens")
+        if not self.first_token_times:
+            return
+        times = sorted(self.first_token_times)
+        print(f"AI 回覆 {len(times)} 次，首個 token 等待時間中位數 {median(times) * 1000:.0f} ms，"
+              f"最長 {times[-1] * 1000:.0f} ms")
+    
+    def _translate_api_call(self, messages):
         """調用API進行翻譯"""
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}"
-            }
-            
-            data = {
-                "model": "gpt-3.5-turbo",
-                "messages": messages,
-                "temperature": 0.3
-            }
-            
-            response = requests.post(self.api_url, headers=headers, json=data)
-            response.raise_for_status()
-            
-            response_data = response.json()
-            translated_text = response_data["choices"][0]["message"]["content"]
-            
-            # 發送翻譯結果信號
-            self.translation_ready.emit(original_text, translated_text)
-            
-        except Exception as e:
-            self.error_occurred.emit(f"翻譯請求錯誤: {str(e)}")
-            
+        return self.backend.chat(messages, model=self.backend.translation_model, temperature=0.3)
+    
     def analyze_grammar(self, sentence):
         """分析句子語法結構
         
@@ -179,9 +325,43 @@ class AIAssistant(QObject):
         if not sentence:
             return
         
+        # 分析過的句子直接使用緩存
+        cached = self.translation_cache.get(sentence, "ja", "grammar", self.backend.chat_model, GRAMMAR_PROMPT_VERSION)
+        if cached is not None:
+            self.prefetcher.record('grammar', HIT)
+            self._cancel_replies('grammar')
+            self._on_chat_response(cached)
+            return
+        
+        # 重複分析同一句只請求一次，換到另一句時取消之前未完成的分析
+        key = request_key('grammar', sentence)
+        self._cancel_replies('grammar', keep=key)
+        request = self.scheduler.get(key)
+        if request and request.group == 'grammar':
+            return
+        self.prefetcher.record('grammar', IN_FLIGHT if request else MISS)
+        
+        messages = self._grammar_messages(sentence)
+        self._submit_reply(key, lambda on_chunk: self._analyze_api_call(sentence, messages, on_chunk), 'grammar')
+    
+    def prefetch_grammar(self, sentence):
+        """以低優先級預先分析語法，結果只寫入緩存；已有緩存或請求時返回 False"""
+        if self.translation_cache.get(sentence, "ja", "grammar", self.backend.chat_model, GRAMMAR_PROMPT_VERSION) is not None:
+            return False
+        messages = self._grammar_messages(sentence)
+        return self._prefetch(request_key('grammar', sentence), lambda: self._analyze_api_call(sentence, messages))
+    
+    def _analyze_api_call(self, sentence, messages, on_chunk=None):
+        """調用API分析語法並寫入緩存"""
+        analysis = self._query_api(messages, on_chunk)
+        self.translation_cache.put(sentence, "ja", "grammar", self.backend.chat_model, GRAMMAR_PROMPT_VERSION, analysis)
+        return analysis
+    
+    def _grammar_messages(self, sentence):
+        """構建語法分析請求的消息"""
         # 構建消息，使用小瑤的人設
-        messages = [
-            {"role": "system", "content": """你是可愛的日語學習助手「小瑤」，擅長分析日文語法。請以活潑可愛的方式分析以下日文句子的語法結構、詞性和含義。
+        return [
+            {"role": "system", "content": compact_prompt("""你是可愛的日語學習助手「小瑤」，擅長分析日文語法。請以活潑可愛的方式分析以下日文句子的語法結構、詞性和含義。
 
             小瑤的分析特點：
             - 用繁體中文詳細解釋，保持專業性
@@ -207,11 +387,6 @@ class AIAssistant(QObject):
             [這種表達在何種場合使用，注意與誰交流時適合]
             
             「小瑤提示」：
-            [實用學習建議，可以添加接近的中文表達或記憶技巧] [顏文字]"""},
+            [實用學習建議，可以添加接近的中文表達或記憶技巧] [顏文字]""")},
             {"role": "user", "content": sentence}
         ]
-        
-        # 使用線程調用API避免UI凍結
-        thread = threading.Thread(target=self._query_api, args=(messages,))
-        thread.daemon = True
-        thread.start()
\ No newline at end of file
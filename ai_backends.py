@@ -0,0 +1,201 @@
+import os
+import time
+import threading
+from ai_client import AIClient, AIClientError
+try:
+    import llama_cpp
+except ImportError:
+    llama_cpp = None
+
+# 默認使用的 OpenAI 模型
+OPENAI_CHAT_MODEL = "gpt-3.5-turbo-1106"
+OPENAI_TRANSLATION_MODEL = "gpt-3.5-turbo"
+
+# 本機 OpenAI 兼容服務（llama.cpp server、Ollama、vLLM 等）的默認地址
+LOCAL_API_URL = "http://localhost:8080/v1/chat/completions"
+
+
+class OpenAIBackend:
+    """OpenAI 兼容的 HTTP 接口
+
+    同時用於 OpenAI 和本機運行的兼容服務，區別只在地址、模型和並發設置。
+    """
+
+    def __init__(self, api_url, api_key="", chat_model=OPENAI_CHAT_MODEL,
+                 translation_model=OPENAI_TRANSLATION_MODEL, max_concurrency=2,
+                 max_batch_tokens=1500, max_batch_cues=40, stream=True, **client_options):
+        """初始化後端
+
+        Args:
+            api_url: 聊天接口地址
+            api_key: API 密鑰，本機服務通常不需要
+            chat_model: 聊天和語法分析使用的模型
+            translation_model: 翻譯使用的模型
+            max_concurrency: 同時進行的請求數量
+            max_batch_tokens: 批量翻譯每個請求中字幕文本的估計 token 上限
+            max_batch_cues: 批量翻譯每個請求最多的字幕條數
+            stream: 聊天是否使用流式回覆
+            client_options: 傳給 AIClient 的其他參數，例如 timeout、max_retries
+        """
+        self.name = "openai"
+        self.chat_model = chat_model
+        self.translation_model = translation_model
+        self.max_concurrency = max_concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_cues = max_batch_cues
+        self.stream = stream
+        self.client = AIClient(api_url, api_key, pool_size=max(max_concurrency, 1), **client_options)
+
+    def chat(self, messages, model, temperature=0.7, **options):
+        """調用聊天接口，返回回覆文本"""
+        return self.client.chat(messages, model, temperature, **options)
+
+    def chat_stream(self, messages, model, on_chunk, temperature=0.7, **options):
+        """流式調用聊天接口，返回 (完整回覆文本, 首個 token 的等待時間)"""
+        return self.client.chat_stream(messages, model, on_chunk, temperature, **options)
+
+    def close(self):
+        self.client.close()
+
+
+class LlamaCppBackend:
+    """使用 llama-cpp-python 在本進程中以 CPU 運行 GGUF 模型
+
+    模型在第一次請求時加載。同一個模型實例不能並發使用，所有請求依次執行，
+    批量翻譯使用較小的批次，避免單個請求佔用模型太久、阻塞用戶的聊天請求。
+    """
+
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, max_batch_tokens=600, max_batch_cues=15,
+                 stream=True):
+        """初始化後端
+
+        Args:
+            model_path: GGUF 模型文件路徑
+            n_ctx: 上下文長度
+            n_threads: 推理線程數，None 表示使用所有 CPU 核心
+            max_batch_tokens: 批量翻譯每個請求中字幕文本的估計 token 上限
+            max_batch_cues: 批量翻譯每個請求最多的字幕條數
+            stream: 聊天是否使用流式回覆
+        """
+        self.name = "llama-cpp"
+        self.model_path = model_path
+        self.chat_model = os.path.basename(model_path)
+        self.translation_model = self.chat_model
+        self.n_ctx = n_ctx
+        self.n_threads = n_threads or os.cpu_count()
+        self.max_concurrency = 1
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_cues = max_batch_cues
+        self.stream = stream
+        self._llm = None
+        self._lock = threading.Lock()
+
+    def _model(self):
+        """加載模型，調用時需持有鎖"""
+        if self._llm is None:
+            if llama_cpp is None:
+                raise AIClientError("未安裝 llama-cpp-python，無法使用本地模型")
+            if not os.path.exists(self.model_path):
+                raise AIClientError(f"找不到本地模型文件: {self.model_path}")
+            started = time.monotonic()
+            self._llm = llama_cpp.Llama(model_path=self.model_path, n_ctx=self.n_ctx,
+                                        n_threads=self.n_threads, verbose=False)
+            print(f"已加載本地模型 {self.chat_model}，耗時 {time.monotonic() - started:.1f} 秒")
+        return self._llm
+
+    @staticmethod
+    def _completion_options(options):
+        """只保留本地模型支持的參數"""
+        return {key: value for key, value in options.items() if key in ('max_tokens', 'stop', 'top_p')}
+
+    def chat(self, messages, model=None, temperature=0.7, **options):
+        """生成回覆文本，model 參數只為與 HTTP 後端保持一致"""
+        with self._lock:
+            result = self._model().create_chat_completion(
+                messages=messages, temperature=temperature, **self._completion_options(options))
+        try:
+            return result["choices"][0]["message"]["content"]
+        except (KeyError, IndexError) as e:
+            raise AIClientError(f"無法解析本地模型回覆: {e}")
+
+    def chat_stream(self, messages, model, on_chunk, temperature=0.7, **options):
+        """流式生成回覆，on_chunk 拋出 StreamCancelled 時停止生成
+
+        Returns:
+            (完整回覆文本, 首個 token 的等待時間（秒），沒有生成任何文本時為 None)
+        """
+        started = time.monotonic()
+        first_token_time = None
+        parts = []
+        with self._lock:
+            chunks = self._model().create_chat_completion(
+                messages=messages, temperature=temperature, stream=True, **self._completion_options(options))
+            for chunk in chunks:
+                text = chunk["choices"][0].get("delta", {}).get("content")
+                if not text:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.monotonic() - started
+                parts.append(text)
+                on_chunk(text)
+        return ''.join(parts), first_token_time
+
+    def close(self):
+        with self._lock:
+            self._llm = None
+
+
+def _env_int(name, default):
+    """讀取整數環境變量，沒有設置或不是整數時返回默認值"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"環境變量 {name}={value} 不是整數，使用默認值 {default}")
+        return default
+
+
+def create_backend(kind=None):
+    """根據環境變量創建 AI 後端
+
+    AI_BACKEND: openai（默認）、local（本機 OpenAI 兼容服務）或 llama-cpp（本進程 CPU 推理）
+    AI_API_URL、AI_API_KEY、AI_MODEL: HTTP 後端的地址、密鑰和模型
+    AI_MODEL_PATH: llama-cpp 使用的 GGUF 模型文件
+    AI_MAX_CONCURRENCY: HTTP 後端同時進行的請求數量
+
+    Raises:
+        ValueError: 未知的後端，或 llama-cpp 後端沒有設置模型文件
+    """
+    kind = kind or os.environ.get("AI_BACKEND", "openai")
+    model = os.environ.get("AI_MODEL")
+
+    if kind == "openai":
+        return OpenAIBackend(
+            os.environ.get("AI_API_URL", "https://api.openai.com/v1/chat/completions"),
+            os.environ.get("AI_API_KEY", "Yourkey:)"),
+            chat_model=model or OPENAI_CHAT_MODEL,
+            translation_model=model or OPENAI_TRANSLATION_MODEL,
+            max_concurrency=_env_int("AI_MAX_CONCURRENCY", 2))
+
+    if kind == "local":
+        # CPU 上的本機服務通常只有一個推理槽，生成也慢得多
+        backend = OpenAIBackend(
+            os.environ.get("AI_API_URL", LOCAL_API_URL),
+            os.environ.get("AI_API_KEY", ""),
+            chat_model=model or "local-model",
+            translation_model=model or "local-model",
+            max_concurrency=_env_int("AI_MAX_CONCURRENCY", 1),
+            max_batch_tokens=600, max_batch_cues=15,
+            timeout=(2, 300), max_retries=1)
+        backend.name = "local"
+        return backend
+
+    if kind == "llama-cpp":
+        model_path = os.environ.get("AI_MODEL_PATH")
+        if not model_path:
+            raise ValueError("使用 llama-cpp 後端需要設置 AI_MODEL_PATH")
+        return LlamaCppBackend(model_path)
+
+    raise ValueError(f"未知的 AI 後端: {kind}")
@@ -100,10 +100,23 @@ class AIChatWidget(QWidget):
     grammar_analysis_requested = pyqtSignal(str)  # 要分析的句子
     translation_requested = pyqtSignal(str)  # 要翻譯的文本
     
+    # 流式回覆最多每幀更新一次
+    CHUNK_FLUSH_INTERVAL_MS = 16
+    
     def __init__(self, parent=None):
         """初始化AI聊天組件"""
         super().__init__(parent)
         self.current_subtitle = ""
+        
+        # 流式回覆：回覆編號 -> 正在接收的消息組件、尚未顯示的文本；已結束的回覆編號
+        self.streaming_messages = {}
+        self._pending_chunks = {}
+        self._ended_replies = set()
+        self._chunk_timer = QTimer(self)
+        self._chunk_timer.setSingleShot(True)
+        self._chunk_timer.setInterval(self.CHUNK_FLUSH_INTERVAL_MS)
+        self._chunk_timer.timeout.connect(self._flush_chunks)
+        
         self.init_ui()
         
     def init_ui(self):
@@ -332,15 +345,16 @@ class AIChatWidget(QWidget):
             font-size: 16px;
             font-style: italic;
         """)
+        self.remove_thinking_message()  # 同一時間只顯示一條等待消息
         self.chat_layout.addWidget(thinking_message)
         self.scroll_to_bottom()
         
-        # 發射問題提交信號，包含當前字幕作為上下文
-        self.question_submitted.emit(question, self.current_subtitle)
-        
         # 保存thinking_message的引用，以便稍後移除
         self.thinking_message = thinking_message
         
+        # 發射問題提交信號，包含當前字幕作為上下文
+        self.question_submitted.emit(question, self.current_subtitle)
+        
     def remove_thinking_message(self):
         """移除正在思考消息"""
         if hasattr(self, 'thinking_message'):
@@ -348,13 +362,58 @@ class AIChatWidget(QWidget):
             self.thinking_message.deleteLater()
             delattr(self, 'thinking_message')
             
-    def handle_ai_response(self, response):
+    def handle_ai_response(self, reply_id, response):
         """處理AI回覆"""
+        self._ended_replies.add(reply_id)
+        message = self.streaming_messages.pop(reply_id, None)
+        if message is not None:
+            # 流式接收的消息已經顯示，用完整回覆校正內容
+            self._pending_chunks.pop(reply_id, None)
+            if message.text_label.toPlainText() != response:
+                message.text_label.setPlainText(response)
+            self.scroll_to_bottom()
+            return
+        
         # 先移除"正在思考"消息
         self.remove_thinking_message()
         
         # 添加AI回覆
         self.add_bot_message(response)
+    
+    def handle_ai_chunk(self, reply_id, chunk):
+        """處理流式回覆的一段文本，累積後按幀更新顯示"""
+        if reply_id in self._ended_replies:
+            # 回覆已被取消，取消前已發出的文本不再顯示
+            return
+        if reply_id not in self.streaming_messages:
+            # 收到第一段文本時用回覆消息替換"正在思考"消息
+            self.remove_thinking_message()
+            message = MessageWidget("", is_user=False)
+            self.chat_layout.addWidget(message)
+            self.streaming_messages[reply_id] = message
+        
+        self._pending_chunks.setdefault(reply_id, []).append(chunk)
+        if not self._chunk_timer.isActive():
+            self._chunk_timer.start()
+    
+    def end_ai_response(self, reply_id):
+        """回覆被取消或失敗，保留已收到的部分回覆，之後的文本不再顯示"""
+        self._ended_replies.add(reply_id)
+        self._flush_chunks()
+        self.streaming_messages.pop(reply_id, None)
+    
+    def _flush_chunks(self):
+        """把累積的文本追加到正在接收的消息"""
+        pending, self._pending_chunks = self._pending_chunks, {}
+        for reply_id, chunks in pending.items():
+            message = self.streaming_messages.get(reply_id)
+            if message is None or not chunks:
+                continue
+            cursor = message.text_label.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertText(''.join(chunks))
+        if pending:
+            self.scroll_to_bottom()
         
     def set_current_subtitle(self, subtitle_text):
         """設置當前字幕，用於上下文"""
@@ -380,15 +439,16 @@ class AIChatWidget(QWidget):
             font-size: 16px;
             font-style: italic;
         """)
+        self.remove_thinking_message()  # 同一時間只顯示一條等待消息
         self.chat_layout.addWidget(thinking_message)
         self.scroll_to_bottom()
         
+        # 先保存thinking_message的引用，緩存命中時回覆在發射信號時就會到達
+        self.thinking_message = thinking_message
+        
         # 發射分析請求信號
         self.grammar_analysis_requested.emit(self.current_subtitle)
         
-        # 保存thinking_message的引用
-        self.thinking_message = thinking_message
-        
     def request_subtitle_translation(self):
         """請求翻譯當前字幕"""
         if not self.current_subtitle:
@@ -409,18 +469,19 @@ class AIChatWidget(QWidget):
             font-size: 16px;
             font-style: italic;
         """)
+        self.remove_thinking_message()  # 同一時間只顯示一條等待消息
         self.chat_layout.addWidget(thinking_message)
         self.scroll_to_bottom()
         
+        # 先保存thinking_message的引用，緩存命中時回覆在發射信號時就會到達
+        self.thinking_message = thinking_message
+        
         # 發射翻譯請求信號
         self.translation_requested.emit(self.current_subtitle)
-        
-        # 保存thinking_message的引用
-        self.thinking_message = thinking_message
     
     def handle_error(self, error_message):
         """處理錯誤"""
-        # 移除"正在思考"消息
+        # 移除"正在思考"消息，失敗的回覆已由 end_ai_response 結束
         self.remove_thinking_message()
         
         # 添加錯誤消息 - 小瑤風格版本
@@ -0,0 +1,281 @@
+import re
+import json
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# 可以重試的 HTTP 狀態碼
+RETRY_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """解析限流響應頭中的時間，例如 '1s'、'6m0s'、'20ms'、'0.5'，單位為秒，無法解析時返回 None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+class AIClientError(Exception):
+    """AI 接口請求失敗"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamCancelled(Exception):
+    """流式回覆被調用方中止"""
+
+
+class TokenBucket:
+    """令牌桶，限制一段時間內可以消耗的數量"""
+
+    def __init__(self, capacity=None, refill_rate=None):
+        """初始化令牌桶
+
+        Args:
+            capacity: 桶的容量，None 表示不限制，直到從響應頭得知限額
+            refill_rate: 每秒補充的數量
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        """按經過的時間補充令牌，調用時需持有鎖"""
+        if self.capacity is not None and self.refill_rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        """預留令牌，返回需要等待的秒數；令牌可以預支，之後的請求會等待更久"""
+        with self._lock:
+            if self.capacity is None:
+                return 0.0
+            now = time.monotonic()
+            self._refill(now)
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            if not self.refill_rate:
+                return 0.0
+            return -self.tokens / self.refill_rate
+
+    def delay(self):
+        """不預留令牌，返回令牌恢復到非負前需要等待的秒數"""
+        with self._lock:
+            if self.capacity is None or not self.refill_rate:
+                return 0.0
+            now = time.monotonic()
+            self._refill(now)
+            return max(0.0, -self.tokens / self.refill_rate)
+
+    def update(self, limit, remaining, reset_seconds):
+        """根據服務端返回的限額、剩餘數量和重置時間校正令牌桶"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit is not None:
+                self.capacity = limit
+                if self.tokens is None:
+                    self.tokens = limit
+            if remaining is not None and self.tokens is not None:
+                self.tokens = min(self.tokens, remaining)
+            if limit is not None and remaining is not None and reset_seconds:
+                # 在重置時間內補滿已使用的額度
+                self.refill_rate = max(limit - remaining, 1) / reset_seconds
+            elif limit is not None and not self.refill_rate:
+                # 沒有重置時間時假設按分鐘計算
+                self.refill_rate = limit / 60
+
+
+class AIClient:
+    """OpenAI 兼容接口的共用 HTTP 客戶端
+
+    所有請求共用一個 requests.Session，保持連接池和 TLS 連接。
+    根據 x-ratelimit-* 響應頭調整請求和 token 兩個令牌桶，發送前等待額度；
+    遇到限流、服務端錯誤或網絡錯誤時使用帶抖動的指數退避重試。
+    """
+
+    def __init__(self, api_url, api_key, timeout=(5, 60), max_retries=4,
+                 backoff_base=1.0, backoff_max=30.0, pool_size=4):
+        """初始化客戶端
+
+        Args:
+            api_url: 聊天接口地址
+            api_key: API 密鑰
+            timeout: (連接超時, 讀取超時)，單位為秒
+            max_retries: 失敗後最多重試的次數
+            backoff_base: 第一次重試的最長等待時間（秒）
+            backoff_max: 每次重試的最長等待時間（秒）
+            pool_size: 連接池中保持的連接數
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.request_bucket = TokenBucket()
+        self.token_bucket = TokenBucket()
+
+    def close(self):
+        """關閉連接池"""
+        self.session.close()
+
+    def _headers(self):
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    @staticmethod
+    def estimate_tokens(payload):
+        """粗略估計請求消耗的 token 數，日文和中文大約每個字一個 token"""
+        text_length = sum(len(message.get('content') or '') for message in payload.get('messages', []))
+        return text_length + payload.get('max_tokens', 0)
+
+    def _wait_for_quota(self, payload, reserve=True):
+        """等待請求和 token 額度
+
+        每個請求只在第一次發送時預留額度，重試時只等待令牌桶恢復，不再重複預留。
+        """
+        if reserve:
+            delay = max(self.request_bucket.reserve(1),
+                        self.token_bucket.reserve(self.estimate_tokens(payload)))
+        else:
+            delay = max(self.request_bucket.delay(), self.token_bucket.delay())
+        if delay > 0:
+            print(f"接近 API 限額，等待 {delay:.1f} 秒")
+            time.sleep(delay)
+
+    def _update_limits(self, headers):
+        """根據響應頭更新令牌桶"""
+        def header_int(name):
+            try:
+                return int(headers[name])
+            except (KeyError, ValueError):
+                return None
+
+        self.request_bucket.update(
+            header_int('x-ratelimit-limit-requests'),
+            header_int('x-ratelimit-remaining-requests'),
+            parse_duration(headers.get('x-ratelimit-reset-requests')))
+        self.token_bucket.update(
+            header_int('x-ratelimit-limit-tokens'),
+            header_int('x-ratelimit-remaining-tokens'),
+            parse_duration(headers.get('x-ratelimit-reset-tokens')))
+
+    def _backoff(self, attempt, retry_after=None):
+        """計算第 attempt 次重試前的等待時間，優先使用服務端的 Retry-After"""
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # 完全抖動：在 [0, base * 2^attempt] 之間隨機取值，避免多個請求同時重試
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, payload, stream=False):
+        """發送請求，失敗時自動重試，返回 requests.Response
+
+        Raises:
+            AIClientError: 重試後仍然失敗或遇到不可重試的錯誤
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_quota(payload, reserve=attempt == 0)
+            retry_after = None
+            try:
+                response = self.session.post(self.api_url, headers=self._headers(), json=payload,
+                                             timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = AIClientError(f"網絡錯誤: {e}")
+            else:
+                self._update_limits(response.headers)
+                if response.ok:
+                    return response
+                last_error = AIClientError(f"{response.status_code} {response.reason}: {response.text[:200]}",
+                                           response.status_code)
+                response.close()
+                if response.status_code not in RETRY_STATUS_CODES:
+                    raise last_error
+                retry_after = parse_duration(response.headers.get('retry-after'))
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt, retry_after)
+                print(f"AI 請求失敗 ({last_error})，{delay:.1f} 秒後重試...")
+                time.sleep(delay)
+        raise last_error
+
+    def chat(self, messages, model, temperature=0.7, **options):
+        """調用聊天接口，返回回覆文本"""
+        payload = {"model": model, "messages": messages, "temperature": temperature}
+        payload.update(options)
+        response = self.post(payload)
+        try:
+            return response.json()["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError) as e:
+            raise AIClientError(f"無法解析 AI 回覆: {e}")
+
+    def chat_stream(self, messages, model, on_chunk, temperature=0.7, **options):
+        """以 SSE 流式調用聊天接口，每收到一段文本就調用 on_chunk(文本)
+
+        on_chunk 拋出 StreamCancelled 時停止接收並關閉連接。
+
+        Returns:
+            (完整回覆文本, 首個 token 的等待時間（秒），沒有收到任何文本時為 None)
+        """
+        payload = {"model": model, "messages": messages, "temperature": temperature, "stream": True}
+        payload.update(options)
+        started = time.monotonic()
+        first_token_time = None
+        parts = []
+
+        response = self.post(payload, stream=True)
+        # SSE 規定使用 UTF-8，服務端通常不在 Content-Type 中註明
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # SSE 以空行分隔事件，這裡只需要 data 行
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    choice = json.loads(data)["choices"][0]
+                except (ValueError, KeyError, IndexError) as e:
+                    raise AIClientError(f"無法解析 AI 回覆: {e}")
+                chunk = choice.get("delta", {}).get("content")
+                if not chunk:
+                    continue
+                if first_token_time is None:
+                    first_token_time = time.monotonic() - started
+                parts.append(chunk)
+                on_chunk(chunk)
+        except requests.RequestException as e:
+            raise AIClientError(f"接收回覆時連接中斷: {e}")
+        finally:
+            response.close()
+
+        return ''.join(parts), first_token_time
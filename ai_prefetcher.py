@@ -0,0 +1,87 @@
+from collections import Counter
+
+# 用戶請求的結果來源
+HIT = 'hit'            # 已在緩存中
+IN_FLIGHT = 'inflight'  # 預取請求尚未完成，合併到該請求
+MISS = 'miss'          # 需要新的請求
+
+
+class Prefetcher:
+    """播放時預先翻譯（和分析）即將出現的字幕
+
+    每次切換到新的日文字幕時，以低優先級提交當前及之後幾條字幕的請求，結果寫入緩存，
+    用戶點擊「翻譯字幕」或「分析句子」時可以直接使用。跳轉播放位置時取消未完成的預取。
+    每條字幕軌的預取請求數有上限，避免長時間播放產生過多費用。
+    """
+
+    def __init__(self, assistant, lookahead=3, max_requests=200, grammar=False):
+        """初始化預取器
+
+        Args:
+            assistant: AIAssistant
+            lookahead: 當前字幕之後預取的條數
+            max_requests: 每條字幕軌最多提交的預取請求數
+            grammar: 是否同時預取語法分析，語法分析的回覆很長，默認關閉
+        """
+        self.assistant = assistant
+        self.lookahead = lookahead
+        self.max_requests = max_requests
+        self.grammar = grammar
+        self.spent = 0  # 當前字幕軌已提交的預取請求數
+        self._last_index = None
+        self.stats = Counter()  # (類型, 結果來源) -> 次數
+
+    def reset(self):
+        """切換字幕軌時調用，取消預取並重新計算請求數"""
+        self.cancel()
+        self.spent = 0
+
+    def cancel(self):
+        """取消所有未完成的預取"""
+        self.assistant.scheduler.cancel_group('prefetch')
+        self._last_index = None
+
+    def update(self, texts, index):
+        """播放到第 index 條日文字幕時調用
+
+        Args:
+            texts: 日文字幕文本列表
+            index: 當前字幕的索引
+        """
+        last = self._last_index
+        if last is not None and not last <= index <= last + self.lookahead:
+            # 跳轉到了其他位置，之前預取的字幕短時間內用不到
+            self.cancel()
+        self._last_index = index
+
+        for text in texts[index:index + self.lookahead + 1]:
+            text = text.strip()
+            if not text:
+                continue
+            if self.spent >= self.max_requests:
+                return
+            if self.assistant.prefetch_translation(text):
+                self.spent += 1
+            if self.grammar and self.spent < self.max_requests and self.assistant.prefetch_grammar(text):
+                self.spent += 1
+
+    def record(self, kind, source):
+        """記錄一次用戶請求的結果來源
+
+        Args:
+            kind: 'translate' 或 'grammar'
+            source: HIT、IN_FLIGHT 或 MISS
+        """
+        self.stats[kind, source] += 1
+
+    def report_stats(self):
+        """輸出預取命中率"""
+        for kind, name in (('translate', "翻譯"), ('grammar', "語法分析")):
+            hits = self.stats[kind, HIT]
+            in_flight = self.stats[kind, IN_FLIGHT]
+            total = hits + in_flight + self.stats[kind, MISS]
+            if total:
+                print(f"{name}預取統計: 請求 {total} 次，緩存命中 {hits} 次 ({hits / total:.0%})，"
+                      f"合併到預取中的請求 {in_flight} 次")
+        if self.spent:
+            print(f"當前字幕軌已提交預取請求 {self.spent} 次")
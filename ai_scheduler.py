@@ -0,0 +1,205 @@
+import heapq
+import itertools
+import threading
+
+# 請求優先級，數值越小越先處理
+PRIORITY_INTERACTIVE = 0  # 用戶正在等待的聊天、翻譯和語法分析
+PRIORITY_PREFETCH = 1     # 預先翻譯即將播放的字幕
+PRIORITY_BULK = 2         # 整條字幕軌的批量翻譯
+
+# 請求狀態
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+
+class AIRequest:
+    """排隊中的 AI 請求，相同鍵的請求會合併為同一個對象"""
+
+    def __init__(self, key, func, priority, group, sequence):
+        self.key = key
+        self.func = func
+        self.priority = priority
+        self.group = group
+        self.sequence = sequence
+        self.state = PENDING
+        self.callbacks = []
+        self.error_callbacks = []
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    @property
+    def cancelled(self):
+        return self.state == CANCELLED
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class RequestScheduler:
+    """AI 請求調度器
+
+    使用固定數量的工作線程按優先級處理請求。鍵相同的請求在完成前只執行一次，
+    所有調用方的回調都會收到結果。請求可以按鍵或按分組取消：
+    排隊中的請求直接移除，正在執行的請求完成後丟棄結果，不調用回調。
+    """
+
+    def __init__(self, max_workers=2):
+        """初始化調度器
+
+        Args:
+            max_workers: 同時進行的請求數量
+        """
+        self.max_workers = max_workers
+        self._queue = []      # (AIRequest) 最小堆
+        self._requests = {}   # 鍵 -> 未完成的請求
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._stopped = False
+
+    def start(self):
+        """啟動工作線程，停止後不再啟動"""
+        with self._condition:
+            if self._workers or self._stopped:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"ai-worker-{i}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def submit(self, key, func, priority=PRIORITY_INTERACTIVE, group=None, callback=None, error_callback=None):
+        """提交請求
+
+        Args:
+            key: 請求鍵，None 表示不與其他請求合併
+            func: 在工作線程中執行的函數，返回值傳給 callback
+            priority: 優先級，見 PRIORITY_* 常量
+            group: 分組名稱，用於 cancel_group
+            callback: 成功時調用 callback(結果)
+            error_callback: 失敗時調用 error_callback(異常)
+
+        Returns:
+            AIRequest 對象
+        """
+        with self._condition:
+            request = self._requests.get(key) if key is not None else None
+            if request is None:
+                request = AIRequest(key, func, priority, group, next(self._sequence))
+                if key is not None:
+                    self._requests[key] = request
+                heapq.heappush(self._queue, request)
+                self._condition.notify()
+            elif priority < request.priority:
+                # 合併的請求中有更緊急的，提升優先級並改用其分組，例如用戶點擊了正在預取的句子
+                request.priority = priority
+                request.group = group
+                if request.state == PENDING:
+                    heapq.heapify(self._queue)
+
+            if callback:
+                request.callbacks.append(callback)
+            if error_callback:
+                request.error_callbacks.append(error_callback)
+            return request
+
+    def get(self, key):
+        """返回鍵相同且尚未完成的請求，沒有則返回 None"""
+        with self._condition:
+            return self._requests.get(key)
+
+    def cancel(self, request):
+        """取消請求"""
+        with self._condition:
+            self._cancel_locked(request)
+
+    def cancel_key(self, key):
+        """取消指定鍵的請求"""
+        with self._condition:
+            request = self._requests.get(key)
+            if request:
+                self._cancel_locked(request)
+
+    def cancel_group(self, group, keep=None):
+        """取消分組中的所有請求
+
+        Args:
+            group: 分組名稱
+            keep: 不取消這個鍵的請求
+        """
+        with self._condition:
+            for request in list(self._requests.values()):
+                if request.group == group and request.key != keep:
+                    self._cancel_locked(request)
+            # 沒有鍵的請求不在 _requests 中
+            for request in self._queue:
+                if request.group == group and request.key is None:
+                    self._cancel_locked(request)
+
+    def _cancel_locked(self, request):
+        """取消請求，調用時需持有鎖"""
+        if request.state in (DONE, CANCELLED):
+            return
+        request.state = CANCELLED
+        if request.key is not None and self._requests.get(request.key) is request:
+            del self._requests[request.key]
+        # 排隊中的請求留在堆中，取出時跳過
+        request.done.set()
+
+    def stop(self):
+        """取消所有未完成的請求並停止工作線程，正在執行的請求完成後線程退出"""
+        with self._condition:
+            self._stopped = True
+            for request in list(self._requests.values()) + self._queue:
+                self._cancel_locked(request)
+            self._queue = []
+            self._workers = []
+            self._condition.notify_all()
+
+    def pending_count(self):
+        """排隊中和正在執行的請求數量"""
+        with self._condition:
+            return sum(1 for request in self._queue if request.state == PENDING) + \
+                sum(1 for request in self._requests.values() if request.state == RUNNING)
+
+    def _next_request(self):
+        """等待並取出優先級最高的請求，調度器停止後返回 None"""
+        with self._condition:
+            while not self._stopped:
+                while self._queue:
+                    request = heapq.heappop(self._queue)
+                    if request.state == PENDING:
+                        request.state = RUNNING
+                        return request
+                self._condition.wait()
+            return None
+
+    def _worker_loop(self):
+        """工作線程：依次執行請求並調用回調"""
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            try:
+                result, error = request.func(), None
+            except Exception as e:
+                result, error = None, e
+
+            with self._condition:
+                if request.state == CANCELLED:
+                    continue
+                request.state = DONE
+                request.result = result
+                request.error = error
+                if request.key is not None and self._requests.get(request.key) is request:
+                    del self._requests[request.key]
+                callbacks = request.error_callbacks if error else request.callbacks
+            request.done.set()
+
+            for callback in callbacks:
+                try:
+                    callback(error if error else result)
+                except Exception as e:
+                    print(f"AI 請求回調出錯: {e}")
@@ -1,9 +1,9 @@
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, 
     QLabel, QSplitter, QFileDialog, QProgressBar, QComboBox,
-    QFrame, QLineEdit, QStatusBar, QMessageBox, QTabWidget
+    QFrame, QLineEdit, QStatusBar, QMessageBox, QTabWidget, QInputDialog
 )
-from PyQt6.QtCore import Qt, QSize,QTimer
+from PyQt6.QtCore import Qt, QSize,QTimer, QEvent
 from PyQt6.QtGui import QIcon, QFont
 
 from media_player import MediaPlayer
@@ -13,11 +13,18 @@ from ai_chat_widget import AIChatWidget
 from data_manager import DataManager
 from subtitle_processor import SubtitleProcessor
 from paths import get_download_path, get_asset_path
+from time import monotonic
+import japanese_tagger
 
 class SubtitleDisplayWidget(QWidget):
     """字幕顯示小工具"""
     def __init__(self, parent=None):
         super().__init__(parent)
+        
+        # 渲染統計：文本實際變化的次數和字幕區域重新佈局的次數
+        self.text_update_count = 0
+        self.relayout_count = 0
+        
         self.init_ui()
         
     def init_ui(self):
@@ -81,19 +88,35 @@ class SubtitleDisplayWidget(QWidget):
         layout.addWidget(subtitle_frame)
         layout.addStretch(1)  # 底部留白
         
+        # 字幕標籤的文本變化會觸發所在框架重新佈局，在這裡計數
+        subtitle_frame.installEventFilter(self)
+        
+    def eventFilter(self, obj, event):
+        """統計字幕區域的重新佈局次數"""
+        if event.type() == QEvent.Type.LayoutRequest:
+            self.relayout_count += 1
+        return super().eventFilter(obj, event)
+        
+    def _set_label_text(self, label, text):
+        """只在文本變化時更新標籤，避免自動換行的標籤重新佈局"""
+        if label.text() != text:
+            label.setText(text)
+            self.text_update_count += 1
+        
     def update_subtitle(self, japanese_text, chinese_text=""):
         """更新字幕文本"""
-        self.japanese_subtitle.setText(japanese_text)
-        self.chinese_subtitle.setText(chinese_text)
+        self._set_label_text(self.japanese_subtitle, japanese_text)
+        self._set_label_text(self.chinese_subtitle, chinese_text)
         
     def clear_subtitle(self):
-        """清除字幕"""
-        self.japanese_subtitle.clear()
-        self.chinese_subtitle.clear()
-        
-        # 額外設置一些佔位文本，使字幕區域保持可見
-        self.japanese_subtitle.setText("")
-        self.chinese_subtitle.setText("")
+        """清除字幕，標籤保持可見"""
+        self._set_label_text(self.japanese_subtitle, "")
+        self._set_label_text(self.chinese_subtitle, "")
+        
+    def reset_stats(self):
+        """重置渲染統計"""
+        self.text_update_count = 0
+        self.relayout_count = 0
 
 class JapaneseAssistantUI(QMainWindow):
     """日語學習助手主界面"""
@@ -108,10 +131,17 @@ class JapaneseAssistantUI(QMainWindow):
         self.data_manager = DataManager()
         self.subtitle_processor = SubtitleProcessor()
         self.ai_assistant = AIAssistant()  # 初始化AI助手
+        # 沒有官方中文字幕時使用AI翻譯整條字幕軌
+        self.subtitle_processor.translator = self.ai_assistant.batch_translator
         
         # 添加這一行來初始化字幕跟蹤變量
         self._last_subtitle = (None, None)
         self._current_jp_subtitle = ""  # 當前日文字幕
+        self._active_cues = (None, None)  # 當前顯示的日文和中文字幕條目
+        
+        # 渲染統計用的播放時長
+        self._playback_ms = 0
+        self._last_position = None  # (播放位置毫秒, 單調時鐘秒)
         
         # 初始化UI
         self.init_ui()
@@ -122,6 +152,9 @@ class JapaneseAssistantUI(QMainWindow):
         # 顯示歡迎信息
         self.status_bar.showMessage("歡迎使用 AI 日語學習助手")
         
+        # 窗口顯示後再在後台加載日語分詞器，加載詞典不阻塞啟動
+        QTimer.singleShot(0, japanese_tagger.load_in_background)
+        
     def init_ui(self):
         """初始化用戶界面"""
         # 創建中央部件
@@ -203,6 +236,10 @@ class JapaneseAssistantUI(QMainWindow):
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         
+        # 詞典緩存命中率，常駐在狀態欄右側
+        self.dictionary_stats_label = QLabel()
+        self.status_bar.addPermanentWidget(self.dictionary_stats_label)
+        
         # 添加到主佈局
         main_layout.addWidget(toolbar_frame)
         main_layout.addWidget(splitter)
@@ -235,6 +272,10 @@ class JapaneseAssistantUI(QMainWindow):
         self.download_button = QPushButton("下載視頻+字幕")
         self.download_button.clicked.connect(self.download_video)
         
+        # 批量導入按鈕（播放列表或多個網址）
+        self.import_button = QPushButton("批量導入")
+        self.import_button.clicked.connect(self.import_videos)
+        
         # 打開本地文件按鈕
         self.open_button = QPushButton("打開本地文件")
         self.open_button.clicked.connect(self.open_local_file)
@@ -249,6 +290,7 @@ class JapaneseAssistantUI(QMainWindow):
         toolbar_layout.addWidget(self.url_input)
         toolbar_layout.addWidget(self.language_combo)
         toolbar_layout.addWidget(self.download_button)
+        toolbar_layout.addWidget(self.import_button)
         toolbar_layout.addWidget(self.open_button)
         toolbar_layout.addWidget(self.progress_bar)
         
@@ -260,20 +302,35 @@ class JapaneseAssistantUI(QMainWindow):
         self.data_manager.video_downloaded.connect(self.on_video_downloaded)
         self.data_manager.download_progress.connect(self.on_download_progress)
         self.data_manager.download_error.connect(self.on_download_error)
+        self.data_manager.download_status.connect(self.status_bar.showMessage)
         
         # 媒體播放器信號
         self.media_player.position_changed.connect(self.on_position_changed)
+        # 字幕計時器根據字幕索引在下一次字幕變化時更新
+        self.media_player.set_next_event_provider(self.subtitle_processor.next_subtitle_change)
         
         # 字幕處理器信號
         self.subtitle_processor.word_analyzed.connect(self.dictionary.display_word_info)
+        self.subtitle_processor.cue_translated.connect(self.on_cue_translated)
+        
+        # 字幕批量翻譯信號
+        batch_translator = self.ai_assistant.batch_translator
+        batch_translator.progress.connect(self.on_subtitle_translation_progress)
+        batch_translator.finished.connect(self.on_subtitle_translation_finished)
+        batch_translator.failed.connect(self.status_bar.showMessage)
         
         # 字典小工具信號
         self.dictionary.word_selected.connect(self.on_word_selected)
+        self.dictionary.jisho_worker.stats_changed.connect(self.dictionary_stats_label.setText)
         
         # AI助手信號
         self.ai_assistant.response_ready.connect(self.on_ai_response)
+        self.ai_assistant.response_chunk.connect(self.ai_chat.handle_ai_chunk)
+        self.ai_assistant.response_ended.connect(self.ai_chat.end_ai_response)
         self.ai_assistant.translation_ready.connect(self.on_translation_ready)
         self.ai_assistant.error_occurred.connect(self.on_ai_error)
+        if self.ai_assistant.backend_error:
+            self.status_bar.showMessage(self.ai_assistant.backend_error)
         
         # AI聊天小工具信號
         self.ai_chat.question_submitted.connect(self.on_question_submitted)
@@ -290,7 +347,7 @@ class JapaneseAssistantUI(QMainWindow):
         
         # 獲取選中的語言代碼
         language = self.language_combo.currentText()
-        lang_code = language.split("(")[1].strip(")")
+        lang_code = self._selected_language_code()
         
         # 顯示進度條
         self.progress_bar.setValue(0)
@@ -299,13 +356,24 @@ class JapaneseAssistantUI(QMainWindow):
         # 更新狀態欄
         self.status_bar.showMessage(f"正在下載視頻和{language}字幕...")
         
-        # 禁用下載按鈕和打開文件按鈕，防止重複操作
-        self.download_button.setEnabled(False)
-        self.open_button.setEnabled(False)
-        
-        # 開始下載
+        # 加入下載隊列，重複的網址不會重複下載
         self.data_manager.download_from_youtube(url, lang_code)
     
+    def _selected_language_code(self):
+        """獲取選中的字幕語言代碼"""
+        return self.language_combo.currentText().split("(")[1].strip(")")
+    
+    def import_videos(self):
+        """批量導入 YouTube 播放列表或多個網址"""
+        text, ok = QInputDialog.getMultiLineText(
+            self, "批量導入", "每行輸入一個 YouTube 網址或播放列表網址:"
+        )
+        if not ok or not text.strip():
+            return
+        
+        self.status_bar.showMessage("正在導入下載任務...")
+        self.data_manager.import_urls(text.splitlines(), self._selected_language_code())
+    
     def open_local_file(self):
         """打開本地視頻文件"""
         options = QFileDialog.Option.ReadOnly
@@ -331,13 +399,16 @@ class JapaneseAssistantUI(QMainWindow):
         
         # 清空當前字幕顯示
         self.subtitle_display.clear_subtitle()
+        self.report_render_stats()
         
-        # 重置字幕處理器
-        self.subtitle_processor.subtitles = {'jp': [], 'zh': []}
+        # 重置字幕處理器，停止翻譯和預取上一個視頻的字幕
+        self.subtitle_processor.reset()
+        self.ai_assistant.prefetcher.reset()
         
         # 重置當前字幕追踪變量
         self._last_subtitle = (None, None)
         self._current_jp_subtitle = ""
+        self._active_cues = (None, None)
         self.ai_chat.set_current_subtitle("")
         
         # 短暫延遲，確保媒體播放器已經停止
@@ -355,6 +426,10 @@ class JapaneseAssistantUI(QMainWindow):
                     jp_status = "有日文字幕" if subtitles['jp'] else "無日文字幕"
                     zh_status = "有繁體中文字幕" if subtitles['zh'] else "無繁體中文字幕"
                     self.status_bar.showMessage(f"已加載視頻({jp_status}, {zh_status}): {video_path}")
+                    
+                    # 只有日文字幕時在後台翻譯，譯文會逐條顯示
+                    if subtitles['jp'] and not subtitles['zh']:
+                        self.subtitle_processor.translate_subtitles()
                 else:
                     self.status_bar.showMessage(f"已加載視頻（無字幕）: {video_path}")
             else:
@@ -373,13 +448,10 @@ class JapaneseAssistantUI(QMainWindow):
         
         # 更新狀態欄
         self.status_bar.showMessage(f"視頻下載完成: {video_path}")
-        
-        # 重新啟用下載按鈕和打開文件按鈕
-        self.download_button.setEnabled(True)
-        self.open_button.setEnabled(True)
     
     def on_download_progress(self, filename, percent):
         """下載進度回調"""
+        self.progress_bar.setVisible(True)
         self.progress_bar.setValue(int(percent))
         self.status_bar.showMessage(f"正在下載: {filename} - {percent:.1f}%")
     
@@ -388,13 +460,11 @@ class JapaneseAssistantUI(QMainWindow):
         self.progress_bar.setVisible(False)
         self.status_bar.showMessage(f"下載失敗: {error_message}")
         QMessageBox.warning(self, "下載錯誤", error_message)
-        
-        # 重新啟用下載按鈕和打開文件按鈕
-        self.download_button.setEnabled(True)
-        self.open_button.setEnabled(True)
     
     def on_position_changed(self, position):
         """播放位置變化回調"""
+        self._track_playback(position)
+        
         # 獲取當前時間點的字幕
         current_time_seconds = position / 1000.0
         subtitles = self.subtitle_processor.get_current_subtitle(current_time_seconds)
@@ -402,6 +472,11 @@ class JapaneseAssistantUI(QMainWindow):
         jp_subtitle = subtitles.get('jp')
         zh_subtitle = subtitles.get('zh')
         
+        # 字幕條目沒有變化時不需要更新任何組件
+        if (jp_subtitle, zh_subtitle) == self._active_cues:
+            return
+        self._active_cues = (jp_subtitle, zh_subtitle)
+        
         # 決定要顯示什麼字幕
         jp_text = jp_subtitle['text'] if jp_subtitle else ""
         zh_text = zh_subtitle['text'] if zh_subtitle else ""
@@ -411,6 +486,10 @@ class JapaneseAssistantUI(QMainWindow):
             self._current_jp_subtitle = jp_text
             self.ai_chat.set_current_subtitle(jp_text)
         
+        # 預先翻譯當前和即將出現的字幕
+        if jp_subtitle is not None and hasattr(jp_subtitle, 'track'):
+            self.ai_assistant.prefetcher.update(jp_subtitle.track.texts, jp_subtitle.index)
+        
         # 調試輸出，查看中文字幕和日文字幕是否對應
         if (jp_text or zh_text) and self._last_subtitle != (jp_text, zh_text):
             self._last_subtitle = (jp_text, zh_text)
@@ -426,6 +505,49 @@ class JapaneseAssistantUI(QMainWindow):
             # 清除字幕顯示
             self.subtitle_display.clear_subtitle()
     
+    def on_cue_translated(self, index):
+        """批量翻譯寫入了一條中文字幕，正在顯示時在下一次位置更新時刷新"""
+        zh_cue = self._active_cues[1]
+        if zh_cue is not None and zh_cue.index == index:
+            self._active_cues = (None, None)
+    
+    def on_subtitle_translation_progress(self, done, total):
+        """字幕批量翻譯進度回調"""
+        self.status_bar.showMessage(f"正在翻譯字幕: {done}/{total}")
+    
+    def on_subtitle_translation_finished(self, failed):
+        """字幕批量翻譯完成回調"""
+        if failed:
+            self.status_bar.showMessage(f"字幕翻譯完成，{failed} 條翻譯失敗")
+        else:
+            self.status_bar.showMessage("字幕翻譯完成")
+    
+    def _track_playback(self, position):
+        """累計實際播放時長，跳轉造成的位置變化不計入
+
+        位置只在字幕變化和跳轉時更新，間隔不固定，位置的前進不超過經過的時間才算作播放。
+        """
+        now = monotonic()
+        if self._last_position is not None:
+            last_position, last_clock = self._last_position
+            if 0 < position - last_position <= (now - last_clock) * 1000 + 100:
+                self._playback_ms += position - last_position
+        self._last_position = (position, now)
+    
+    def report_render_stats(self):
+        """輸出每分鐘播放的字幕重新佈局次數並重置統計"""
+        minutes = self._playback_ms / 60000
+        if minutes > 0:
+            display = self.subtitle_display
+            print(f"字幕渲染統計: 播放 {minutes:.1f} 分鐘, "
+                  f"文本更新 {display.text_update_count} 次, "
+                  f"重新佈局 {display.relayout_count} 次 "
+                  f"(每分鐘 {display.relayout_count / minutes:.1f} 次)")
+        
+        self.subtitle_display.reset_stats()
+        self._playback_ms = 0
+        self._last_position = None
+    
     def on_word_selected(self, word):
         """當單詞被選中時的回調"""
         # 分析單詞
@@ -437,9 +559,9 @@ class JapaneseAssistantUI(QMainWindow):
         else:
             self.status_bar.showMessage(f"無法解析單詞: {word}")
     
-    def on_ai_response(self, response):
+    def on_ai_response(self, reply_id, response):
         """AI回覆回調"""
-        self.ai_chat.handle_ai_response(response)
+        self.ai_chat.handle_ai_response(reply_id, response)
     
     def on_translation_ready(self, original_text, translated_text):
         """翻譯完成回調"""
@@ -469,6 +591,12 @@ class JapaneseAssistantUI(QMainWindow):
         """窗口關閉事件回調"""
         # 停止媒體播放
         self.media_player.cleanup()
+        self.data_manager.cleanup()
+        self.report_render_stats()
+        self.ai_assistant.report_stream_stats()
+        self.ai_assistant.prefetcher.report_stats()
+        print(self.dictionary.jisho_worker.stats_text())
+        self.dictionary.cleanup()
         
         # 調用父類的關閉事件處理
         super().closeEvent(event)
\ No newline at end of file
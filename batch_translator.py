@@ -0,0 +1,239 @@
+import json
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from ai_scheduler import PRIORITY_BULK
+from chat_context import compact_prompt
+
+# 批量翻譯的提示詞版本，與單句翻譯的緩存分開（單句翻譯帶有備註）
+BATCH_PROMPT_VERSION = 'batch-1'
+
+# 每條字幕在 JSON 中的額外開銷（編號、引號和分隔符）
+CUE_OVERHEAD_TOKENS = 8
+
+
+def pack_batches(items, max_tokens, max_cues):
+    """按 token 預算把字幕分批，保持原有順序
+
+    Args:
+        items: [(鍵, 文本)] 列表
+        max_tokens: 每批文本的估計 token 上限，單條超過上限的字幕單獨成批
+        max_cues: 每批最多的字幕條數
+
+    Returns:
+        [[(鍵, 文本), ...], ...]
+    """
+    batches = []
+    batch = []
+    tokens = 0
+    for key, text in items:
+        cost = len(text) + CUE_OVERHEAD_TOKENS
+        if batch and (tokens + cost > max_tokens or len(batch) >= max_cues):
+            batches.append(batch)
+            batch = []
+            tokens = 0
+        batch.append((key, text))
+        tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def parse_batch_reply(reply, count):
+    """解析批量翻譯的回覆，返回 {序號: 翻譯}，序號從 1 開始；無法解析的條目不包含在結果中"""
+    start, end = reply.find('{'), reply.rfind('}')
+    if start < 0 or end < start:
+        return {}
+    try:
+        data = json.loads(reply[start:end + 1])
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    translations = {}
+    for number in range(1, count + 1):
+        text = data.get(str(number))
+        if isinstance(text, str) and text.strip():
+            translations[number] = text.strip()
+    return translations
+
+
+class BatchJob:
+    """一次整條字幕軌的翻譯任務"""
+
+    def __init__(self, job_id, source_lang, target_lang, on_translated):
+        self.job_id = job_id
+        self.group = f'batch-{job_id}'
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.on_translated = on_translated
+        self.indices = {}  # 文本 -> 使用該文本的字幕索引，重複的字幕只翻譯一次
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.pending = 0  # 未完成的批次數
+        self.cancelled = False
+
+
+class BatchTranslator(QObject):
+    """整條字幕軌的批量翻譯
+
+    把多條字幕打包進一個請求，以低優先級交給 AI 請求調度器並發處理，
+    限流和重試由 AIClient 負責。每條譯文寫入翻譯緩存後立即回調，
+    任務中斷後再次開始時已翻譯的字幕直接從緩存讀取，只請求剩下的部分。
+    """
+
+    # 定義信號
+    progress = pyqtSignal(int, int)  # 已翻譯條數, 總條數
+    finished = pyqtSignal(int)  # 翻譯失敗的條數
+    failed = pyqtSignal(str)  # 請求失敗，任務中止
+
+    def __init__(self, backend, scheduler, cache, model, max_batch_tokens=1500, max_batch_cues=40):
+        """初始化批量翻譯器
+
+        Args:
+            backend: AI 後端（見 ai_backends）
+            scheduler: RequestScheduler
+            cache: TranslationCache，同時作為任務進度的記錄
+            model: 翻譯使用的模型
+            max_batch_tokens: 每個請求中字幕文本的估計 token 上限
+            max_batch_cues: 每個請求最多的字幕條數
+        """
+        super().__init__()
+        self.backend = backend
+        self.scheduler = scheduler
+        self.cache = cache
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_cues = max_batch_cues
+        self._job = None
+        self._job_count = 0
+        self._lock = threading.Lock()
+
+    def start(self, texts, on_translated, source_lang="ja", target_lang="zh-TW"):
+        """開始翻譯，取消之前未完成的任務
+
+        Args:
+            texts: 字幕文本列表
+            on_translated: 每條字幕翻譯完成時調用 on_translated(索引, 譯文)，可能在工作線程中調用
+            source_lang: 源語言代碼
+            target_lang: 目標語言代碼
+        """
+        self.cancel()
+        with self._lock:
+            self._job_count += 1
+            job = BatchJob(self._job_count, source_lang, target_lang, on_translated)
+            self._job = job
+
+        for index, text in enumerate(texts):
+            text = text.strip()
+            if text:
+                job.indices.setdefault(text, []).append(index)
+                job.total += 1
+
+        # 已經翻譯過的字幕直接使用緩存
+        remaining = []
+        for text, indices in job.indices.items():
+            cached = self.cache.get(text, source_lang, target_lang, self.model, BATCH_PROMPT_VERSION)
+            if cached is None:
+                remaining.append((text, text))
+                continue
+            for index in indices:
+                on_translated(index, cached)
+            job.done += len(indices)
+
+        print(f"開始批量翻譯字幕: 共 {job.total} 條，緩存中已有 {job.done} 條")
+        self.progress.emit(job.done, job.total)
+        if not remaining:
+            self.finished.emit(0)
+            return
+
+        batches = pack_batches(remaining, self.max_batch_tokens, self.max_batch_cues)
+        with self._lock:
+            job.pending = len(batches)
+        for batch in batches:
+            self._submit(job, [text for text, _ in batch])
+
+    def cancel(self):
+        """取消當前任務，已完成的譯文保留在緩存中"""
+        with self._lock:
+            job, self._job = self._job, None
+            if job is None:
+                return
+            job.cancelled = True
+        self.scheduler.cancel_group(job.group)
+
+    def _batch_messages(self, texts, source_lang, target_lang):
+        """構建批量翻譯請求，字幕以 JSON 對象發送，回覆使用相同的編號"""
+        numbered = {str(number): text for number, text in enumerate(texts, 1)}
+        return [
+            {"role": "system", "content": compact_prompt(f"""你是專業的字幕翻譯，負責將{source_lang}字幕翻譯成{target_lang}。
+            用戶會發送一個 JSON 對象，鍵是字幕編號，值是按播放順序排列的字幕。
+            請結合上下文翻譯每條字幕，只回覆一個 JSON 對象，使用相同的編號，值是對應的譯文。
+            不要合併或拆分字幕，不要添加任何說明。""")},
+            {"role": "user", "content": json.dumps(numbered, ensure_ascii=False)}
+        ]
+
+    def _submit(self, job, texts):
+        """提交一批字幕"""
+        messages = self._batch_messages(texts, job.source_lang, job.target_lang)
+
+        def translate():
+            reply = self.backend.chat(messages, model=self.model, temperature=0.3)
+            return parse_batch_reply(reply, len(texts))
+
+        self.scheduler.submit(
+            None, translate,
+            priority=PRIORITY_BULK, group=job.group,
+            callback=lambda translations: self._on_batch_done(job, texts, translations),
+            error_callback=lambda e: self._on_batch_error(job, e))
+
+    def _on_batch_done(self, job, texts, translations):
+        """一批字幕翻譯完成，在工作線程中調用"""
+        if job.cancelled:
+            return
+
+        missing = []
+        for number, text in enumerate(texts, 1):
+            translation = translations.get(number)
+            if translation is None:
+                missing.append(text)
+                continue
+            self.cache.put(text, job.source_lang, job.target_lang, self.model, BATCH_PROMPT_VERSION, translation)
+            for index in job.indices[text]:
+                job.on_translated(index, translation)
+
+        # 回覆缺少部分字幕時拆成更小的批次重試，單條仍然失敗則放棄
+        retry = []
+        if len(texts) > 1 and missing:
+            middle = (len(missing) + 1) // 2
+            retry = [part for part in (missing[:middle], missing[middle:]) if part]
+
+        with self._lock:
+            job.done += sum(len(job.indices[text]) for text in texts) - \
+                sum(len(job.indices[text]) for text in missing)
+            if not retry:
+                job.failed += sum(len(job.indices[text]) for text in missing)
+            job.pending += len(retry) - 1
+            finished = job.pending == 0
+            if finished and self._job is job:
+                self._job = None
+
+        for part in retry:
+            self._submit(job, part)
+        self.progress.emit(job.done, job.total)
+        if finished:
+            print(f"批量翻譯完成: {job.done}/{job.total} 條，失敗 {job.failed} 條")
+            self.finished.emit(job.failed)
+
+    def _on_batch_error(self, job, error):
+        """請求在重試後仍然失敗時中止任務，其他批次也很可能失敗"""
+        with self._lock:
+            if job.cancelled:
+                return
+            job.cancelled = True
+            if self._job is job:
+                self._job = None
+        self.scheduler.cancel_group(job.group)
+        print(f"批量翻譯中止: {error}")
+        self.failed.emit(f"字幕翻譯失敗: {error}")
@@ -0,0 +1,125 @@
+"""離線字典的性能測試
+
+用 DICTIONARY_DIR 中的 JMdict（或 --source 指定的文件）編譯索引，然後用字典中的
+全部詞彙隨機抽樣，模擬逐字輸入時的前綴搜索、羅馬字輸入、拼寫錯誤時的模糊搜索
+和完整單詞的查詢，輸出每種查詢的耗時分佈。
+
+    python benchmark_dictionary.py [--source JMdict_e.xml] [--samples 2000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+import jmdict
+
+
+# 用於生成羅馬字輸入的假名表（反查 kana.ROMAJI_TABLE 中最常用的寫法）
+def _hiragana_to_romaji_table():
+    from kana import ROMAJI_TABLE
+    table = {}
+    for romaji, kana_text in ROMAJI_TABLE.items():
+        if kana_text not in table or len(romaji) < len(table[kana_text]):
+            table[kana_text] = romaji
+    return table
+
+
+def to_romaji(text, table):
+    """把平假名轉換為羅馬字，無法轉換時返回 None"""
+    result = []
+    i = 0
+    while i < len(text):
+        for length in (2, 1):
+            romaji = table.get(text[i:i + length])
+            if romaji and romaji != '-':
+                result.append(romaji)
+                i += length
+                break
+        else:
+            if text[i] == 'っ' and i + 1 < len(text):
+                following = table.get(text[i + 1])
+                if following and following[0] not in 'aeiou':
+                    result.append(following[0])
+                    i += 1
+                    continue
+            return None
+    return ''.join(result)
+
+
+def measure(function, queries):
+    """返回每次查詢的耗時（微秒）"""
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        function(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95)]
+    print(f"{name:<12} {len(timings):>7} 次  平均 {statistics.mean(timings):8.1f} µs  "
+          f"中位數 {statistics.median(timings):8.1f} µs  p95 {p95:8.1f} µs  最大 {timings[-1]:8.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線字典性能測試")
+    parser.add_argument('--source', help="JMdict XML 文件，默認使用 DICTIONARY_DIR 中的文件")
+    parser.add_argument('--samples', type=int, default=2000, help="抽樣的單詞數量")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    source = args.source or jmdict.find_source()
+    if not source:
+        print(f"找不到 JMdict 文件，請把 JMdict_e.xml 放到 {jmdict.get_dictionary_path()}")
+        return 1
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = os.path.join(directory, jmdict.INDEX_NAME)
+        started = time.monotonic()
+        jmdict.compile_index(source, index_path)
+        print(f"編譯耗時 {time.monotonic() - started:.1f} 秒，索引大小 {os.path.getsize(index_path) / 1e6:.1f} MB")
+
+        started = time.perf_counter()
+        index = jmdict.JMdictIndex(index_path)
+        print(f"打開索引耗時 {(time.perf_counter() - started) * 1e3:.2f} ms")
+        try:
+            vocabulary = list(index.search_keys())
+            words = random.sample(vocabulary, min(args.samples, len(vocabulary)))
+            print(f"詞彙量 {len(vocabulary)}，抽樣 {len(words)} 個單詞\n")
+
+            # 逐字輸入：每個單詞的每個前綴都搜索一次
+            typing = [word[:length] for word in words for length in range(1, len(word) + 1)]
+            romaji_table = _hiragana_to_romaji_table()
+            romaji = [text for text in (to_romaji(word, romaji_table) for word in words) if text]
+            typing_romaji = [text[:length] for text in romaji for length in range(1, len(text) + 1)]
+            # 拼寫錯誤：隨機替換、刪去或交換一個字
+            misspelled = []
+            for word in words:
+                if len(word) < jmdict.FUZZY_MIN_LENGTH + 1:
+                    continue
+                i = random.randrange(len(word) - 1)
+                edit = random.choice(('replace', 'delete', 'swap'))
+                if edit == 'replace':
+                    misspelled.append(word[:i] + random.choice('あいうえおかきくけこ') + word[i + 1:])
+                elif edit == 'delete':
+                    misspelled.append(word[:i] + word[i + 1:])
+                else:
+                    misspelled.append(word[:i] + word[i + 1] + word[i] + word[i + 2:])
+
+            report("完整查詢", measure(index.lookup, words))
+            report("前綴輸入", measure(index.suggest, typing))
+            report("羅馬字輸入", measure(index.suggest, typing_romaji))
+            report("模糊匹配", measure(lambda text: index.fuzzy_search(text, 20), misspelled))
+            report("拼寫錯誤輸入", measure(index.suggest, misspelled))
+        finally:
+            index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
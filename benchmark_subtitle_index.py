@@ -0,0 +1,113 @@
+"""字幕時間索引的性能測試和一致性檢查
+
+在隨機生成、互相重疊的字幕軌上比較 SubtitleIndex.lookup 與原來逐條掃描的
+get_current_subtitle，先檢查每個查詢時間點（包括所有起止時間點）的結果完全一致，
+再輸出每次查詢的耗時和建立索引的耗時。
+
+    python benchmark_subtitle_index.py [--sizes 1000 10000 100000] [--lookups 2000]
+"""
+import sys
+import time
+import random
+import argparse
+from cue_track import CueTrack
+from subtitle_index import SubtitleIndex
+
+
+def linear_scan(cues, current_time):
+    """原來的查找方式：返回第一條覆蓋 current_time 的字幕"""
+    for subtitle in cues:
+        start_time = subtitle['start_seconds']
+        end_time = subtitle.get('end_seconds', start_time + 5)  # 假設每條字幕顯示5秒
+        if start_time <= current_time <= end_time:
+            return subtitle
+    return None
+
+
+def synthetic_track(count, rng):
+    """生成字幕軌：大部分依次排列，部分互相重疊或首尾相接，時間取整到 0.1 秒"""
+    track = CueTrack()
+    time_point = 0.0
+    for i in range(count):
+        time_point += rng.choice((0.0, 0.0, 0.3, 1.0, 2.5))
+        duration = rng.choice((0.8, 1.5, 2.0, 3.0, 6.0))
+        track.append(round(time_point, 1), round(time_point + duration, 1), f"字幕{i}")
+        time_point += rng.choice((duration, duration / 2, 0.0))
+    return track
+
+
+def scan_arrays(track, current_time):
+    """與 linear_scan 相同的查找，直接讀取時間列，返回字幕索引，用於較快地檢查一致性"""
+    for i, (start_time, end_time) in enumerate(zip(track.starts, track.ends)):
+        if start_time <= current_time <= end_time:
+            return i
+    return None
+
+
+def check_parity(track, index, times):
+    """逐個時間點比較索引和逐條掃描的結果，返回不一致的數量"""
+    mismatches = 0
+    for t in times:
+        expected_index = scan_arrays(track, t)
+        actual = index.lookup(t)
+        actual_index = actual.index if actual is not None else None
+        if expected_index != actual_index:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  不一致: t={t} 逐條掃描={expected_index} 索引={actual_index}")
+    return mismatches
+
+
+def per_lookup_us(function, times):
+    started = time.perf_counter()
+    for t in times:
+        function(t)
+    return (time.perf_counter() - started) / len(times) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="字幕時間索引性能測試")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="字幕條數")
+    parser.add_argument('--lookups', type=int, default=2000, help="每種查詢的次數")
+    parser.add_argument('--parity-lookups', type=int, default=3000, help="一致性檢查的時間點數量")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    for size in args.sizes:
+        track = synthetic_track(size, rng)
+        started = time.perf_counter()
+        index = SubtitleIndex(track)
+        build_ms = (time.perf_counter() - started) * 1e3
+        duration = track.ends[-1] if len(track) else 0.0
+
+        # 一致性：所有起止時間點、時間點前後和隨機時間點，按順序和亂序各查一次
+        boundaries = list(index.bounds)
+        parity_times = boundaries + [t - 0.05 for t in boundaries] + [t + 0.05 for t in boundaries]
+        # 逐條掃描很慢，大字幕軌只抽樣檢查
+        parity_times = rng.sample(parity_times, min(len(parity_times), args.parity_lookups))
+        parity_times += [rng.uniform(-1, duration + 1) for _ in range(args.parity_lookups // 3)]
+        shuffled = list(parity_times)
+        rng.shuffle(shuffled)
+        mismatches = check_parity(track, index, sorted(parity_times)) + check_parity(track, index, shuffled)
+        failed = failed or mismatches > 0
+
+        # 性能：均勻分佈的時間點（模擬播放）和隨機時間點（模擬跳轉）
+        sequential = [duration * i / args.lookups for i in range(args.lookups)]
+        random_times = [rng.uniform(0, duration) for _ in range(args.lookups)]
+        # 原來的字幕是字典列表；逐條掃描只測一部分時間點
+        cues = track.to_list()
+        scan_times = sequential[::max(1, size // 1000)]
+        scan = per_lookup_us(lambda t: linear_scan(cues, t), scan_times)
+        indexed = per_lookup_us(index.lookup, sequential)
+        indexed_random = per_lookup_us(index.lookup, random_times)
+
+        print(f"{size:>7} 條字幕  逐條掃描 {scan:9.2f} µs  索引 {indexed:6.2f} µs  "
+              f"索引（隨機） {indexed_random:6.2f} µs  建立索引 {build_ms:7.1f} ms  "
+              f"一致性 {'通過' if not mismatches else f'{mismatches} 處不一致'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""流式字幕解析與 webvtt-py 的一致性檢查和性能測試
+
+生成卡拉OK標籤的 VTT、CRLF 換行的 VTT 和 SRT 字幕文件（包括帶空白的文本行、
+NOTE/STYLE 區塊和位置設置），用 webvtt-py 和 subtitle_parser 分別讀取，
+以不同的塊大小逐條比較開始時間、結束時間和文本，再輸出完整讀取的耗時和峰值內存。
+
+    python benchmark_subtitle_parser.py [--cues 60000] [--chunk-sizes 7 1000 65536]
+
+需要安裝 webvtt-py。
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import webvtt
+from cue_track import parse_timestamp
+from subtitle_parser import iter_cues, read_subtitle_file
+
+LINES = ["今日はいい天気ですね", "  行頭に空白がある行", "行末に空白がある行  ", "\tタブ\t", "二行目です"]
+
+
+def format_timestamp(seconds, separator='.'):
+    hours, rest = divmod(int(round(seconds * 1000)), 3600 * 1000)
+    minutes, rest = divmod(rest, 60 * 1000)
+    return f"{hours:02d}:{minutes:02d}:{rest // 1000:02d}{separator}{rest % 1000:03d}"
+
+
+def cue_times(count, rng):
+    time_point = 0.0
+    for _ in range(count):
+        time_point += rng.choice((0.5, 1.0, 2.5))
+        yield time_point, time_point + rng.choice((1.0, 2.0, 3.5))
+
+
+def write_vtt(path, count, rng, karaoke=False, newline='\n'):
+    """生成 VTT 文件，帶文件頭元數據、NOTE/STYLE 區塊和位置設置"""
+    with open(path, 'w', encoding='utf-8', newline=newline) as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: ja\n\n")
+        f.write("STYLE\n::cue { color: white; }\n\n")
+        for i, (start, end) in enumerate(cue_times(count, rng)):
+            if i % 500 == 0:
+                f.write(f"NOTE 第 {i} 條\n\n")
+            settings = " align:start position:0%" if i % 3 == 0 else ""
+            f.write(f"{format_timestamp(start)} --> {format_timestamp(end)}{settings}\n")
+            lines = rng.sample(LINES, rng.choice((1, 2)))
+            if karaoke:
+                # YouTube 自動字幕的逐字時間標籤
+                lines = [f"{line[:2]}<{format_timestamp(start + 0.3)}><c> {line[2:]}</c>" for line in lines]
+            f.write('\n'.join(lines) + "\n\n")
+
+
+def write_srt(path, count, rng):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, (start, end) in enumerate(cue_times(count, rng)):
+            f.write(f"{i + 1}\n{format_timestamp(start, ',')} --> {format_timestamp(end, ',')}\n")
+            f.write('\n'.join(rng.sample(LINES, rng.choice((1, 2)))) + "\n\n")
+
+
+def read_with_webvtt(path):
+    """原來的讀取方式"""
+    captions = webvtt.from_srt(path) if path.endswith('.srt') else webvtt.read(path)
+    return [(parse_timestamp(caption.start), parse_timestamp(caption.end), caption.text) for caption in captions]
+
+
+def check_parity(path, chunk_sizes):
+    """逐條比較兩種讀取方式的結果，返回不一致的數量"""
+    expected = read_with_webvtt(path)
+    mismatches = 0
+    for chunk_size in chunk_sizes:
+        actual = list(iter_cues(path, chunk_size=chunk_size))
+        if len(actual) != len(expected):
+            print(f"  塊大小 {chunk_size}: 條數不一致 webvtt={len(expected)} 流式={len(actual)}")
+            mismatches += 1
+            continue
+        for i, (want, got) in enumerate(zip(expected, actual)):
+            if want != got:
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"  塊大小 {chunk_size} 第 {i} 條不一致: webvtt={want!r} 流式={got!r}")
+    return mismatches
+
+
+def measure(function, path):
+    """返回 (耗時毫秒, 峰值內存 MiB)，tracemalloc 會拖慢讀取，耗時和內存分開測量"""
+    started = time.perf_counter()
+    function(path)
+    elapsed = (time.perf_counter() - started) * 1e3
+    tracemalloc.start()
+    function(path)
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式字幕解析與 webvtt-py 的比較")
+    parser.add_argument('--cues', type=int, default=60000, help="每個文件的字幕條數")
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[7, 1000, 65536], help="檢查一致性的塊大小")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        files = {
+            "卡拉OK VTT": os.path.join(directory, "karaoke.vtt"),
+            "CRLF VTT": os.path.join(directory, "crlf.vtt"),
+            "SRT": os.path.join(directory, "plain.srt"),
+        }
+        write_vtt(files["卡拉OK VTT"], args.cues, rng, karaoke=True)
+        write_vtt(files["CRLF VTT"], args.cues, rng, newline='\r\n')
+        write_srt(files["SRT"], args.cues, rng)
+
+        for name, path in files.items():
+            mismatches = check_parity(path, args.chunk_sizes)
+            failed = failed or mismatches > 0
+            size_mb = os.path.getsize(path) / 1e6
+            webvtt_ms, webvtt_mib = measure(read_with_webvtt, path)
+            stream_ms, stream_mib = measure(read_subtitle_file, path)
+            print(f"{name:<10} {size_mb:4.1f} MB  webvtt {webvtt_ms:7.0f} ms {webvtt_mib:5.1f} MiB  "
+                  f"流式 {stream_ms:6.0f} ms {stream_mib:4.1f} MiB  "
+                  f"一致性 {'通過' if not mismatches else f'{mismatches} 處不一致'}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import re
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 每條消息除內容外的固定開銷（角色和分隔符）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 英文、數字等按詞計算，其他字符（日文、中文、標點）大約每個字一個 token
+ASCII_RUN_PATTERN = re.compile(r'[\x21-\x7e]+')
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    """加載 tiktoken 的編碼，不可用時返回 None"""
+    global _encoding, _encoding_failed
+    if _encoding is None and tiktoken is not None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # 編碼文件需要在第一次使用時下載
+            print(f"無法加載 tiktoken 編碼，改用估算: {e}")
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text):
+    """計算文本的 token 數，沒有安裝 tiktoken 時估算"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+
+    ascii_tokens = 0
+    ascii_chars = 0
+    for run in ASCII_RUN_PATTERN.findall(text):
+        ascii_tokens += (len(run) + 3) // 4
+        ascii_chars += len(run)
+    other = len(text) - ascii_chars - text.count(' ') - text.count('\n')
+    return ascii_tokens + max(other, 0)
+
+
+def message_tokens(message):
+    """計算一條消息的 token 數"""
+    return count_tokens(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS
+
+
+def compact_prompt(text):
+    """去掉提示詞中的縮進和多餘空行，三引號字符串的縮進也會按 token 計費"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    compacted = []
+    for line in lines:
+        if line or (compacted and compacted[-1]):
+            compacted.append(line)
+    return '\n'.join(compacted)
+
+
+class ConversationContext:
+    """按 token 預算管理聊天上下文
+
+    構建請求時從最新的對話往前加入，直到達到預算；放不下的舊對話交給調用方壓縮成摘要，
+    摘要作為一條系統消息放在最近對話之前。
+    """
+
+    def __init__(self, budget=2000, summary_budget=400, max_turns=100):
+        """初始化上下文
+
+        Args:
+            budget: 每次請求的提示詞 token 上限（包括系統消息）
+            summary_budget: 摘要的 token 上限
+            max_turns: 保留的最多對話條數，摘要失敗時丟棄最舊的對話
+        """
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.max_turns = max_turns
+        self.turns = []  # {"role": ..., "content": ...}
+        self.summary = ""
+
+    def add(self, role, content):
+        """添加一條對話"""
+        self.turns.append({"role": role, "content": content})
+        if len(self.turns) > self.max_turns:
+            del self.turns[:len(self.turns) - self.max_turns]
+
+    def build(self, system_messages):
+        """構建請求消息
+
+        Args:
+            system_messages: 放在最前面的系統消息
+
+        Returns:
+            (消息列表, 估計 token 數, 沒有放入請求的舊對話條數)
+        """
+        messages = list(system_messages)
+        if self.summary:
+            messages.append({"role": "system", "content": f"之前對話的摘要：{self.summary}"})
+        used = sum(message_tokens(message) for message in messages)
+
+        recent = []
+        for turn in reversed(self.turns):
+            cost = message_tokens(turn)
+            # 最新的一條（用戶的問題）總是放入
+            if recent and used + cost > self.budget:
+                break
+            recent.append(turn)
+            used += cost
+        recent.reverse()
+
+        return messages + recent, used, len(self.turns) - len(recent)
+
+    def summary_messages(self, turns):
+        """構建把指定的對話和現有摘要壓縮成新摘要的請求"""
+        transcript = '\n'.join(f"{'用戶' if turn['role'] == 'user' else '助手'}: {turn['content']}"
+                               for turn in turns)
+        if self.summary:
+            transcript = f"之前的摘要: {self.summary}\n\n{transcript}"
+        return [
+            {"role": "system", "content": "請把以下日語學習對話壓縮成簡短的繁體中文摘要，保留用戶的學習重點、"
+                                          "討論過的日文詞句和尚未解決的問題，不超過 200 字，只輸出摘要。"},
+            {"role": "user", "content": transcript}
+        ]
+
+    def fold(self, turns, summary):
+        """用摘要替換已壓縮的對話
+
+        按對話本身而不是條數刪除：生成摘要期間 add 可能已因 max_turns 刪除了其中最舊的幾條，
+        按條數刪除會誤刪還沒有壓縮的對話。
+        """
+        folded = {id(turn) for turn in turns}
+        self.turns = [turn for turn in self.turns if id(turn) not in folded]
+        summary = summary.strip()
+        # 模型不一定遵守字數要求，超出上限時截斷
+        while count_tokens(summary) > self.summary_budget:
+            summary = summary[:len(summary) * 9 // 10]
+        self.summary = summary
@@ -0,0 +1,5 @@
+"""pytest 配置：模塊都在倉庫根目錄，直接運行 pytest 時也能導入"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
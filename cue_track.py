@@ -0,0 +1,155 @@
+import sys
+from array import array
+
+
+def parse_timestamp(timestamp):
+    """把 'HH:MM:SS.mmm'、'MM:SS.mmm' 或 SRT 的 'HH:MM:SS,mmm' 轉換為秒數"""
+    seconds = 0.0
+    for part in timestamp.strip().replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds):
+    """把秒數格式化為 WebVTT 時間戳 'HH:MM:SS.mmm'"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+class Cue:
+    """字幕條目視圖，兼容原來的字典用法 (cue['text']、cue.get('end_seconds') 等)
+
+    不保存任何數據，只記錄所屬字幕軌和索引，讀取時從列式存儲中取值。
+    """
+
+    __slots__ = ('track', 'index')
+
+    KEYS = ('start', 'end', 'start_seconds', 'end_seconds', 'text')
+
+    def __init__(self, track, index):
+        self.track = track
+        self.index = index
+
+    @property
+    def start_seconds(self):
+        return self.track.starts[self.index]
+
+    @property
+    def end_seconds(self):
+        return self.track.ends[self.index]
+
+    @property
+    def text(self):
+        return self.track.texts[self.index]
+
+    def __getitem__(self, key):
+        if key == 'text':
+            return self.text
+        if key == 'start_seconds':
+            return self.start_seconds
+        if key == 'end_seconds':
+            return self.end_seconds
+        if key == 'start':
+            return format_timestamp(self.start_seconds)
+        if key == 'end':
+            return format_timestamp(self.end_seconds)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self):
+        """轉換為普通字典"""
+        return {key: self[key] for key in self.KEYS}
+
+    def __eq__(self, other):
+        if isinstance(other, Cue):
+            return self.track is other.track and self.index == other.index
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.track), self.index))
+
+    def __repr__(self):
+        return f"Cue({self['start']} --> {self['end']}, {self.text!r})"
+
+
+class CueTrack:
+    """列式存儲的字幕軌
+
+    開始和結束時間分別保存在 array('d') 中，文本保存在一個列表裡並做字符串駐留，
+    重複的歌詞只佔一份內存。對外表現為一個字幕列表，索引時返回 Cue 視圖。
+    """
+
+    def __init__(self, starts=None, ends=None, texts=None):
+        """初始化字幕軌
+
+        Args:
+            starts: 開始時間（秒）的 array('d')，可與其他字幕軌共享
+            ends: 結束時間（秒）的 array('d')，可與其他字幕軌共享
+            texts: 字幕文本列表
+        """
+        self.starts = starts if starts is not None else array('d')
+        self.ends = ends if ends is not None else array('d')
+        self.texts = texts if texts is not None else []
+
+    @classmethod
+    def from_cues(cls, cues):
+        """從字典形式的字幕列表創建字幕軌"""
+        if isinstance(cues, CueTrack):
+            return cues
+        track = cls()
+        for cue in cues:
+            track.append(cue['start_seconds'], cue['end_seconds'], cue['text'])
+        return track
+
+    def append(self, start, end, text):
+        """添加一條字幕"""
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(sys.intern(text))
+
+    def set_text(self, index, text):
+        """替換一條字幕的文本，例如逐條寫入的翻譯"""
+        self.texts[index] = sys.intern(text)
+
+    def with_texts(self, texts):
+        """創建共享本字幕軌時間軸、只替換文本的新字幕軌"""
+        return CueTrack(self.starts, self.ends, [sys.intern(text) for text in texts])
+
+    def to_list(self):
+        """轉換為字典列表，用於需要 list 類型的信號"""
+        return [cue.to_dict() for cue in self]
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Cue(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("字幕索引超出範圍")
+        return Cue(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Cue(self, i)
+
+    def __repr__(self):
+        return f"CueTrack({len(self)} 條字幕)"
@@ -1,9 +1,20 @@
 import os
-import json
+import time
 import threading
 from PyQt6.QtCore import QObject, pyqtSignal
 from paths import get_download_path, get_dictionary_path
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+from download_manager import DownloadManager, COMPLETED, video_key, file_is_complete
+from video_info import VideoInfoCache
+from media_library import MediaLibrary
+from library_watcher import LibraryWatcher
+
+# 繁體中文字幕可能使用的語言代碼，按優先順序排列
+ZH_SUBTITLE_LANGS = ['zh-Hant', 'zh-TW', 'zh']
+
+# 上游沒有的字幕語言在這段時間（秒）內不再重新查詢
+SUBTITLE_RETRY_AGE = 7 * 24 * 60 * 60
 
 class DataManager(QObject):
     """數據管理器，處理視頻、字幕和詞典數據"""
@@ -12,187 +23,282 @@ class DataManager(QObject):
     video_downloaded = pyqtSignal(str, object)  # 視頻路徑, 字幕路徑（可以是字符串或字典）
     download_progress = pyqtSignal(str, float)  # 文件名, 進度百分比
     download_error = pyqtSignal(str)  # 錯誤信息
+    download_status = pyqtSignal(str)  # 批量下載任務的狀態信息
     
-    def __init__(self):
-        """初始化數據管理器"""
+    def __init__(self, max_concurrent_downloads=2, info_extractor=None):
+        """初始化數據管理器
+        
+        Args:
+            max_concurrent_downloads: 同時下載的視頻數量
+            info_extractor: 獲取視頻信息的對象，默認通過網絡獲取，測試時可使用 LocalInfoExtractor
+        """
         super().__init__()
         self.current_video_path = ""
         self.current_subtitle_path = ""
-        self.recent_videos = self._load_recent_videos()
+        self.library = MediaLibrary()
+        self.library.import_recent_file(get_download_path("recent.json"))
+        self.video_info = VideoInfoCache(info_extractor)
+        
+        # 下載隊列，限制同時下載的數量
+        self.download_manager = DownloadManager(self._download_video, max_workers=max_concurrent_downloads)
+        self.download_manager.job_progress.connect(self._on_job_progress)
+        self.download_manager.job_finished.connect(self._on_job_finished)
+        self.download_manager.job_failed.connect(self._on_job_failed)
+        self.download_manager.start()
+        
+        # 在後台監視下載目錄，打開視頻時直接從內存查詢字幕
+        self.library_watcher = LibraryWatcher(self.library)
+        self.library_watcher.start()
     
-    def _load_recent_videos(self):
-        """加載最近播放的視頻列表"""
-        recent_file = get_download_path("recent.json")
-        if os.path.exists(recent_file):
-            try:
-                with open(recent_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
-    
-    def _save_recent_videos(self):
-        """保存最近播放的視頻列表"""
-        recent_file = get_download_path("recent.json")
-        try:
-            with open(recent_file, 'w', encoding='utf-8') as f:
-                json.dump(self.recent_videos, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存最近視頻列表失敗: {e}")
+    def cleanup(self):
+        """停止監視下載目錄"""
+        self.library_watcher.stop()
     
     def download_from_youtube(self, url, language="ja"):
-        """從YouTube下載視頻和字幕"""
+        """從YouTube下載視頻和字幕，加入下載隊列，完成後自動播放"""
         if not url:
             self.download_error.emit("請輸入有效的YouTube網址")
+            return None
+        
+        return self.download_manager.add_job(url, language, autoload=True)
+    
+    def import_urls(self, urls, language="ja"):
+        """批量導入網址，播放列表會展開為其中的每個視頻
+        
+        Args:
+            urls: 網址列表
+            language: 字幕語言代碼
+        """
+        urls = [url.strip() for url in urls if url.strip()]
+        if not urls:
             return
+        
+        def import_thread():
+            """展開播放列表的線程"""
+            job_ids = []
+            for url in urls:
+                try:
+                    job_ids.extend(self.download_manager.add_urls(self._expand_playlist(url), language))
+                except Exception as e:
+                    self.download_error.emit(f"導入失敗: {url}: {str(e)}")
+            self.download_status.emit(f"已加入 {len(job_ids)} 個下載任務")
+        
+        # 展開播放列表需要網絡請求，使用線程避免UI凍結
+        threading.Thread(target=import_thread, daemon=True).start()
+    
+    def _expand_playlist(self, url):
+        """如果網址是播放列表，返回其中所有視頻的網址，否則返回原網址"""
+        if 'list=' not in url and '/playlist' not in url:
+            return [url]
+        
+        with YoutubeDL({'extract_flat': 'in_playlist', 'quiet': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+        
+        entries = info.get('entries') or []
+        if not entries:
+            return [url]
+        return [entry.get('url') or f"https://www.youtube.com/watch?v={entry['id']}" for entry in entries]
+    
+    def _download_video(self, job, progress_hook):
+        """下載單個視頻和字幕，在下載隊列的工作線程中運行
+        
+        視頻已經下載過時只下載缺少的字幕。
+        """
+        url = job['url']
+        language = job['language']
+        
+        local_video = self._find_local_video(url)
+        if local_video:
+            video_path = local_video
+            base_path = os.path.splitext(video_path)[0]
+            tried = self._tried_subtitle_langs(url)
+            missing = [lang for lang in self._missing_subtitle_langs(base_path, language) if lang not in tried]
+            if missing:
+                print(f"視頻已存在，只下載字幕: {missing}")
+                self._fetch_subtitles(url, base_path, missing, progress_hook)
+                self._record_subtitle_attempts(job, missing)
+            title = os.path.basename(base_path)
+        else:
+            save_path = get_download_path()
+            
+            # 修改這裡，只下載官方字幕，不下載自動生成的字幕
+            ydl_opts = {
+                'outtmpl': os.path.join(save_path, '%(title)s.%(ext)s'),
+                'writesubtitles': True,
+                'writeautomaticsub': False,  # 設為False，禁用自動生成字幕
+                'subtitleslangs': [language] + ZH_SUBTITLE_LANGS,
+                'format': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
+                'merge_output_format': 'mp4',
+                'noplaylist': True,  # 播放列表由 import_urls 展開為單個任務
+                'progress_hooks': [progress_hook],
+                'skip_download': False,  # 確保下載視頻
+                'continuedl': True,  # 從上次中斷的 .part 文件繼續下載
+                'nopart': False,
+                'overwrites': False,
+                'verbose': True  # 開啟詳細日誌
+            }
             
-        save_path = get_download_path()
+            with YoutubeDL(ydl_opts) as ydl:
+                info = self._process_with_cached_info(ydl, url)
+            
+            # 打印可用字幕信息
+            if info.get('requested_subtitles'):
+                print(f"可用字幕: {list(info['requested_subtitles'].keys())}")
+            
+            self._record_subtitle_attempts(job, ydl_opts['subtitleslangs'])
+            title = info['title']
+            base_path = os.path.join(save_path, title)
+            video_path = f"{base_path}.mp4"
+        
+        subtitle_paths = self._find_subtitles(base_path, language)
+        if subtitle_paths['zh']:
+            print(f"找到繁體中文字幕: {subtitle_paths['zh']}")
+        
+        # 添加到媒體庫
+        self.library.add_video(video_path, subtitle_paths, title, url)
+        
+        return video_path, subtitle_paths
+    
+    def _find_local_video(self, url):
+        """在下載記錄中查找同一個視頻已下載的文件，找不到返回 None"""
+        key = video_key(url)
+        for job in self.download_manager.get_jobs():
+            if job['state'] != COMPLETED or video_key(job['url']) != key:
+                continue
+            video_path = job.get('video_path')
+            records = [r for r in job.get('media', []) if r['path'] == video_path]
+            if video_path and all(file_is_complete(r) for r in records) and os.path.exists(video_path):
+                return video_path
         
-        # 修改這裡，只下載官方字幕，不下載自動生成的字幕
+        for record in self.library.find_by_url(url):
+            if os.path.exists(record['video_path']):
+                return record['video_path']
+        return None
+    
+    def _find_subtitles(self, base_path, language):
+        """查找視頻旁邊已下載的日文和繁體中文字幕"""
+        jp_subtitle_path = f"{base_path}.{language}.vtt"
+        subtitle_paths = {
+            'jp': jp_subtitle_path if os.path.exists(jp_subtitle_path) else None,
+            'zh': None
+        }
+        
+        # 繁體中文字幕可能有多種語言代碼
+        for lang in ZH_SUBTITLE_LANGS:
+            path = f"{base_path}.{lang}.vtt"
+            if os.path.exists(path):
+                subtitle_paths['zh'] = path
+                break
+        return subtitle_paths
+    
+    def _missing_subtitle_langs(self, base_path, language):
+        """列出視頻還沒有下載的字幕語言代碼"""
+        subtitle_paths = self._find_subtitles(base_path, language)
+        missing = []
+        if not subtitle_paths['jp']:
+            missing.append(language)
+        if not subtitle_paths['zh']:
+            missing.extend(ZH_SUBTITLE_LANGS)
+        return missing
+    
+    def _tried_subtitle_langs(self, url):
+        """列出同一個視頻最近已經向上游查詢過的字幕語言，查詢後仍然沒有的語言不再重複查詢"""
+        key = video_key(url)
+        now = time.time()
+        tried = set()
+        for job in self.download_manager.get_jobs():
+            if video_key(job['url']) != key:
+                continue
+            attempts = job.get('subtitle_attempts') or {}
+            tried.update(lang for lang, attempted_at in attempts.items() if now - attempted_at < SUBTITLE_RETRY_AGE)
+        return tried
+    
+    def _record_subtitle_attempts(self, job, langs):
+        """在下載任務中記錄查詢過的字幕語言和查詢時間"""
+        attempts = dict(job.get('subtitle_attempts') or {})
+        now = time.time()
+        attempts.update((lang, now) for lang in langs)
+        self.download_manager.update_job(job['id'], subtitle_attempts=attempts)
+    
+    def _fetch_subtitles(self, url, base_path, langs, progress_hook):
+        """只下載指定語言的字幕，保存在視頻文件旁邊"""
         ydl_opts = {
-            'outtmpl': os.path.join(save_path, '%(title)s.%(ext)s'),
+            'outtmpl': base_path + '.%(ext)s',
             'writesubtitles': True,
-            'writeautomaticsub': False,  # 設為False，禁用自動生成字幕
-            'subtitleslangs': [language, 'zh-Hant', 'zh-TW', 'zh'],  # 添加更多可能的繁體中文字幕代碼
-            'format': 'bestvideo[height<=720]+bestaudio/best[height<=720]',
-            'merge_output_format': 'mp4',
-            'progress_hooks': [self._download_progress_hook],
-            'skip_download': False,  # 確保下載視頻
-            'verbose': True  # 開啟詳細日誌
+            'writeautomaticsub': False,
+            'subtitleslangs': langs,
+            'skip_download': True,  # 視頻已存在
+            'noplaylist': True,
+            'progress_hooks': [progress_hook],
+            'quiet': True
         }
+        with YoutubeDL(ydl_opts) as ydl:
+            return self._process_with_cached_info(ydl, url)
+    
+    def _process_with_cached_info(self, ydl, url):
+        """使用緩存的視頻信息下載，緩存過期或下載地址失效時重新獲取
         
-        def download_thread():
-            """下載線程"""
-            try:
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                    video_path = os.path.join(save_path, f"{info['title']}.mp4")
-                    
-                    # 打印可用字幕信息
-                    if 'requested_subtitles' in info:
-                        print(f"可用字幕: {list(info['requested_subtitles'].keys())}")
-                    
-                    # 獲取日文字幕路徑
-                    jp_subtitle_path = None
-                    if os.path.exists(os.path.join(save_path, f"{info['title']}.{language}.vtt")):
-                        jp_subtitle_path = os.path.join(save_path, f"{info['title']}.{language}.vtt")
-                    
-                    # 獲取繁體中文字幕路徑 (嘗試多種可能的後綴)
-                    zh_subtitle_path = None
-                    possible_zh_suffixes = ['zh-Hant.vtt', 'zh-TW.vtt', 'zh.vtt']
-                    for suffix in possible_zh_suffixes:
-                        path = os.path.join(save_path, f"{info['title']}.{suffix}")
-                        if os.path.exists(path):
-                            zh_subtitle_path = path
-                            print(f"找到繁體中文字幕: {path}")
-                            break
-                    
-                    # 將字幕路徑作為字典傳遞
-                    subtitle_paths = {
-                        'jp': jp_subtitle_path,
-                        'zh': zh_subtitle_path
-                    }
-                    
-                    # 添加到最近視頻列表
-                    self._add_to_recent(video_path, subtitle_paths, info['title'], url)
-                    
-                    # 發射下載完成信號
-                    self.video_downloaded.emit(video_path, subtitle_paths)
-            except Exception as e:
-                self.download_error.emit(f"下載失敗: {str(e)}")
-        
-        # 啟動下載線程
-        threading.Thread(target=download_thread, daemon=True).start()
-    
-    def _download_progress_hook(self, progress):
-        """下載進度回調"""
-        if progress['status'] == 'downloading':
-            filename = os.path.basename(progress['filename'])
-            percent = progress.get('_percent_str', '0%').strip()
+        續傳時使用同一份視頻信息可以選到相同的格式，繼續下載已有的 .part 文件。
+        """
+        info = self.video_info.cached(url)
+        if info is not None:
+            print(f"使用已保存的視頻信息: {info.get('title', url)}")
             try:
-                percent_float = float(percent.replace('%', ''))
-                self.download_progress.emit(filename, percent_float)
-            except:
-                pass
-    
-    def _add_to_recent(self, video_path, subtitle_path, title, url):
-        """添加到最近視頻列表"""
-        # 創建記錄
-        record = {
-            'title': title,
-            'video_path': video_path,
-            'subtitle_path': subtitle_path,  # 這可以是字典或字符串
-            'url': url,
-            'timestamp': import_time()
-        }
+                return ydl.process_ie_result(info, download=True)
+            except DownloadError as e:
+                print(f"已保存的視頻信息已失效，重新獲取: {e}")
         
-        # 檢查是否已存在，如果存在則移除舊記錄
-        self.recent_videos = [v for v in self.recent_videos if v.get('video_path') != video_path]
-        
-        # 添加到列表頂部
-        self.recent_videos.insert(0, record)
-        
-        # 限制列表大小為10
-        if len(self.recent_videos) > 10:
-            self.recent_videos = self.recent_videos[:10]
-            
-        # 保存列表
-        self._save_recent_videos()
+        info = self.video_info.get(url, refresh=True)
+        return ydl.process_ie_result(info, download=True)
     
-    def get_recent_videos(self):
+    def _on_job_progress(self, job_id, filename, percent):
+        """下載任務進度回調"""
+        self.download_progress.emit(filename, percent)
+    
+    def _on_job_finished(self, job_id, video_path, subtitle_paths):
+        """下載任務完成回調，只有單獨下載的視頻會自動播放"""
+        job = self.download_manager.jobs.get(job_id, {})
+        if job.get('autoload'):
+            self.video_downloaded.emit(video_path, subtitle_paths)
+        else:
+            self.download_status.emit(f"下載完成: {os.path.basename(video_path)}")
+    
+    def _on_job_failed(self, job_id, error):
+        """下載任務失敗回調"""
+        job = self.download_manager.jobs.get(job_id, {})
+        if job.get('autoload'):
+            self.download_error.emit(f"下載失敗: {error}")
+        else:
+            self.download_status.emit(f"下載失敗: {job.get('url', '')}: {error}")
+    
+    def get_recent_videos(self, limit=10):
         """獲取最近播放的視頻列表"""
-        return self.recent_videos
+        return self.library.recent(limit)
+    
+    def search_library(self, text='', language=None, limit=100):
+        """按標題或網址搜索媒體庫，可以只列出有指定語言字幕的視頻"""
+        return self.library.search(text, language, limit)
         
     def set_current_video(self, video_path, subtitle_path=None):
         """設置當前視頻和字幕"""
         self.current_video_path = video_path
         
-        # 如果未提供字幕路徑，嘗試猜測
+        # 如果未提供字幕路徑，從媒體庫查找
         if subtitle_path is None and video_path:
-            base_path = os.path.splitext(video_path)[0]
-            
-            # 初始化字幕路徑字典
-            subtitle_paths = {'jp': None, 'zh': None}
-            
-            # 尋找日文字幕
-            possible_jp_subtitles = [
-                f"{base_path}.ja.vtt",
-                f"{base_path}.jp.vtt",
-                f"{base_path}.jpn.vtt"
-            ]
-            for path in possible_jp_subtitles:
-                if os.path.exists(path):
-                    subtitle_paths['jp'] = path
-                    break
-            
-            # 尋找繁體中文字幕
-            possible_zh_subtitles = [
-                f"{base_path}.zh-Hant.vtt",
-                f"{base_path}.zh-TW.vtt",
-                f"{base_path}.zh.vtt"
-            ]
-            for path in possible_zh_subtitles:
-                if os.path.exists(path):
-                    subtitle_paths['zh'] = path
-                    break
-            
-            # 如果至少找到一種字幕，設置字幕路徑
-            if subtitle_paths['jp'] or subtitle_paths['zh']:
-                self.current_subtitle_path = subtitle_paths
-            else:
-                # 檢查是否有通用字幕文件
-                if os.path.exists(f"{base_path}.vtt"):
-                    self.current_subtitle_path = f"{base_path}.vtt"
-                else:
-                    self.current_subtitle_path = None
+            # 下載目錄中的視頻由監視線程維護，不需要訪問磁盤
+            found, subtitle_path = self.library_watcher.subtitles_for(video_path)
+            if not found:
+                # 下載目錄以外的視頻，目錄修改時間沒有變化時不會重新列出目錄
+                self.library.scan(os.path.dirname(os.path.abspath(video_path)), recursive=False)
+                record = self.library.get(video_path)
+                if record is None:
+                    self.library.add_video(video_path)
+                    record = self.library.get(video_path)
+                subtitle_path = record['subtitle_path']
+            self.library.mark_played(video_path)
+            self.current_subtitle_path = subtitle_path
         else:
             self.current_subtitle_path = subtitle_path
         
         # 返回設置的路徑
         return self.current_video_path, self.current_subtitle_path
-
-# 獲取當前時間戳
-def import_time():
-    """導入時間模塊並獲取當前時間戳"""
-    from datetime import datetime
-    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
\ No newline at end of file
@@ -0,0 +1,148 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from paths import get_dictionary_path
+from translation_cache import normalize_text
+
+# 查到結果的緩存保留時間，jisho.org 的詞條很少變化
+FOUND_TTL = 30 * 24 * 3600
+# 沒有結果的緩存保留時間，較短，以便詞典更新後能查到新詞
+NOT_FOUND_TTL = 24 * 3600
+
+# 超出上限時一次刪除到上限的這個比例，避免之後每次寫入都要清理
+EVICT_TO = 0.9
+
+# 命中的緩存層
+MEMORY = 'memory'
+DISK = 'disk'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lookups (
+    word TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    found INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_lookups_expires_at ON lookups(expires_at);
+"""
+
+
+class DictionaryCache:
+    """詞典查詢結果的兩級緩存
+
+    最近查詢的單詞保存在內存中，所有結果保存在字典目錄的 SQLite 中，重新啟動後仍然有效。
+    「沒有結果」也會緩存，但保留時間較短。過期的條目在讀取時刪除；
+    條目數超過上限時一次刪除一批最早過期的條目。
+    內存中保存的是 JSON 文本，每次讀取都返回新的列表，調用方修改結果不會影響緩存。
+    """
+
+    def __init__(self, db_path=None, max_entries=20000, memory_entries=512,
+                 found_ttl=FOUND_TTL, not_found_ttl=NOT_FOUND_TTL):
+        """初始化詞典緩存
+
+        Args:
+            db_path: 資料庫文件路徑
+            max_entries: 資料庫中保留的最多條目數
+            memory_entries: 內存中保留的最多條目數
+            found_ttl: 查到結果的緩存保留秒數
+            not_found_ttl: 沒有結果的緩存保留秒數
+        """
+        self.db_path = db_path or get_dictionary_path("lookup_cache.sqlite3")
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.found_ttl = found_ttl
+        self.not_found_ttl = not_found_ttl
+        self._memory = OrderedDict()  # 單詞 -> (結果 JSON, 過期時間)，按最近使用排序
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._conn.execute("DELETE FROM lookups WHERE expires_at < ?", (time.time(),))
+            # 資料庫的大約條目數，寫入時累加，只在超出上限時重新統計
+            self._count = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, word):
+        """查詢緩存
+
+        Returns:
+            (結果列表, 命中的緩存層 MEMORY 或 DISK)；結果列表為空表示緩存了「沒有結果」。
+            沒有緩存或已過期時返回 (None, None)
+        """
+        key = normalize_text(word)
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                data, expires_at = cached
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return json.loads(data), MEMORY
+                del self._memory[key]
+
+            row = self._conn.execute("SELECT results, expires_at FROM lookups WHERE word = ?", (key,)).fetchone()
+            if row is None:
+                return None, None
+            if row[1] <= now:
+                with self._conn:
+                    self._conn.execute("DELETE FROM lookups WHERE word = ?", (key,))
+                self._count -= 1
+                return None, None
+            self._remember(key, row[0], row[1])
+            return json.loads(row[0]), DISK
+
+    def put(self, word, results):
+        """保存查詢結果，空列表表示沒有結果"""
+        key = normalize_text(word)
+        now = time.time()
+        expires_at = now + (self.found_ttl if results else self.not_found_ttl)
+        data = json.dumps(results, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, data, expires_at)
+            try:
+                with self._conn:
+                    exists = self._conn.execute("SELECT 1 FROM lookups WHERE word = ?", (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO lookups (word, results, found, created_at, expires_at)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (key, data, int(bool(results)), now, expires_at))
+                    if not exists:
+                        self._count += 1
+                    if self._count > self.max_entries:
+                        self._evict()
+            except sqlite3.Error as e:
+                print(f"保存詞典緩存失敗: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+
+    def _remember(self, key, data, expires_at):
+        """加入內存緩存，調用時需持有鎖"""
+        self._memory[key] = (data, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """條目數超出上限時刪除最早過期的條目，直到上限的 EVICT_TO，調用時需持有鎖"""
+        # 其他進程也可能寫入，清理前重新統計
+        self._count = self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        excess = self._count - int(self.max_entries * EVICT_TO)
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT word FROM lookups ORDER BY expires_at LIMIT ?", (excess,))]
+        self._conn.executemany("DELETE FROM lookups WHERE word = ?", [(word,) for word in evicted])
+        self._count -= len(evicted)
+        for word in evicted:
+            self._memory.pop(word, None)
@@ -1,43 +1,128 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QTextEdit, QLineEdit, 
     QPushButton, QHBoxLayout, QTabWidget, QScrollArea,
-    QMessageBox, QFrame
+    QMessageBox, QFrame, QListWidget, QListWidgetItem
 )
-from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot, QObject
+from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot, QObject, QTimer
 from PyQt6.QtGui import QFont
 import requests
 import json
-import threading
 import time
+from collections import Counter
+import japanese_tagger
+from jmdict import LocalDictionary
+from ai_scheduler import RequestScheduler
+from dictionary_cache import DictionaryCache, MEMORY, DISK
+from translation_cache import normalize_text
+
+# Seconds to wait for jisho.org (connect, read)
+JISHO_TIMEOUT = (3, 10)
+
+# Wait this long after the last keystroke before updating the suggestion list
+SUGGESTION_DELAY_MS = 150
+SUGGESTION_LIMIT = 20
+
+# Lookups that were not answered by the cache
+LOOKUP_SHARED = 'shared'  # joined an identical lookup already in flight
+LOOKUP_MISS = 'miss'
 
 class JishoWorker(QObject):
-    """Worker object to perform Jisho API requests in a separate thread"""
+    """Worker object to perform dictionary lookups on background threads
+    
+    Results (including "no results") are cached in memory and on disk. Concurrent
+    lookups of the same word share one request through the scheduler.
+    """
     
     # Define signals
     result_ready = pyqtSignal(list)  # Signal emitted when results are ready
     no_results = pyqtSignal(str)     # Signal emitted when no results found
     error_occurred = pyqtSignal(str) # Signal emitted when error occurs
+    stats_changed = pyqtSignal(str)  # Signal emitted with the cache hit ratio after each lookup
+    
+    def __init__(self, local_dictionary=None, cache=None):
+        super().__init__()
+        self.local_dictionary = local_dictionary
+        self.cache = cache if cache is not None else DictionaryCache()
+        self.scheduler = RequestScheduler(max_workers=2)
+        self.scheduler.start()
+        self.stats = Counter()  # where each lookup was answered -> count
     
     def search_word(self, word):
-        """Search for a word using Jisho API"""
+        """Answer from the cache, otherwise look the word up in the background"""
+        results, tier = self.cache.get(word)
+        if tier is not None:
+            self._record(tier)
+            self._emit_results(word, results)
+            return
+        
+        key = ('lookup', normalize_text(word))
+        self._record(LOOKUP_SHARED if self.scheduler.get(key) else LOOKUP_MISS)
+        self.scheduler.submit(
+            key, lambda: self._lookup(word),
+            callback=lambda results: self._emit_results(word, results),
+            error_callback=self._on_lookup_error)
+    
+    def close(self):
+        """Stop the lookup threads and close the cache"""
+        self.scheduler.stop()
+        self.cache.close()
+    
+    def stats_text(self):
+        """Cache hit ratio for the status bar"""
+        total = sum(self.stats.values())
+        hits = self.stats[MEMORY] + self.stats[DISK] + self.stats[LOOKUP_SHARED]
+        ratio = hits / total if total else 0
+        return (f"詞典緩存命中率 {ratio:.0%}（內存 {self.stats[MEMORY]}，磁盤 {self.stats[DISK]}，"
+                f"合併 {self.stats[LOOKUP_SHARED]}，未命中 {self.stats[LOOKUP_MISS]}）")
+    
+    def _record(self, kind):
+        self.stats[kind] += 1
+        self.stats_changed.emit(self.stats_text())
+    
+    def _emit_results(self, word, results):
+        if results:
+            self.result_ready.emit(results)
+        else:
+            self.no_results.emit(word)
+    
+    def _on_lookup_error(self, error):
+        print(f"Dictionary lookup error: {error}")
+        self.error_occurred.emit(str(error))
+    
+    def _lookup(self, word):
+        """Search the offline dictionary first, then fall back to Jisho API on a miss (scheduler thread)"""
+        results = self._search_local(word)
+        if not results:
+            results = self._search_jisho(word)
+        # Only reached when a dictionary answered; network errors are raised and not cached
+        self.cache.put(word, results)
+        return results
+    
+    def _search_local(self, word):
+        """Look the word (or its dictionary form) up in the offline JMdict index"""
+        if self.local_dictionary is None or not self.local_dictionary.available:
+            return None
         try:
-            # Use Jisho API to search
-            url = f"https://jisho.org/api/v1/search/words?keyword={word}"
-            response = requests.get(url)
-            response.raise_for_status()  # Check for errors
-            
-            data = response.json()
-            
-            # Check if there are results
-            if data['meta']['status'] == 200 and len(data['data']) > 0:
-                self.result_ready.emit(data['data'])
-            else:
-                # No results
-                self.no_results.emit(word)
-                
+            analysis = japanese_tagger.analyze(word)
+            lemma = analysis['lemma'] if analysis else None
+            return self.local_dictionary.lookup(word, lemma)
         except Exception as e:
-            print(f"Dictionary lookup error: {e}")
-            self.error_occurred.emit(str(e))
+            print(f"Offline dictionary lookup error: {e}")
+            return None
+    
+    def _search_jisho(self, word):
+        """Search for a word using Jisho API, returns an empty list when nothing is found"""
+        # Use Jisho API to search
+        url = "https://jisho.org/api/v1/search/words"
+        response = requests.get(url, params={'keyword': word}, timeout=JISHO_TIMEOUT)
+        response.raise_for_status()  # Check for errors
+        
+        data = response.json()
+        
+        # Check if there are results
+        if data['meta']['status'] == 200:
+            return data['data']
+        return []
 
 
 class DictionaryWidget(QWidget):
@@ -53,12 +138,22 @@ class DictionaryWidget(QWidget):
         # Set font
         self.japanese_font = QFont("Yu Gothic UI", 14)
         
+        # Offline JMdict index, opened (and compiled if needed) in the background
+        self.local_dictionary = LocalDictionary()
+        self.local_dictionary.start()
+        
         # Create worker object (stays in main thread)
-        self.jisho_worker = JishoWorker()
+        self.jisho_worker = JishoWorker(self.local_dictionary)
         self.jisho_worker.result_ready.connect(self._display_jisho_result)
         self.jisho_worker.no_results.connect(self._show_no_results)
         self.jisho_worker.error_occurred.connect(self._show_error)
         
+        # Debounce timer for search-as-you-type
+        self.suggestion_timer = QTimer(self)
+        self.suggestion_timer.setSingleShot(True)
+        self.suggestion_timer.setInterval(SUGGESTION_DELAY_MS)
+        self.suggestion_timer.timeout.connect(self._update_suggestions)
+        
         # Initialize UI
         self.init_ui()
         
@@ -117,6 +212,7 @@ class DictionaryWidget(QWidget):
             }
         """)
         self.search_input.returnPressed.connect(self.search_word)
+        self.search_input.textEdited.connect(self.suggestion_timer.start)
         
         self.search_button = QPushButton("查詢")
         self.search_button.setStyleSheet("""
@@ -137,6 +233,25 @@ class DictionaryWidget(QWidget):
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_button)
         
+        # Suggestions from the offline dictionary, updated while typing
+        self.suggestion_list = QListWidget()
+        self.suggestion_list.setFont(QFont("Yu Gothic UI", 12))
+        self.suggestion_list.setMaximumHeight(180)
+        self.suggestion_list.setStyleSheet("""
+            QListWidget {
+                border: 1px solid #AED581;
+                border-radius: 5px;
+                background-color: white;
+            }
+            QListWidget::item:selected {
+                background-color: #DCEDC8;
+                color: #33691E;
+            }
+        """)
+        self.suggestion_list.itemActivated.connect(self._select_suggestion)
+        self.suggestion_list.itemClicked.connect(self._select_suggestion)
+        self.suggestion_list.hide()
+        
         # Results tabs container frame
         results_frame = QFrame()
         results_frame.setFrameShape(QFrame.Shape.StyledPanel)
@@ -312,14 +427,24 @@ class DictionaryWidget(QWidget):
         # Add to main layout
         layout.addWidget(title_frame)
         layout.addWidget(search_frame)
+        layout.addWidget(self.suggestion_list)
         layout.addWidget(results_frame)
     
+    def cleanup(self):
+        """Stop background lookups and close the offline dictionary and the lookup cache"""
+        self.suggestion_timer.stop()
+        self.jisho_worker.close()
+        self.local_dictionary.close()
+    
     def search_word(self):
         """Search for a word"""
         word = self.search_input.text().strip()
         if not word:
             return
         
+        self.suggestion_timer.stop()
+        self.suggestion_list.hide()
+        
         # Emit word selected signal
         self.word_selected.emit(word)
         
@@ -329,14 +454,29 @@ class DictionaryWidget(QWidget):
         self.meaning_text.setHtml("<p>正在查詢，請稍候...</p>")
         self.examples_text.setHtml("<p>載入中...</p>")
         
-        # Use a thread-safe way to perform the search
-        # Create a new thread for the worker
-        search_thread = threading.Thread(
-            target=self.jisho_worker.search_word,
-            args=(word,),
-            daemon=True
-        )
-        search_thread.start()
+        # Cached words are answered immediately, others are looked up on the worker's threads
+        self.jisho_worker.search_word(word)
+    
+    def _update_suggestions(self):
+        """Show ranked candidates for the text typed so far (kana, romaji or kanji)"""
+        self.suggestion_list.clear()
+        text = self.search_input.text().strip()
+        candidates = self.local_dictionary.suggest(text, SUGGESTION_LIMIT) if text else []
+        for candidate in candidates:
+            label = candidate['word']
+            if candidate['reading'] and candidate['reading'] != candidate['word']:
+                label += f"【{candidate['reading']}】"
+            if candidate['meaning']:
+                label += f"  {candidate['meaning']}"
+            item = QListWidgetItem(label)
+            item.setData(Qt.ItemDataRole.UserRole, candidate['word'])
+            self.suggestion_list.addItem(item)
+        self.suggestion_list.setVisible(bool(candidates))
+    
+    def _select_suggestion(self, item):
+        """Look up the chosen candidate"""
+        self.search_input.setText(item.data(Qt.ItemDataRole.UserRole))
+        self.search_word()
     
     @pyqtSlot(list)
     def _display_jisho_result(self, data):
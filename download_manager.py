@@ -0,0 +1,340 @@
+import os
+import re
+import json
+import uuid
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from yt_dlp.utils import DownloadCancelled
+from paths import get_download_path
+from subtitle_cache import file_digest
+
+# 任務狀態
+QUEUED = 'queued'
+DOWNLOADING = 'downloading'
+PAUSED = 'paused'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# 仍然佔用隊列位置的狀態，相同視頻不會重複加入
+ACTIVE_STATES = (QUEUED, DOWNLOADING, PAUSED)
+
+YOUTUBE_ID_PATTERN = re.compile(r'(?:v=|youtu\.be/|shorts/|embed/)([\w-]{11})')
+
+
+def file_record(path):
+    """記錄已下載文件的路徑、大小、修改時間和內容哈希"""
+    stat = os.stat(path)
+    return {
+        'path': path,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_digest(path),
+    }
+
+
+def file_is_complete(record):
+    """檢查已下載的文件是否仍然完整：大小必須相同，修改時間變化時比較內容哈希"""
+    try:
+        stat = os.stat(record['path'])
+    except OSError:
+        return False
+    if stat.st_size != record['size']:
+        return False
+    return stat.st_mtime_ns == record['mtime_ns'] or file_digest(record['path']) == record['sha256']
+
+
+def video_key(url):
+    """提取 YouTube 視頻 ID，同一個視頻的不同網址得到相同的鍵"""
+    match = YOUTUBE_ID_PATTERN.search(url)
+    return match.group(1) if match else url.strip()
+
+
+def job_key(url, language):
+    """生成用於去重的任務鍵"""
+    return f"{video_key(url)}|{language}"
+
+
+class DownloadManager(QObject):
+    """下載隊列管理器
+
+    使用固定數量的工作線程處理下載任務，任務列表保存在磁盤上，
+    重新打開程序後未完成的任務會繼續下載。實際的下載由 download_func 完成:
+    download_func(job, progress_hook) -> (視頻路徑, 字幕路徑)，
+    progress_hook 接收 yt_dlp 格式的進度字典。
+
+    任務記錄中保存下載到一半的臨時文件，以及已完成文件的大小和哈希。
+    已完成的任務再次加入時，文件仍然完整就不會重新下載。
+    """
+
+    # 定義信號，全部以任務 ID 為鍵
+    job_added = pyqtSignal(str, dict)           # 任務ID, 任務信息
+    job_state_changed = pyqtSignal(str, str)    # 任務ID, 新狀態
+    job_progress = pyqtSignal(str, str, float)  # 任務ID, 文件名, 進度百分比
+    job_finished = pyqtSignal(str, str, object) # 任務ID, 視頻路徑, 字幕路徑
+    job_failed = pyqtSignal(str, str)           # 任務ID, 錯誤信息
+
+    def __init__(self, download_func, max_workers=2, queue_file=None):
+        """初始化下載隊列
+
+        Args:
+            download_func: 執行單個下載任務的函數
+            max_workers: 同時進行的下載數量
+            queue_file: 任務列表文件路徑
+        """
+        super().__init__()
+        self.download_func = download_func
+        self.max_workers = max_workers
+        self.queue_file = queue_file or get_download_path("download_queue.json")
+
+        self.jobs = {}  # 任務ID -> 任務信息，按加入順序排列
+        self._controls = {}  # 正在下載的任務ID -> 用戶請求的狀態 (PAUSED 或 CANCELLED)
+        self._condition = threading.Condition()
+        self._workers = []
+
+        self._load_queue()
+
+    def start(self):
+        """啟動工作線程"""
+        with self._condition:
+            if self._workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"download-worker-{i}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+
+    def _load_queue(self):
+        """加載任務列表，上次退出時正在下載的任務重新排隊"""
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+        except Exception as e:
+            print(f"加載下載隊列失敗: {e}")
+            return
+
+        for job in jobs:
+            if job.get('state') == DOWNLOADING:
+                # 上次退出時被中斷，臨時文件仍在，重新排隊後會從斷點繼續
+                job['state'] = QUEUED
+                if job.get('partial_files'):
+                    print(f"恢復下載任務: {job['url']} ({len(job['partial_files'])} 個未完成文件)")
+            self.jobs[job['id']] = job
+
+    def _save_queue(self):
+        """保存任務列表，調用時需持有鎖"""
+        try:
+            temp_file = self.queue_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self.jobs.values()), f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.queue_file)
+        except Exception as e:
+            print(f"保存下載隊列失敗: {e}")
+
+    def add_job(self, url, language="ja", autoload=False):
+        """加入下載任務，相同的視頻已在隊列中時返回已有任務的ID
+
+        Args:
+            url: 視頻網址
+            language: 字幕語言代碼
+            autoload: 下載完成後是否自動播放
+        """
+        url = url.strip()
+        key = job_key(url, language)
+
+        with self._condition:
+            for job in self.jobs.values():
+                if job['key'] != key:
+                    continue
+                if job['state'] in ACTIVE_STATES:
+                    return job['id']
+                # 已完成、失敗或已取消的任務重新排隊，已完成的文件會先檢查是否完整
+                job['autoload'] = autoload
+                self._set_state(job, QUEUED)
+                return job['id']
+
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'key': key,
+                'url': url,
+                'language': language,
+                'autoload': autoload,
+                'state': QUEUED,
+                'title': '',
+                'progress': 0.0,
+                'error': '',
+                'partial_files': {},  # 最終文件名 -> 下載中的臨時文件名
+                'media': [],          # 已完成文件的記錄，見 file_record
+            }
+            self.jobs[job['id']] = job
+            self._save_queue()
+            self._condition.notify()
+
+        self.job_added.emit(job['id'], dict(job))
+        return job['id']
+
+    def add_urls(self, urls, language="ja"):
+        """批量加入下載任務，返回任務ID列表"""
+        return [self.add_job(url, language) for url in urls if url.strip()]
+
+    def pause(self, job_id):
+        """暫停任務，已下載的部分保留，恢復後繼續下載"""
+        self._interrupt(job_id, PAUSED)
+
+    def cancel(self, job_id):
+        """取消任務"""
+        self._interrupt(job_id, CANCELLED)
+
+    def resume(self, job_id):
+        """恢復暫停或失敗的任務"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job and job['state'] in (PAUSED, FAILED, CANCELLED):
+                self._set_state(job, QUEUED)
+
+    def _interrupt(self, job_id, state):
+        """暫停或取消任務，正在下載的任務會在下一次進度回調時中斷"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if not job:
+                return
+            if job['state'] == DOWNLOADING:
+                self._controls[job_id] = state
+            elif job['state'] in (QUEUED, PAUSED):
+                self._set_state(job, state)
+
+    def update_job(self, job_id, **fields):
+        """更新任務的附加信息並保存，供 download_func 記錄續傳所需的數據"""
+        with self._condition:
+            job = self.jobs.get(job_id)
+            if job:
+                job.update(fields)
+                self._save_queue()
+
+    def _set_state(self, job, state, error=''):
+        """更新任務狀態並保存，調用時需持有鎖"""
+        job['state'] = state
+        job['error'] = error
+        self._save_queue()
+        if state == QUEUED:
+            self._condition.notify()
+        self.job_state_changed.emit(job['id'], state)
+
+    def get_jobs(self):
+        """獲取所有任務信息"""
+        with self._condition:
+            return [dict(job) for job in self.jobs.values()]
+
+    def _completed_result(self, job):
+        """已完成任務的文件都完整時返回 (視頻路徑, 字幕路徑)，否則返回 None"""
+        media = job.get('media')
+        if not media or not job.get('video_path'):
+            return None
+        if not all(file_is_complete(record) for record in media):
+            return None
+        return job['video_path'], job.get('subtitle_paths')
+
+    def _record_partial(self, job, progress):
+        """記錄正在下載的臨時文件，文件下載完成後移除記錄"""
+        filename = progress.get('filename')
+        if not filename:
+            return
+        partial_files = job.setdefault('partial_files', {})
+        finished = progress.get('status') == 'finished'
+        # 只在開始或完成一個文件時保存，避免每次進度回調都寫入磁盤
+        if finished != (filename in partial_files):
+            return
+        with self._condition:
+            if finished:
+                del partial_files[filename]
+            else:
+                partial_files[filename] = progress.get('tmpfilename') or filename
+            self._save_queue()
+
+    def _discard_partial(self, job):
+        """刪除已取消任務的臨時文件"""
+        for tmpfilename in job.get('partial_files', {}).values():
+            try:
+                os.remove(tmpfilename)
+            except OSError:
+                pass
+        job['partial_files'] = {}
+
+    def _next_job(self):
+        """等待並取出下一個排隊中的任務"""
+        with self._condition:
+            while True:
+                for job in self.jobs.values():
+                    if job['state'] == QUEUED:
+                        self._set_state(job, DOWNLOADING)
+                        return job
+                self._condition.wait()
+
+    def _worker_loop(self):
+        """工作線程：依次處理排隊中的任務"""
+        while True:
+            job = self._next_job()
+            job_id = job['id']
+
+            def progress_hook(progress, job=job):
+                # 用戶暫停或取消時中斷 yt_dlp 的下載，DownloadCancelled 不會被 yt_dlp 當作下載錯誤處理
+                if job['id'] in self._controls:
+                    raise DownloadCancelled(f"下載已{'暫停' if self._controls[job['id']] == PAUSED else '取消'}")
+                self._record_partial(job, progress)
+                if progress.get('status') != 'downloading':
+                    return
+                filename = os.path.basename(progress.get('filename', ''))
+                total = progress.get('total_bytes') or progress.get('total_bytes_estimate')
+                if total:
+                    percent = 100.0 * progress.get('downloaded_bytes', 0) / total
+                else:
+                    try:
+                        percent = float(progress.get('_percent_str', '0%').strip().replace('%', ''))
+                    except ValueError:
+                        return
+                job['progress'] = percent
+                self.job_progress.emit(job['id'], filename, percent)
+
+            try:
+                result = self._completed_result(job)
+                if result:
+                    print(f"文件已完整下載，跳過: {job['video_path']}")
+                else:
+                    result = self.download_func(dict(job), progress_hook)
+                video_path, subtitle_paths = result
+                media = [file_record(path) for path in self._result_paths(video_path, subtitle_paths)]
+            except Exception as e:
+                with self._condition:
+                    requested = self._controls.pop(job_id, None)
+                    if requested == CANCELLED:
+                        self._discard_partial(job)
+                    if requested:
+                        self._set_state(job, requested)
+                    else:
+                        self._set_state(job, FAILED, str(e))
+                if not requested:
+                    self.job_failed.emit(job_id, str(e))
+                continue
+
+            with self._condition:
+                self._controls.pop(job_id, None)
+                job['title'] = os.path.splitext(os.path.basename(video_path))[0]
+                job['video_path'] = video_path
+                job['subtitle_paths'] = subtitle_paths
+                job['media'] = media
+                job['partial_files'] = {}
+                job['progress'] = 100.0
+                self._set_state(job, COMPLETED)
+            self.job_finished.emit(job_id, video_path, subtitle_paths)
+
+    @staticmethod
+    def _result_paths(video_path, subtitle_paths):
+        """列出下載結果中所有存在的文件"""
+        paths = [video_path]
+        if isinstance(subtitle_paths, dict):
+            paths.extend(subtitle_paths.values())
+        elif subtitle_paths:
+            paths.append(subtitle_paths)
+        return [path for path in paths if path and os.path.exists(path)]
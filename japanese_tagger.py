@@ -0,0 +1,108 @@
+import time
+import threading
+from functools import lru_cache
+try:
+    import fugashi
+except ImportError:
+    fugashi = None
+
+# 分析結果緩存的條目數，字幕中的常用詞會被反覆查詢
+ANALYSIS_CACHE_SIZE = 4096
+
+_tagger = None
+_tagger_error = None
+_tagger_lock = threading.Lock()  # 創建分詞器
+_parse_lock = threading.Lock()  # MeCab 分詞器不能在多個線程中同時使用
+
+
+def _create_tagger():
+    """創建分詞器，加載詞典可能需要數秒"""
+    started = time.monotonic()
+    tagger = fugashi.Tagger()
+    print(f"日語分詞器已加載，耗時 {time.monotonic() - started:.2f} 秒")
+    return tagger
+
+
+def get_tagger():
+    """返回進程內共用的分詞器，第一次調用時加載，不可用時返回 None"""
+    global _tagger, _tagger_error
+    if _tagger is not None or _tagger_error is not None:
+        return _tagger
+    with _tagger_lock:
+        if _tagger is None and _tagger_error is None:
+            if fugashi is None:
+                _tagger_error = "未安裝 fugashi"
+            else:
+                try:
+                    _tagger = _create_tagger()
+                except Exception as e:
+                    # 通常是沒有安裝 unidic-lite 或 unidic 詞典
+                    _tagger_error = str(e)
+            if _tagger_error:
+                print(f"注意: 日語分詞器不可用，單詞分析功能將不可用 ({_tagger_error})")
+    return _tagger
+
+
+def load_in_background():
+    """在後台線程中加載分詞器，不阻塞界面"""
+    threading.Thread(target=get_tagger, name="tagger-loader", daemon=True).start()
+
+
+def word_info(word):
+    """把 fugashi 的單詞轉換為單詞信息字典"""
+    feature = word.feature
+    pos = [part for part in (feature.pos1, feature.pos2) if part and part != '*']
+    return {
+        'surface': word.surface,  # 單詞表面形式
+        'lemma': feature.lemma or word.surface,  # 詞根形式
+        'pos': '-'.join(pos) or '未知',  # 詞性
+        'pronunciation': feature.pron or feature.kana or word.surface,  # 發音
+    }
+
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def _analyze(surface):
+    """分析單詞，返回第一個詞的信息（作為元組緩存，避免調用方修改共用的字典）"""
+    tagger = get_tagger()
+    if tagger is None:
+        return None
+    with _parse_lock:
+        words = tagger(surface)
+        if not words:
+            return None
+        return tuple(word_info(words[0]).items())
+
+
+def analyze(surface):
+    """分析單詞，分詞器不可用或無法分析時返回 None"""
+    result = _analyze(surface)
+    return dict(result) if result is not None else None
+
+
+def tokenize(text):
+    """分詞，返回 [(開始字符位置, 結束字符位置, 詞根, 詞性, 發音)]，分詞器不可用時返回 None
+
+    詞根、詞性和發音與 analyze 的結果相同。
+    """
+    tagger = get_tagger()
+    if tagger is None:
+        return None
+    tokens = []
+    position = 0
+    with _parse_lock:
+        for word in tagger(text):
+            surface = word.surface
+            # 分詞結果不包含空白，按順序在原文中查找每個詞的位置
+            start = text.find(surface, position)
+            if start < 0:
+                start = position
+            end = start + len(surface)
+            position = end
+            info = word_info(word)
+            tokens.append((start, end, info['lemma'], info['pos'], info['pronunciation']))
+    return tokens
+
+
+def cache_info():
+    """分析結果緩存的命中統計"""
+    return _analyze.cache_info()
@@ -0,0 +1,506 @@
+import os
+import re
+import gzip
+import json
+import mmap
+import time
+import heapq
+import struct
+import threading
+import xml.etree.ElementTree as ET
+from array import array
+import kana
+from paths import get_dictionary_path
+
+# 索引文件由頭部和以下各段組成，每段按 4 字節對齊:
+#   條目: 偏移 uint32[n+1] | 條目 JSON
+#   原文鍵表（漢字寫法和假名讀音）: 鍵偏移 uint32[k+1] | 條目編號 uint32[k] | 鍵 UTF-8
+#   搜索鍵表（統一寫法後的鍵）: 鍵偏移 | 條目編號 | 鍵 UTF-8 | 常用程度 uint8[k]
+#   模糊匹配鍵表（搜索鍵和刪去一個字的變體）: 鍵偏移 | 搜索鍵的位置 | 鍵 UTF-8
+# 鍵按 UTF-8 字節排序，相同的鍵按常用程度排序，查詢時二分查找
+MAGIC = b'JMDIDX\x00\x01'
+INDEX_VERSION = 2
+SECTION_COUNT = 12
+HEADER = struct.Struct(f'<8sII{SECTION_COUNT + 1}Q')
+
+# 放在 DICTIONARY_DIR 中的 JMdict 文件，按順序查找
+SOURCE_NAMES = ('JMdict_e.xml', 'JMdict_e', 'JMdict_e.gz', 'JMdict.xml', 'JMdict', 'JMdict.gz')
+INDEX_NAME = 'jmdict.idx'
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+# ke_pri / re_pri 中表示常用詞的標記
+COMMON_PRIORITIES = {'news1', 'ichi1', 'spec1', 'spec2', 'gai1'}
+
+# 常用程度，數值越小越常用；nf01-nf48 是按報紙詞頻分的組，直接作為常用程度
+RANK_COMMON = 50
+RANK_PRIORITY = 70
+RANK_OTHER = 100
+# 前綴搜索按這幾組常用程度依次查找: nf01-12、nf13-48、其他常用詞、不常用的詞
+RANK_TIERS = [re.compile(pattern) for pattern in
+              (b'[\\x00-\\x0c]', b'[\\x0d-\\x30]', b'[\\x31-\\x63]', b'\\x64')]
+
+# 模糊匹配只處理編輯距離為 1 的情況，太短的詞不做模糊匹配
+FUZZY_MIN_LENGTH = 3
+FUZZY_MAX_KEY_LENGTH = 12
+# 前綴很短時匹配的詞很多，只在前面這些常用詞中排序
+PREFIX_SCAN_LIMIT = 100
+
+
+def find_source(directory=None):
+    """返回字典目錄中的 JMdict 文件路徑，沒有則返回 None"""
+    directory = directory or get_dictionary_path()
+    for name in SOURCE_NAMES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _open_source(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _texts(element, tag):
+    return [child.text for child in element.iter(tag) if child.text]
+
+
+def _rank(priorities):
+    """根據優先級標記計算常用程度"""
+    bands = [int(priority[2:]) for priority in priorities
+             if priority.startswith('nf') and priority[2:].isdigit()]
+    if bands:
+        return min(bands)
+    if priorities & COMMON_PRIORITIES:
+        return RANK_COMMON
+    if priorities:
+        return RANK_PRIORITY
+    return RANK_OTHER
+
+
+def parse_entries(source_path):
+    """逐條讀取 JMdict，返回 (條目字典, 鍵列表, 常用程度) 的迭代器
+
+    條目字典只保留顯示需要的內容：漢字寫法、讀音和英文詞義。
+    """
+    with _open_source(source_path) as f:
+        for _, element in ET.iterparse(f, events=('end',)):
+            if element.tag != 'entry':
+                continue
+
+            kanji = _texts(element, 'keb')
+            readings = _texts(element, 'reb')
+            priorities = set(_texts(element, 'ke_pri')) | set(_texts(element, 're_pri'))
+
+            senses = []
+            for sense in element.iter('sense'):
+                glosses = [gloss.text for gloss in sense.iter('gloss')
+                           if gloss.text and gloss.get(XML_LANG, 'eng') == 'eng']
+                if not glosses:
+                    continue
+                senses.append({
+                    'english_definitions': glosses,
+                    'parts_of_speech': _texts(sense, 'pos'),
+                    'tags': _texts(sense, 'misc') + _texts(sense, 'field'),
+                    'restrictions': _texts(sense, 'stagk') + _texts(sense, 'stagr'),
+                })
+
+            entry = {
+                'seq': int(element.findtext('ent_seq') or 0),
+                'kanji': kanji,
+                'readings': readings,
+                'common': bool(priorities & COMMON_PRIORITIES),
+                'senses': senses,
+            }
+            element.clear()
+            if senses:
+                yield entry, list(dict.fromkeys(kanji + readings)), _rank(priorities)
+
+
+def deletions(text):
+    """刪去一個字得到的所有變體"""
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+def edit_distance(a, b, limit):
+    """兩個字符串的編輯距離（相鄰字符交換算一次），超過 limit 時返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b))
+            if (previous2 is not None and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _key_table(items):
+    """把排序後的 [(鍵 UTF-8, 值)] 轉換為 (鍵偏移, 值, 鍵) 三段數據"""
+    offsets = array('I', [0])
+    for key, _ in items:
+        offsets.append(offsets[-1] + len(key))
+    values = array('I', (value for _, value in items))
+    return [offsets.tobytes(), values.tobytes(), b''.join(key for key, _ in items)]
+
+
+def compile_index(source_path, index_path):
+    """把 JMdict XML 編譯成索引文件，返回條目數"""
+    started = time.monotonic()
+    entry_offsets = array('I', [0])
+    entry_blobs = []
+    keys = []  # (鍵 UTF-8, 常用程度, 條目編號)
+    search_keys = set()  # (統一寫法後的鍵 UTF-8, 常用程度, 條目編號)
+
+    for entry, entry_keys, rank in parse_entries(source_path):
+        entry_id = len(entry_blobs)
+        blob = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry_blobs.append(blob)
+        entry_offsets.append(entry_offsets[-1] + len(blob))
+        for key in entry_keys:
+            keys.append((key.encode('utf-8'), rank, entry_id))
+            search_keys.add((kana.normalize(key).encode('utf-8'), rank, entry_id))
+
+    keys.sort()
+    search_keys = sorted(search_keys)
+
+    # 每個不同的搜索鍵只記錄第一次出現的位置，查詢時從這裡往後讀取相同的鍵
+    variants = []
+    previous = None
+    for position, (key, _, _) in enumerate(search_keys):
+        if key == previous:
+            continue
+        previous = key
+        text = key.decode('utf-8')
+        if 2 <= len(text) <= FUZZY_MAX_KEY_LENGTH:
+            variants.append((key, position))
+            variants.extend((variant.encode('utf-8'), position) for variant in deletions(text))
+    variants.sort()
+
+    sections = [entry_offsets.tobytes(), b''.join(entry_blobs)]
+    sections += _key_table([(key, entry_id) for key, _, entry_id in keys])
+    sections += _key_table([(key, entry_id) for key, _, entry_id in search_keys])
+    sections.append(bytes(rank for _, rank, _ in search_keys))
+    sections += _key_table(variants)
+
+    # 先寫入臨時文件再替換，避免讀到寫了一半的索引
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        positions = []
+        for data in sections:
+            f.write(b'\0' * (-f.tell() % 4))
+            positions.append(f.tell())
+            f.write(data)
+        positions.append(f.tell())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, INDEX_VERSION, len(entry_blobs), *positions))
+    os.replace(temp_path, index_path)
+    print(f"JMdict 索引編譯完成: {len(entry_blobs)} 個條目，{len(keys)} 個鍵，"
+          f"{len(variants)} 個模糊匹配鍵，耗時 {time.monotonic() - started:.1f} 秒")
+    return len(entry_blobs)
+
+
+def index_version(index_path):
+    """讀取索引文件的格式版本，不是索引文件時返回 None"""
+    try:
+        with open(index_path, 'rb') as f:
+            magic, version, *_ = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return version if magic == MAGIC else None
+
+
+class _KeyTable:
+    """內存映射中排序的鍵表，每個鍵對應一個 uint32 值"""
+
+    def __init__(self, mm, view, offsets, values, keys):
+        self._mm = mm
+        self._offsets = view[offsets[0]:offsets[1]].cast('I')
+        self.values = view[values[0]:values[1]].cast('I')
+        self._keys = keys[0]
+        self.count = len(self.values)
+
+    def release(self):
+        self._offsets.release()
+        self.values.release()
+
+    def key(self, i):
+        """第 i 個鍵的 UTF-8 字節"""
+        return self._mm[self._keys + self._offsets[i]:self._keys + self._offsets[i + 1]]
+
+    def key_length(self, i):
+        return self._offsets[i + 1] - self._offsets[i]
+
+    def lower_bound(self, key, low=0):
+        """返回第一個不小於 key（UTF-8 字節）的鍵的位置"""
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def equal_range(self, key):
+        """與 key 相同的鍵的位置範圍"""
+        low = self.lower_bound(key)
+        high = low
+        while high < self.count and self.key(high) == key:
+            high += 1
+        return low, high
+
+    def prefix_range(self, prefix):
+        """以 prefix 開頭的鍵的位置範圍，UTF-8 中不會出現 0xFF，所以 prefix + 0xFF 大於所有這些鍵"""
+        low = self.lower_bound(prefix)
+        return low, self.lower_bound(prefix + b'\xff', low)
+
+
+class JMdictIndex:
+    """內存映射的 JMdict 索引，查詢只需二分查找，不需要把字典讀入內存"""
+
+    def __init__(self, index_path):
+        self._file = open(index_path, 'rb')
+        self._tables = []
+        self._mm = None
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.entry_count, *positions = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or version != INDEX_VERSION or positions[-1] != len(self._mm):
+                raise ValueError("字典索引格式不正確")
+        except Exception:
+            self.close()
+            raise
+
+        view = memoryview(self._mm)
+        sections = list(zip(positions, positions[1:]))
+        self._entry_offsets = view[sections[0][0]:sections[0][1]].cast('I')
+        self._entries = sections[1][0]
+        self._keys = _KeyTable(self._mm, view, *sections[2:5])
+        self._search = _KeyTable(self._mm, view, *sections[5:8])
+        self._ranks = sections[8][0]
+        self._variants = _KeyTable(self._mm, view, *sections[9:12])
+        self._tables = [self._keys, self._search, self._variants]
+        self.key_count = self._keys.count
+
+    def close(self):
+        # 釋放 memoryview 之後才能關閉內存映射
+        for table in self._tables:
+            table.release()
+        self._tables = []
+        view = self.__dict__.pop('_entry_offsets', None)
+        if view is not None:
+            view.release()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def entry(self, entry_id):
+        """讀取一個條目"""
+        start = self._entries + self._entry_offsets[entry_id]
+        end = self._entries + self._entry_offsets[entry_id + 1]
+        return json.loads(self._mm[start:end].decode('utf-8'))
+
+    def lookup(self, word, limit=10):
+        """查詢漢字寫法或讀音與 word 完全相同的條目，常用詞在前
+
+        找不到時按統一寫法查詢，例如用片假名查詢平假名寫的詞。
+        """
+        for table, key in ((self._keys, word), (self._search, kana.normalize(word))):
+            low, high = table.equal_range(key.encode('utf-8'))
+            entry_ids = list(dict.fromkeys(table.values[i] for i in range(low, high)))[:limit]
+            if entry_ids:
+                return [self.entry(entry_id) for entry_id in entry_ids]
+        return []
+
+    def search_keys(self):
+        """按順序返回所有不同的搜索鍵（統一寫法後的漢字寫法和讀音）"""
+        previous = None
+        for position in range(self._search.count):
+            key = self._search.key(position)
+            if key != previous:
+                previous = key
+                yield key.decode('utf-8')
+
+    def _rank(self, position):
+        return self._mm[self._ranks + position]
+
+    def prefix_search(self, prefix, limit, scan_limit=PREFIX_SCAN_LIMIT):
+        """以 prefix 開頭的搜索鍵，返回 [(排序依據, 條目編號)]
+
+        完全匹配的詞排在最前面，其次按常用程度和長度排序。匹配的詞很多時，
+        按常用程度分組查找，找到 scan_limit 個之後不再查找更不常用的詞。
+        """
+        key = prefix.encode('utf-8')
+        low, high = self._search.prefix_range(key)
+        if low == high:
+            return []
+        positions = set()
+        position = low
+        while position < high and self._search.key_length(position) == len(key):
+            positions.add(position)
+            position += 1
+        start, end = self._ranks + low, self._ranks + high
+        scan_limit = max(scan_limit, limit)
+        for pattern in RANK_TIERS:
+            for match in pattern.finditer(self._mm, start, end):
+                positions.add(match.start() - self._ranks)
+                if len(positions) >= scan_limit:
+                    break
+            if len(positions) >= limit:
+                break
+        candidates = []
+        for position in positions:
+            length = self._search.key_length(position)
+            candidates.append(((length != len(key), self._mm[self._ranks + position], length, position),
+                               self._search.values[position]))
+        return heapq.nsmallest(limit, candidates)
+
+    def fuzzy_search(self, query, limit):
+        """與 query 編輯距離為 1 的搜索鍵，返回 [(排序依據, 條目編號)]
+
+        索引中保存了每個鍵刪去一個字的所有變體，query 或它刪去一個字的變體
+        與索引中的變體相同，就是編輯距離可能為 1 的候選詞，再逐個驗證。
+        """
+        if len(query) < FUZZY_MIN_LENGTH:
+            return []
+        first_positions = set()
+        for variant in deletions(query) | {query}:
+            low, high = self._variants.equal_range(variant.encode('utf-8'))
+            first_positions.update(self._variants.values[i] for i in range(low, high))
+
+        candidates = []
+        for first in first_positions:
+            key = self._search.key(first)
+            if edit_distance(query, key.decode('utf-8'), 1) != 1:
+                continue
+            position = first
+            while position < self._search.count and self._search.key(position) == key:
+                candidates.append(((1, self._rank(position), len(key), position), self._search.values[position]))
+                position += 1
+        return heapq.nsmallest(limit, candidates)
+
+    def suggest(self, text, limit=20):
+        """一邊輸入一邊搜索：前綴匹配，結果不夠時加上模糊匹配
+
+        Returns:
+            按相關程度排序的 [(條目編號, 條目)]
+        """
+        prefixes = kana.query_prefixes(text)
+        candidates = []
+        for prefix in prefixes:
+            # 結尾的羅馬字不完整時要搜索多個前綴，每個前綴少排序一些詞
+            candidates.extend(self.prefix_search(prefix, limit, PREFIX_SCAN_LIMIT // len(prefixes)))
+        if len(candidates) < limit and len(prefixes) == 1:
+            candidates.extend(self.fuzzy_search(prefixes[0], limit))
+
+        results = {}
+        for _, entry_id in sorted(candidates):
+            if entry_id not in results:
+                results[entry_id] = None
+                if len(results) >= limit:
+                    break
+        return [(entry_id, self.entry(entry_id)) for entry_id in results]
+
+
+def to_jisho_format(entry):
+    """把條目轉換為 jisho.org API 的格式，字典界面可以用同樣的方式顯示"""
+    readings = entry['readings'] or ['']
+    japanese = [{'word': kanji, 'reading': readings[0]} for kanji in entry['kanji']]
+    if not japanese:
+        japanese = [{'reading': reading} for reading in readings]
+    return {
+        'slug': entry['kanji'][0] if entry['kanji'] else readings[0],
+        'is_common': entry['common'],
+        'japanese': japanese,
+        'senses': entry['senses'],
+    }
+
+
+def to_candidate(entry):
+    """把條目轉換為候選列表中顯示的內容"""
+    reading = entry['readings'][0] if entry['readings'] else ''
+    senses = entry['senses']
+    return {
+        'word': entry['kanji'][0] if entry['kanji'] else reading,
+        'reading': reading,
+        'meaning': '; '.join(senses[0]['english_definitions']) if senses else '',
+        'common': entry['common'],
+    }
+
+
+class LocalDictionary:
+    """離線字典：需要時在後台編譯 JMdict 索引，編譯完成前查詢返回 None"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_dictionary_path()
+        self.index_path = os.path.join(self.directory, INDEX_NAME)
+        self._index = None
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def start(self):
+        """在後台打開索引，索引不存在、格式過時或比 JMdict 文件舊時先重新編譯"""
+        threading.Thread(target=self._load, name="jmdict-loader", daemon=True).start()
+
+    def _needs_compile(self, source):
+        if not os.path.exists(self.index_path):
+            return True
+        if os.path.getmtime(self.index_path) < os.path.getmtime(source):
+            return True
+        return index_version(self.index_path) != INDEX_VERSION
+
+    def _load(self):
+        source = find_source(self.directory)
+        try:
+            if source and self._needs_compile(source):
+                print(f"正在編譯離線字典: {source}")
+                compile_index(source, self.index_path)
+            if os.path.exists(self.index_path):
+                index = JMdictIndex(self.index_path)
+                with self._lock:
+                    self._index = index
+                print(f"離線字典已加載: {index.entry_count} 個條目")
+        except Exception as e:
+            print(f"加載離線字典失敗: {e}")
+        finally:
+            self.ready.set()
+
+    @property
+    def available(self):
+        return self._index is not None
+
+    def lookup(self, word, lemma=None, limit=10):
+        """查詢單詞，找不到時再查詢詞根形式
+
+        Returns:
+            jisho.org API 格式的結果列表；沒有離線字典時返回 None
+        """
+        index = self._index
+        if index is None:
+            return None
+        entries = index.lookup(word, limit)
+        if lemma:
+            # UniDic 的外來語詞根帶有原文，例如 "コーヒー-coffee"
+            lemma = lemma.split('-')[0]
+        if not entries and lemma and lemma != word:
+            entries = index.lookup(lemma, limit)
+        return [to_jisho_format(entry) for entry in entries]
+
+    def suggest(self, text, limit=20):
+        """輸入框的候選詞，支持假名、羅馬字和拼寫錯誤，沒有離線字典時返回空列表"""
+        index = self._index
+        if index is None or not text.strip():
+            return []
+        return [to_candidate(entry) for _, entry in index.suggest(text, limit)]
+
+    def close(self):
+        with self._lock:
+            index, self._index = self._index, None
+        if index is not None:
+            index.close()
@@ -0,0 +1,118 @@
+import unicodedata
+
+# 羅馬字到平假名的對照表，包括平文式、訓令式和常見的輸入法寫法
+ROMAJI_TABLE = {
+    'a': 'あ', 'i': 'い', 'u': 'う', 'e': 'え', 'o': 'お',
+    'ka': 'か', 'ki': 'き', 'ku': 'く', 'ke': 'け', 'ko': 'こ',
+    'ga': 'が', 'gi': 'ぎ', 'gu': 'ぐ', 'ge': 'げ', 'go': 'ご',
+    'sa': 'さ', 'shi': 'し', 'si': 'し', 'su': 'す', 'se': 'せ', 'so': 'そ',
+    'za': 'ざ', 'ji': 'じ', 'zi': 'じ', 'zu': 'ず', 'ze': 'ぜ', 'zo': 'ぞ',
+    'ta': 'た', 'chi': 'ち', 'ti': 'ち', 'tsu': 'つ', 'tu': 'つ', 'te': 'て', 'to': 'と',
+    'da': 'だ', 'di': 'ぢ', 'du': 'づ', 'de': 'で', 'do': 'ど',
+    'na': 'な', 'ni': 'に', 'nu': 'ぬ', 'ne': 'ね', 'no': 'の',
+    'ha': 'は', 'hi': 'ひ', 'fu': 'ふ', 'hu': 'ふ', 'he': 'へ', 'ho': 'ほ',
+    'ba': 'ば', 'bi': 'び', 'bu': 'ぶ', 'be': 'べ', 'bo': 'ぼ',
+    'pa': 'ぱ', 'pi': 'ぴ', 'pu': 'ぷ', 'pe': 'ぺ', 'po': 'ぽ',
+    'ma': 'ま', 'mi': 'み', 'mu': 'む', 'me': 'め', 'mo': 'も',
+    'ya': 'や', 'yu': 'ゆ', 'yo': 'よ',
+    'ra': 'ら', 'ri': 'り', 'ru': 'る', 're': 'れ', 'ro': 'ろ',
+    'wa': 'わ', 'wi': 'ゐ', 'we': 'ゑ', 'wo': 'を', 'nn': 'ん', "n'": 'ん',
+    'kya': 'きゃ', 'kyu': 'きゅ', 'kyo': 'きょ', 'gya': 'ぎゃ', 'gyu': 'ぎゅ', 'gyo': 'ぎょ',
+    'sha': 'しゃ', 'shu': 'しゅ', 'sho': 'しょ', 'she': 'しぇ',
+    'sya': 'しゃ', 'syu': 'しゅ', 'syo': 'しょ',
+    'ja': 'じゃ', 'ju': 'じゅ', 'jo': 'じょ', 'je': 'じぇ',
+    'jya': 'じゃ', 'jyu': 'じゅ', 'jyo': 'じょ', 'zya': 'じゃ', 'zyu': 'じゅ', 'zyo': 'じょ',
+    'cha': 'ちゃ', 'chu': 'ちゅ', 'cho': 'ちょ', 'che': 'ちぇ',
+    'tya': 'ちゃ', 'tyu': 'ちゅ', 'tyo': 'ちょ', 'cya': 'ちゃ', 'cyu': 'ちゅ', 'cyo': 'ちょ',
+    'dya': 'ぢゃ', 'dyu': 'ぢゅ', 'dyo': 'ぢょ',
+    'nya': 'にゃ', 'nyu': 'にゅ', 'nyo': 'にょ', 'hya': 'ひゃ', 'hyu': 'ひゅ', 'hyo': 'ひょ',
+    'bya': 'びゃ', 'byu': 'びゅ', 'byo': 'びょ', 'pya': 'ぴゃ', 'pyu': 'ぴゅ', 'pyo': 'ぴょ',
+    'mya': 'みゃ', 'myu': 'みゅ', 'myo': 'みょ', 'rya': 'りゃ', 'ryu': 'りゅ', 'ryo': 'りょ',
+    'fa': 'ふぁ', 'fi': 'ふぃ', 'fe': 'ふぇ', 'fo': 'ふぉ',
+    'va': 'ゔぁ', 'vi': 'ゔぃ', 'vu': 'ゔ', 've': 'ゔぇ', 'vo': 'ゔぉ',
+    'thi': 'てぃ', 'dhi': 'でぃ', 'twu': 'とぅ', 'dwu': 'どぅ',
+    'xa': 'ぁ', 'xi': 'ぃ', 'xu': 'ぅ', 'xe': 'ぇ', 'xo': 'ぉ',
+    'la': 'ぁ', 'li': 'ぃ', 'lu': 'ぅ', 'le': 'ぇ', 'lo': 'ぉ',
+    'xya': 'ゃ', 'xyu': 'ゅ', 'xyo': 'ょ', 'lya': 'ゃ', 'lyu': 'ゅ', 'lyo': 'ょ',
+    'xtsu': 'っ', 'xtu': 'っ', 'ltsu': 'っ', 'ltu': 'っ', 'xwa': 'ゎ',
+    '-': 'ー',
+}
+ROMAJI_MAX_LENGTH = max(len(romaji) for romaji in ROMAJI_TABLE)
+ROMAJI_PREFIXES = {romaji[:i] for romaji in ROMAJI_TABLE for i in range(1, len(romaji) + 1)}
+VOWELS = set('aeiou')
+
+
+def katakana_to_hiragana(text):
+    """把片假名轉換為平假名，長音符號等其他字符不變"""
+    return ''.join(chr(ord(char) - 0x60) if 'ァ' <= char <= 'ヶ' else char for char in text)
+
+
+def normalize(text):
+    """統一寫法：全角半角、大小寫和片假名，索引和查詢使用同樣的規則"""
+    return katakana_to_hiragana(unicodedata.normalize('NFKC', text).lower().strip())
+
+
+def romaji_to_hiragana(text):
+    """把羅馬字轉換為平假名，其他字符保持不變
+
+    Returns:
+        (轉換結果, 結尾還不完整的羅馬字)，例如 "tab" 返回 ("た", "b")
+    """
+    result = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        following = text[i + 1] if i + 1 < len(text) else ''
+        # 重複的子音表示促音，例如 "kitte"、"matcha"
+        if char.isascii() and char.isalpha() and char not in VOWELS and char != 'n' and (
+                following == char or (char == 't' and following == 'c')):
+            result.append('っ')
+            i += 1
+            continue
+        # n 後面跟著其他子音時是撥音，"konnichiwa" 中的 nn 是 ん + に
+        after = text[i + 2] if i + 2 < len(text) else ''
+        if char == 'n' and following and following not in VOWELS and following not in "y'" and (
+                following != 'n' or after in VOWELS or after == 'y'):
+            result.append('ん')
+            i += 1
+            continue
+        for length in range(min(ROMAJI_MAX_LENGTH, len(text) - i), 0, -1):
+            kana = ROMAJI_TABLE.get(text[i:i + length])
+            if kana:
+                result.append(kana)
+                i += length
+                break
+        else:
+            tail = text[i:]
+            if tail in ROMAJI_PREFIXES:
+                return ''.join(result), tail
+            result.append(char)
+            i += 1
+    return ''.join(result), ''
+
+
+def romaji_completions(tail):
+    """以不完整的羅馬字開頭的所有假名，例如 "ky" 返回 きゃ、きゅ、きょ
+
+    作為前綴搜索時 き 已經包括 きゃ，所以省略以其他候選開頭的假名。
+    """
+    completions = {kana for romaji, kana in ROMAJI_TABLE.items() if romaji.startswith(tail)}
+    return sorted(kana for kana in completions
+                  if not any(kana != other and kana.startswith(other) for other in completions))
+
+
+def query_prefixes(text):
+    """把輸入框中的文字轉換為要搜索的前綴
+
+    羅馬字轉換為平假名；結尾不完整的羅馬字展開為所有可能的假名，
+    所以一邊輸入一邊搜索時 "tab" 也能找到 たべる。
+    """
+    text = normalize(text)
+    if not text:
+        return []
+    if not any(char.isascii() and char.isalpha() for char in text):
+        return [text]
+    kana, tail = romaji_to_hiragana(text)
+    if not tail:
+        return [kana]
+    return [kana + completion for completion in romaji_completions(tail)]
@@ -0,0 +1,264 @@
+import os
+import sys
+import time
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from paths import get_download_path
+
+# inotify 事件，見 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """通過 ctypes 使用 Linux 的 inotify，只提供監視器需要的最少功能"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self.watches = {}  # 監視描述符 -> 目錄
+
+    def add_watch(self, path):
+        """監視目錄，已監視的目錄不會重複添加"""
+        if path in self.watches.values():
+            return
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def remove_watch(self, path):
+        """停止監視目錄"""
+        for wd, watched in list(self.watches.items()):
+            if watched == path:
+                self._rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read_changed(self):
+        """讀取所有待處理的事件，返回 (有變化的目錄集合, 是否丟失了事件)"""
+        changed = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + name_len
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                path = self.watches.get(wd)
+                if path is None:
+                    continue
+                # 目錄本身被刪除或移走時，由其父目錄的重新掃描處理
+                changed.add(os.path.dirname(path) if mask & (IN_DELETE_SELF | IN_MOVE_SELF) else path)
+                if mask & IN_IGNORED:
+                    del self.watches[wd]
+        return changed, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LibraryWatcher(QObject):
+    """在後台監視下載目錄，保持媒體庫和內存中的視頻-字幕對照表最新
+
+    Linux 上使用 inotify，其他系統或 inotify 不可用時定期增量掃描。
+    yt_dlp 合併視頻時會在短時間內產生大量事件，收到事件後等待一段時間沒有新事件才重新掃描。
+    """
+
+    # 定義信號
+    library_changed = pyqtSignal(list)  # 重新掃描過的目錄列表
+
+    DEBOUNCE_SECONDS = 0.5  # 最後一個事件之後等待的時間
+    MAX_DELAY_SECONDS = 5.0  # 持續有事件時最長的等待時間
+    POLL_INTERVAL_SECONDS = 2.0  # 沒有 inotify 時的掃描間隔
+
+    def __init__(self, library, root=None):
+        """初始化監視器
+
+        Args:
+            library: MediaLibrary 媒體庫
+            root: 監視的目錄，默認為下載目錄
+        """
+        super().__init__()
+        self.library = library
+        self.root = os.path.abspath(root or get_download_path())
+        self._subtitles = {}  # 視頻路徑 -> 字幕路徑
+        self._lock = threading.Lock()
+        self._stop_read, self._stop_write = os.pipe()
+        self._stopping = False
+        self._thread = None
+        self.ready = threading.Event()  # 第一次掃描完成
+
+    def start(self):
+        """啟動監視線程"""
+        if self._thread or self._stopping:
+            return
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止監視線程並關閉停止信號的管道，之後不能再次啟動"""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        if self._thread:
+            os.write(self._stop_write, b'x')
+            self._thread.join(timeout=2)
+            if self._thread.is_alive():
+                # 線程仍在掃描，管道由線程退出時關閉，避免關閉後文件描述符被重用
+                return
+            self._thread = None
+        self._close_pipe()
+
+    def _close_pipe(self):
+        """關閉停止信號的管道，可以重複調用"""
+        with self._lock:
+            if self._stop_read is None:
+                return
+            os.close(self._stop_read)
+            os.close(self._stop_write)
+            self._stop_read = self._stop_write = None
+
+    def subtitles_for(self, video_path):
+        """從內存對照表查詢視頻的字幕
+
+        Returns:
+            (是否在對照表中, 字幕路徑)，字幕路徑的格式與 MediaLibrary.recent() 相同
+        """
+        video_path = os.path.abspath(video_path)
+        with self._lock:
+            if video_path in self._subtitles:
+                return True, self._subtitles[video_path]
+        return False, None
+
+    def _run(self):
+        """監視線程主循環"""
+        inotify = None
+        if sys.platform.startswith('linux'):
+            try:
+                inotify = Inotify()
+            except (OSError, AttributeError) as e:
+                print(f"inotify 不可用，改為定期掃描: {e}")
+
+        try:
+            # 先開始監視再掃描，掃描期間發生的變化不會遺漏
+            if inotify:
+                inotify.add_watch(self.root)
+            self.library.scan(self.root)
+            if inotify:
+                self._sync_watches(inotify)
+                # 子目錄在開始監視之前的變化
+                self.library.scan(self.root)
+            self._refresh()
+            self.ready.set()
+
+            if inotify:
+                self._watch_inotify(inotify)
+            else:
+                self._watch_polling()
+        except Exception as e:
+            print(f"監視下載目錄失敗: {e}")
+        finally:
+            if inotify:
+                inotify.close()
+            if self._stopping:
+                self._close_pipe()
+
+    def _stopped(self, timeout):
+        """等待停止信號，收到時返回 True"""
+        readable, _, _ = select.select([self._stop_read], [], [], timeout)
+        return bool(readable)
+
+    def _watch_polling(self):
+        """定期增量掃描，目錄修改時間不變時只需 stat"""
+        while not self._stopped(self.POLL_INTERVAL_SECONDS):
+            rescanned = self.library.scan(self.root)
+            if rescanned:
+                self._refresh(rescanned)
+
+    def _watch_inotify(self, inotify):
+        """等待 inotify 事件，合併一批事件後重新掃描有變化的目錄"""
+        while True:
+            readable, _, _ = select.select([inotify.fd, self._stop_read], [], [])
+            if self._stop_read in readable:
+                return
+
+            changed, overflow = inotify.read_changed()
+            deadline = time.monotonic() + self.MAX_DELAY_SECONDS
+            # 繼續收集事件，直到一段時間內沒有新事件
+            while True:
+                timeout = min(self.DEBOUNCE_SECONDS, deadline - time.monotonic())
+                if timeout <= 0:
+                    break
+                readable, _, _ = select.select([inotify.fd, self._stop_read], [], [], timeout)
+                if self._stop_read in readable:
+                    return
+                if not readable:
+                    break
+                more, more_overflow = inotify.read_changed()
+                changed |= more
+                overflow |= more_overflow
+
+            if overflow:
+                # 事件隊列溢出，無法知道哪些目錄有變化
+                rescanned = self.library.scan(self.root)
+            else:
+                rescanned = []
+                for path in changed:
+                    if path == self.root or path.startswith(self.root.rstrip(os.sep) + os.sep):
+                        rescanned.extend(self.library.scan(path, force=True))
+            self._sync_watches(inotify)
+            if rescanned:
+                self._refresh(rescanned)
+
+    def _sync_watches(self, inotify):
+        """監視媒體庫中記錄的所有目錄，包括新建的子目錄"""
+        directories = set(self.library.directories(self.root))
+        for path in set(inotify.watches.values()) - directories:
+            inotify.remove_watch(path)
+        for path in directories:
+            inotify.add_watch(path)
+
+    def _refresh(self, directories=None):
+        """更新內存中這些目錄的視頻-字幕對照表，None 表示重建整個對照表"""
+        known = set(self.library.directories(self.root))
+        if directories is None:
+            subtitles = self.library.subtitle_map(known)
+            with self._lock:
+                self._subtitles = subtitles
+            return
+
+        subtitles = self.library.subtitle_map(directories)
+        # 被刪除的子目錄已從媒體庫移除，其中的視頻也要從對照表移除
+        known -= set(directories)
+        with self._lock:
+            self._subtitles = {path: subtitle for path, subtitle in self._subtitles.items()
+                               if os.path.dirname(path) in known}
+            self._subtitles.update(subtitles)
+        self.library_changed.emit(sorted(directories))
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from download_manager import video_key
+from paths import get_download_path, SUBTITLE_CACHE_DIR, DOWNLOAD_MANIFEST_DIR
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm', '.m4v')
+SUBTITLE_EXTENSIONS = ('.vtt', '.srt')
+
+# 字幕語言代碼，按優先順序排列
+JP_LANGS = ('ja', 'jp', 'jpn')
+ZH_LANGS = ('zh-Hant', 'zh-TW', 'zh')
+
+# 掃描時跳過的緩存目錄
+SKIP_DIRS = (SUBTITLE_CACHE_DIR, DOWNLOAD_MANIFEST_DIR)
+
+# yt_dlp 下載和合併過程中的臨時文件，例如 'a.f137.mp4'、'a.temp.mp4'、'a.mp4.part'
+PARTIAL_FILE_PATTERN = re.compile(r'\.(f\d+|temp)\.\w+$|\.(part|ytdl)$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    video_path TEXT NOT NULL UNIQUE,
+    directory TEXT NOT NULL,
+    title TEXT NOT NULL,
+    url TEXT,
+    video_key TEXT,
+    added_at TEXT NOT NULL,
+    played_at TEXT
+);
+CREATE TABLE IF NOT EXISTS subtitles (
+    video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+    language TEXT NOT NULL,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_videos_title ON videos(title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_videos_url ON videos(url);
+CREATE INDEX IF NOT EXISTS idx_videos_key ON videos(video_key);
+CREATE INDEX IF NOT EXISTS idx_videos_directory ON videos(directory);
+DROP INDEX IF EXISTS idx_videos_played;
+CREATE INDEX IF NOT EXISTS idx_videos_played_at ON videos(played_at);
+CREATE INDEX IF NOT EXISTS idx_subtitles_video ON subtitles(video_id);
+CREATE INDEX IF NOT EXISTS idx_subtitles_language ON subtitles(language, video_id);
+CREATE INDEX IF NOT EXISTS idx_directories_parent ON directories(parent);
+"""
+
+
+def now():
+    """當前時間字符串，與 recent.json 的格式相同"""
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def subtitle_language(subtitle_path, base_path):
+    """返回字幕文件的語言代碼，例如 ('a.ja.vtt', 'a') -> 'ja'
+
+    字幕與視頻同名時返回空字符串，不屬於這個視頻時返回 None。
+    """
+    stem = os.path.splitext(subtitle_path)[0]
+    if stem == base_path:
+        return ''
+    base, _, language = stem.rpartition('.')
+    return language if base == base_path else None
+
+
+def pick_subtitles(subtitles):
+    """從 {語言代碼: 路徑} 中選出日文和繁體中文字幕
+
+    Returns:
+        {'jp': 路徑, 'zh': 路徑} 字典，兩種都沒有時返回無語言代碼的字幕路徑或 None
+    """
+    picked = {
+        'jp': next((subtitles[lang] for lang in JP_LANGS if lang in subtitles), None),
+        'zh': next((subtitles[lang] for lang in ZH_LANGS if lang in subtitles), None),
+    }
+    if picked['jp'] or picked['zh']:
+        return picked
+    return subtitles.get('')
+
+
+class MediaLibrary:
+    """已下載視頻及其字幕的 SQLite 索引
+
+    記錄每個視頻的標題、網址和各語言字幕文件，支持按標題、網址和字幕語言查詢。
+    掃描目錄時只重新列出修改時間有變化的目錄。
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or get_download_path("library.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """關閉數據庫"""
+        with self._lock:
+            self._conn.close()
+
+    def import_recent_file(self, recent_file):
+        """導入舊版的 recent.json 最近視頻列表，只在資料庫為空時執行"""
+        if not os.path.exists(recent_file):
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM videos LIMIT 1").fetchone():
+                return
+        try:
+            with open(recent_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except Exception as e:
+            print(f"導入最近視頻列表失敗: {e}")
+            return
+
+        # 列表中最新的在最前面
+        for record in reversed(records):
+            video_path = record.get('video_path')
+            if not video_path or not os.path.exists(video_path):
+                continue
+            self.add_video(video_path, record.get('subtitle_path'), record.get('title'),
+                           record.get('url'), played_at=record.get('timestamp'))
+
+    def add_video(self, video_path, subtitle_paths=None, title=None, url=None, played_at=None):
+        """添加或更新視頻記錄
+
+        Args:
+            video_path: 視頻文件路徑
+            subtitle_paths: {'jp': 路徑, 'zh': 路徑} 字典或單個字幕路徑，None 時在視頻旁邊查找
+            title: 視頻標題，默認使用文件名
+            url: 視頻網址
+            played_at: 最近播放時間，None 表示當前時間
+        """
+        video_path = os.path.abspath(video_path)
+        base_path = os.path.splitext(video_path)[0]
+        title = title or os.path.basename(base_path)
+        played_at = played_at or now()
+
+        if isinstance(subtitle_paths, dict):
+            subtitle_paths = [path for path in subtitle_paths.values() if path]
+        elif subtitle_paths:
+            subtitle_paths = [subtitle_paths]
+        else:
+            subtitle_paths = self._sibling_subtitles(base_path)
+
+        subtitles = []
+        for path in subtitle_paths:
+            language = subtitle_language(os.path.abspath(path), base_path)
+            if language is None:
+                # 字幕文件名與視頻不同，使用文件名中最後一段作為語言代碼
+                stem = os.path.splitext(os.path.basename(path))[0]
+                language = stem.rpartition('.')[2] if '.' in stem else ''
+            subtitles.append((language, os.path.abspath(path)))
+
+        with self._lock, self._conn:
+            video_id = self._upsert_video(video_path, title, url, played_at)
+            self._replace_subtitles(video_id, subtitles)
+
+    def _upsert_video(self, video_path, title, url, played_at=None):
+        """插入或更新視頻記錄，返回視頻 ID，調用時需持有鎖"""
+        key = video_key(url) if url else None
+        row = self._conn.execute("SELECT id, url FROM videos WHERE video_path = ?", (video_path,)).fetchone()
+        if row:
+            # 掃描目錄得到的記錄沒有網址，不能覆蓋下載時保存的網址
+            self._conn.execute(
+                "UPDATE videos SET title = ?, url = COALESCE(?, url), video_key = COALESCE(?, video_key),"
+                " played_at = COALESCE(?, played_at) WHERE id = ?",
+                (title, url, key, played_at, row['id']))
+            return row['id']
+        cursor = self._conn.execute(
+            "INSERT INTO videos (video_path, directory, title, url, video_key, added_at, played_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (video_path, os.path.dirname(video_path), title, url, key, now(), played_at))
+        return cursor.lastrowid
+
+    def _replace_subtitles(self, video_id, subtitles):
+        """更新視頻的字幕列表，subtitles 為 (語言代碼, 路徑) 列表，調用時需持有鎖"""
+        self._conn.execute("DELETE FROM subtitles WHERE video_id = ?", (video_id,))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO subtitles (video_id, language, path) VALUES (?, ?, ?)",
+            [(video_id, language, path) for language, path in subtitles])
+
+    def _sibling_subtitles(self, base_path):
+        """列出與視頻同名的字幕文件"""
+        directory = os.path.dirname(base_path)
+        prefix = os.path.basename(base_path) + '.'
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        return [os.path.join(directory, name) for name in names
+                if name.startswith(prefix) and name.endswith(SUBTITLE_EXTENSIONS)
+                and subtitle_language(os.path.join(directory, name), base_path) is not None]
+
+    def mark_played(self, video_path):
+        """更新視頻的最近播放時間"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE videos SET played_at = ? WHERE video_path = ?",
+                               (now(), os.path.abspath(video_path)))
+
+    def remove_video(self, video_path):
+        """刪除視頻記錄"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM videos WHERE video_path = ?", (os.path.abspath(video_path),))
+
+    def _records(self, rows):
+        """把查詢結果轉換為與 recent.json 相同格式的字典，調用時需持有鎖"""
+        rows = list(rows)
+        subtitles = {}
+        if rows:
+            ids = [row['id'] for row in rows]
+            placeholders = ','.join('?' * len(ids))
+            for sub in self._conn.execute(
+                    f"SELECT video_id, language, path FROM subtitles WHERE video_id IN ({placeholders})", ids):
+                subtitles.setdefault(sub['video_id'], {})[sub['language']] = sub['path']
+
+        return [{
+            'title': row['title'],
+            'video_path': row['video_path'],
+            'subtitle_path': pick_subtitles(subtitles.get(row['id'], {})),
+            'languages': sorted(subtitles.get(row['id'], {})),
+            'url': row['url'],
+            'timestamp': row['played_at'] or row['added_at'],
+        } for row in rows]
+
+    def recent(self, limit=10):
+        """最近播放或下載的視頻，掃描目錄時找到但從未播放過的視頻不包括在內"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM videos WHERE played_at IS NOT NULL ORDER BY played_at DESC LIMIT ?", (limit,))
+            return self._records(rows)
+
+    def get(self, video_path):
+        """按視頻路徑查詢，找不到返回 None"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM videos WHERE video_path = ?", (os.path.abspath(video_path),))
+            records = self._records(rows)
+        return records[0] if records else None
+
+    def find_by_url(self, url):
+        """查詢同一個視頻（按 YouTube 視頻 ID 比較）的所有本地記錄"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM videos WHERE video_key = ? ORDER BY COALESCE(played_at, added_at) DESC",
+                (video_key(url),))
+            return self._records(rows)
+
+    def search(self, text='', language=None, limit=100):
+        """按標題或網址搜索視頻
+
+        Args:
+            text: 標題或網址中包含的文字，空字符串表示不限
+            language: 只返回有這種語言字幕的視頻，例如 'ja'
+            limit: 最多返回的記錄數
+        """
+        conditions = []
+        params = []
+        if text:
+            # 包含匹配不能用索引縮小範圍：按標題的 NOCASE 索引順序掃描，找到 limit 條後停止
+            pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(title LIKE ? ESCAPE '\\' OR url LIKE ? ESCAPE '\\')")
+            params.extend([pattern, pattern])
+        if language:
+            conditions.append("EXISTS (SELECT 1 FROM subtitles s WHERE s.video_id = videos.id AND s.language = ?)")
+            params.append(language)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM videos {where} ORDER BY title COLLATE NOCASE LIMIT ?", params + [limit])
+            return self._records(rows)
+
+    def subtitle_map(self, directories=None):
+        """返回 {視頻路徑: 字幕路徑} 字典，字幕路徑的格式與 recent() 的 subtitle_path 相同
+
+        Args:
+            directories: 只包含這些目錄中的視頻，None 表示全部
+        """
+        with self._lock:
+            if directories is None:
+                rows = self._conn.execute("SELECT * FROM videos")
+            else:
+                directories = list(directories)
+                placeholders = ','.join('?' * len(directories))
+                rows = self._conn.execute(f"SELECT * FROM videos WHERE directory IN ({placeholders})", directories)
+            return {record['video_path']: record['subtitle_path'] for record in self._records(rows)}
+
+    def directories(self, root=None):
+        """列出已掃描的目錄"""
+        root = os.path.abspath(root or get_download_path())
+        with self._lock:
+            nested = root.rstrip(os.sep) + os.sep
+            rows = self._conn.execute("SELECT path FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+                                      (root, len(nested), nested))
+            return [row['path'] for row in rows]
+
+    def languages(self):
+        """列出資料庫中所有字幕語言及對應的視頻數量"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT language, COUNT(DISTINCT video_id) AS count FROM subtitles GROUP BY language ORDER BY language")
+            return {row['language']: row['count'] for row in rows}
+
+    def scan(self, directory=None, recursive=True, force=False):
+        """增量掃描目錄中的視頻和字幕
+
+        只重新列出修改時間變化的目錄，未變化的目錄直接使用資料庫中記錄的子目錄。
+
+        Args:
+            directory: 要掃描的目錄，默認為下載目錄
+            recursive: 是否掃描子目錄
+            force: 是否忽略修改時間，重新列出 directory 本身
+
+        Returns:
+            重新列出的目錄列表
+        """
+        directory = os.path.abspath(directory or get_download_path())
+        pending = [directory]
+        rescanned = []
+        while pending:
+            path = pending.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                with self._lock, self._conn:
+                    self._forget_directory(path)
+                continue
+
+            with self._lock:
+                row = self._conn.execute("SELECT mtime_ns FROM directories WHERE path = ?", (path,)).fetchone()
+                if row and row['mtime_ns'] == mtime_ns and not (force and path == directory):
+                    subdirs = [r['path'] for r in self._conn.execute(
+                        "SELECT path FROM directories WHERE parent = ?", (path,))]
+                else:
+                    subdirs = None
+            if subdirs is None:
+                subdirs = self._scan_directory(path, mtime_ns)
+                rescanned.append(path)
+            if recursive:
+                pending.extend(subdirs)
+        return rescanned
+
+    def _scan_directory(self, path, mtime_ns):
+        """重新列出一個目錄，同步其中的視頻和字幕記錄，返回子目錄列表"""
+        videos = []
+        subtitle_files = []
+        subdirs = []
+        try:
+            entries = list(os.scandir(path))
+        except OSError as e:
+            print(f"掃描目錄失敗: {path}: {e}")
+            return []
+
+        for entry in entries:
+            if entry.is_dir():
+                if entry.path not in SKIP_DIRS and not entry.name.startswith('.'):
+                    subdirs.append(entry.path)
+                continue
+            if PARTIAL_FILE_PATTERN.search(entry.name):
+                continue
+            ext = os.path.splitext(entry.name)[1].lower()
+            if ext in VIDEO_EXTENSIONS:
+                videos.append(entry.path)
+            elif ext in SUBTITLE_EXTENSIONS:
+                subtitle_files.append(entry.path)
+
+        # 把字幕歸到同名的視頻下，沒有對應視頻的字幕忽略
+        subtitles = {os.path.splitext(video_path)[0]: [] for video_path in videos}
+        for subtitle_path in subtitle_files:
+            stem = os.path.splitext(subtitle_path)[0]
+            if stem in subtitles:
+                subtitles[stem].append(('', subtitle_path))
+                continue
+            base, _, language = stem.rpartition('.')
+            if base in subtitles:
+                subtitles[base].append((language, subtitle_path))
+
+        with self._lock, self._conn:
+            known = {row['video_path']: row['id'] for row in self._conn.execute(
+                "SELECT id, video_path FROM videos WHERE directory = ?", (path,))}
+            for video_path in videos:
+                base_path = os.path.splitext(video_path)[0]
+                if video_path in known:
+                    video_id = known.pop(video_path)
+                else:
+                    video_id = self._upsert_video(video_path, os.path.basename(base_path), None)
+                self._replace_subtitles(video_id, subtitles[base_path])
+            # 已被刪除的視頻
+            self._conn.executemany("DELETE FROM videos WHERE id = ?", [(video_id,) for video_id in known.values()])
+
+            # 已被刪除的子目錄
+            removed = [row['path'] for row in self._conn.execute(
+                "SELECT path FROM directories WHERE parent = ?", (path,)) if row['path'] not in subdirs]
+            for subdir in removed:
+                self._forget_directory(subdir)
+            self._conn.execute("INSERT OR REPLACE INTO directories (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                               (path, os.path.dirname(path), mtime_ns))
+        return subdirs
+
+    def _forget_directory(self, path):
+        """刪除已不存在的目錄及其所有子目錄中的視頻記錄，調用時需持有鎖"""
+        nested = path.rstrip(os.sep) + os.sep
+        self._conn.execute("DELETE FROM videos WHERE directory = ? OR substr(directory, 1, ?) = ?",
+                           (path, len(nested), nested))
+        self._conn.execute("DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+                           (path, len(nested), nested))
@@ -1,5 +1,7 @@
 import os
+import math
 import platform
+from time import monotonic
 try:
     import vlc
 except ImportError:
@@ -16,6 +18,11 @@ from PyQt6.QtGui import QIcon
 class MediaPlayer(QWidget):
     """媒體播放器組件"""
     
+    POLL_INTERVAL_MS = 500    # 輪詢間隔，只用於更新進度條和校正字幕計時器的漂移
+    MIN_EVENT_DELAY_MS = 10   # 字幕計時器的最短間隔
+    DRIFT_TOLERANCE_MS = 300  # 推算的位置與播放器時間相差超過這個值才重新校準，播放器時間更新較粗
+    RESYNC_DELAY_MS = 100     # 開始播放或跳轉後等待播放器時間更新再重新同步
+    
     # 定義信號
     position_changed = pyqtSignal(int)  # 播放位置變化（毫秒）
     media_loaded = pyqtSignal(bool)     # 媒體加載狀態
@@ -36,11 +43,18 @@ class MediaPlayer(QWidget):
         # 初始化UI
         self.init_ui()
         
-        # 設置更新計時器
+        # 設置更新計時器，只在播放時運行
         self.update_timer = QTimer(self)
-        self.update_timer.setInterval(500)  # 每500毫秒更新一次
+        self.update_timer.setInterval(self.POLL_INTERVAL_MS)
         self.update_timer.timeout.connect(self.update_position)
-        self.update_timer.start()
+        
+        # 字幕計時器：在下一次字幕變化時觸發一次，不需要高頻輪詢
+        self.next_event_provider = None  # 函數: 當前時間（秒） -> 下一次字幕變化時間（秒）或 None
+        self._clock_anchor = None  # (播放器時間毫秒, 單調時鐘秒)，用於推算兩次輪詢之間的播放位置
+        self.subtitle_timer = QTimer(self)
+        self.subtitle_timer.setSingleShot(True)
+        self.subtitle_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.subtitle_timer.timeout.connect(self._on_subtitle_timer)
 
     def init_ui(self):
         """初始化用戶界面"""
@@ -162,9 +176,13 @@ class MediaPlayer(QWidget):
             
         self.player.play()
         self.is_playing = True
+        self.update_timer.start()
         self.play_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPause))
         self.play_state_changed.emit(True)
         
+        # 播放器開始播放後再同步字幕計時器
+        QTimer.singleShot(self.RESYNC_DELAY_MS, self.resync)
+        
     def pause(self):
         """暫停播放"""
         if not self.is_playing:
@@ -172,6 +190,8 @@ class MediaPlayer(QWidget):
             
         self.player.pause()
         self.is_playing = False
+        self.subtitle_timer.stop()
+        self.update_timer.stop()
         self.play_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
         self.play_state_changed.emit(False)
         
@@ -179,6 +199,8 @@ class MediaPlayer(QWidget):
         """停止播放"""
         self.player.stop()
         self.is_playing = False
+        self.subtitle_timer.stop()
+        self.update_timer.stop()
         self.play_button.setIcon(self.style().standardIcon(QStyle.StandardPixmap.SP_MediaPlay))
         self.play_state_changed.emit(False)
         
@@ -218,6 +240,7 @@ class MediaPlayer(QWidget):
         
         # 設置播放位置
         self.player.set_position(pos)
+        self._after_seek(int(pos * self.player.get_length()))
     
     def seek_relative(self, offset_ms):
         """相對尋找位置（毫秒）"""
@@ -232,9 +255,75 @@ class MediaPlayer(QWidget):
             new_time = min(new_time, max_time)
             
         self.player.set_time(new_time)
+        self._after_seek(new_time)
+    
+    def set_next_event_provider(self, provider):
+        """設置計算下一次字幕變化時間的函數，傳入 None 則只使用輪詢"""
+        self.next_event_provider = provider
+        self.resync()
+    
+    def _after_seek(self, target_ms):
+        """跳轉後立即按目標位置更新字幕，並在播放器時間更新後重新同步"""
+        if target_ms >= 0:
+            self.position_changed.emit(target_ms)
+            self._schedule_next_event(target_ms)
+        QTimer.singleShot(self.RESYNC_DELAY_MS, self.resync)
+    
+    def resync(self):
+        """按播放器當前時間更新字幕並重新設置字幕計時器"""
+        if not self.is_media_loaded:
+            return
+        
+        time = self.player.get_time()
+        if time >= 0:
+            self.position_changed.emit(time)
+            self._schedule_next_event(time)
+        # 暫停時跳轉也要更新進度條
+        self.update_position()
+    
+    def _estimated_time(self):
+        """根據上一次同步的播放器時間和經過的時間推算當前播放位置（毫秒）"""
+        if self._clock_anchor is None:
+            return self.player.get_time()
+        
+        anchor_time, anchor_clock = self._clock_anchor
+        rate = self.player.get_rate() or 1.0
+        return anchor_time + (monotonic() - anchor_clock) * 1000 * rate
+    
+    def _schedule_next_event(self, time_ms):
+        """記錄當前播放位置，並在下一次字幕變化時觸發單次字幕計時器"""
+        self.subtitle_timer.stop()
+        self._clock_anchor = None
+        
+        if not (self.is_media_loaded and self.is_playing and self.next_event_provider) or time_ms < 0:
+            return
+        
+        self._clock_anchor = (time_ms, monotonic())
+        
+        next_event = self.next_event_provider(time_ms / 1000.0)
+        if next_event is None:
+            return
+        
+        # 字幕在結束時間點仍然顯示，所以在變化時間之後 1 毫秒觸發
+        rate = self.player.get_rate() or 1.0
+        delay = math.ceil((next_event * 1000 - time_ms) / rate) + 1
+        self.subtitle_timer.start(max(self.MIN_EVENT_DELAY_MS, delay))
+    
+    def _on_subtitle_timer(self):
+        """字幕計時器觸發時按推算的播放位置發射位置信號"""
+        if self._clock_anchor is None:
+            return
+        
+        time = int(self._estimated_time())
+        self.position_changed.emit(time)
+        self._schedule_next_event(time)
     
     def update_position(self):
-        """更新位置信息"""
+        """更新進度條和時間標籤，並校正字幕計時器的漂移
+
+        字幕只在字幕計時器觸發和跳轉時更新，這裡不發射位置信號：
+        播放器時間更新較粗，落後於推算的位置，發射後可能把剛換上的字幕換回上一條。
+        """
         if not self.is_media_loaded:
             return
             
@@ -248,16 +337,23 @@ class MediaPlayer(QWidget):
             return
             
         # 獲取當前時間
-        time = self.player.get_time()
+        player_time = self.player.get_time()
+        time = player_time
+        if self._clock_anchor is not None:
+            estimated = self._estimated_time()
+            if abs(estimated - player_time) <= self.DRIFT_TOLERANCE_MS:
+                time = estimated
+            else:
+                # 漂移過大，按播放器時間重新設置字幕計時器
+                self._schedule_next_event(player_time)
+        elif self.is_playing:
+            self._schedule_next_event(player_time)
         
         # 更新滑塊位置
         self.position_slider.setValue(int(1000 * time / length))
         
         # 更新時間標籤
         self.time_label.setText(f"{self.format_time(time)} / {self.format_time(length)}")
-        
-        # 發射位置變化信號
-        self.position_changed.emit(time)
     
     def format_time(self, milliseconds):
         """格式化時間（毫秒轉為分:秒）"""
@@ -272,10 +368,12 @@ class MediaPlayer(QWidget):
     
     def resume_update_timer(self):
         """恢復更新計時器（當滑塊被釋放時）"""
-        self.update_timer.start()
+        if self.is_playing:
+            self.update_timer.start()
         
     def cleanup(self):
         """清理資源"""
         self.update_timer.stop()
+        self.subtitle_timer.stop()
         self.player.stop()
         self.player.release()
\ No newline at end of file
@@ -7,11 +7,15 @@ PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 ASSETS_DIR = os.path.join(PROJECT_ROOT, "assets")
 DOWNLOADS_DIR = os.path.join(PROJECT_ROOT, "downloads")
 DICTIONARY_DIR = os.path.join(PROJECT_ROOT, "dictionary")
+SUBTITLE_CACHE_DIR = os.path.join(DOWNLOADS_DIR, "subtitle_cache")
+DOWNLOAD_MANIFEST_DIR = os.path.join(DOWNLOADS_DIR, "manifest")
 
 # 確保目錄存在
 os.makedirs(ASSETS_DIR, exist_ok=True)
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 os.makedirs(DICTIONARY_DIR, exist_ok=True)
+os.makedirs(SUBTITLE_CACHE_DIR, exist_ok=True)
+os.makedirs(DOWNLOAD_MANIFEST_DIR, exist_ok=True)
 
 # 輔助函數
 def get_asset_path(asset_name):
@@ -33,3 +37,15 @@ def get_dictionary_path(filename=None):
     if filename:
         return os.path.join(DICTIONARY_DIR, filename)
     return DICTIONARY_DIR
+
+def get_subtitle_cache_path(filename=None):
+    """獲取字幕緩存文件路徑"""
+    if filename:
+        return os.path.join(SUBTITLE_CACHE_DIR, filename)
+    return SUBTITLE_CACHE_DIR
+
+def get_manifest_path(filename=None):
+    """獲取下載任務記錄文件路徑"""
+    if filename:
+        return os.path.join(DOWNLOAD_MANIFEST_DIR, filename)
+    return DOWNLOAD_MANIFEST_DIR
\ No newline at end of file
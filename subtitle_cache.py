@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+from cue_track import CueTrack
+from subtitle_index import SubtitleIndex
+from token_table import TokenTable
+from paths import get_subtitle_cache_path
+
+# 緩存文件格式:
+#   MAGIC | 頭部長度 (uint32) | JSON 頭部 | 補齊到 8 字節 | 數據區
+# 數據區按字幕軌依次存放: 開始時間 float64[n]、結束時間 float64[n]、文本偏移 int64[n+1]、UTF-8 文本、
+# 時間索引的邊界 float64[m] 和時間段 int32[2m+1]
+# 日文字幕軌分詞後還有分詞表的各列 int32 和字符串表（偏移 int64[k+1]、UTF-8 文本）
+MAGIC = b'JPSUBC\x00\x01'
+CACHE_VERSION = 4
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _align(offset):
+    """把偏移量向上取整到 8 字節"""
+    return offset + (-offset % 8)
+
+
+def file_digest(path):
+    """計算文件內容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SubtitleCache:
+    """已解析並同步的字幕軌及其時間索引的磁盤緩存
+
+    以字幕文件路徑作為緩存文件名，並記錄字幕文件的大小、修改時間和內容哈希。
+    大小和修改時間不變時直接使用緩存；修改時間變了但內容哈希相同時也視為有效，
+    並把新的修改時間寫回緩存，之後不再重新計算哈希；否則刪除舊緩存，重新解析。
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or get_subtitle_cache_path()
+
+    def _cache_path(self, sources):
+        """根據字幕文件路徑生成緩存文件路徑"""
+        key = '|'.join(os.path.abspath(sources[lang]) if sources.get(lang) else ''
+                       for lang in ('jp', 'zh'))
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.bin'
+        return os.path.join(self.cache_dir, name)
+
+    def _source_info(self, path, with_digest=True):
+        """獲取字幕文件的路徑、大小、修改時間和內容哈希"""
+        stat = os.stat(path)
+        info = {
+            'path': os.path.abspath(path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        if with_digest:
+            info['sha256'] = file_digest(path)
+        return info
+
+    def _is_fresh(self, sources, recorded):
+        """檢查緩存記錄的字幕文件信息是否仍然有效
+
+        修改時間變了但內容哈希相同時，把 recorded 中的修改時間更新為當前值。
+
+        Returns:
+            (是否有效, 是否更新了修改時間)
+        """
+        touched = False
+        for lang in ('jp', 'zh'):
+            path = sources.get(lang)
+            entry = recorded.get(lang)
+            if not path:
+                if entry:
+                    return False, False
+                continue
+            if not entry or not os.path.exists(path):
+                return False, False
+
+            current = self._source_info(path, with_digest=False)
+            if current['path'] != entry['path'] or current['size'] != entry['size']:
+                return False, False
+            # 修改時間變化（例如重新下載同一個文件）時比較內容哈希
+            if current['mtime_ns'] != entry['mtime_ns']:
+                if file_digest(path) != entry['sha256']:
+                    return False, False
+                entry['mtime_ns'] = current['mtime_ns']
+                touched = True
+        return True, touched
+
+    def load(self, sources):
+        """讀取緩存的字幕軌
+
+        Args:
+            sources: 字幕文件路徑字典 {'jp': path1, 'zh': path2}
+
+        Returns:
+            (字幕軌字典, 時間索引字典, 日文字幕的 TokenTable 或 None)，緩存不存在或已失效時返回 None
+        """
+        cache_path = self._cache_path(sources)
+        if not os.path.exists(cache_path):
+            return None
+
+        tracks = None
+        touched = False
+        try:
+            with open(cache_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if mm[:len(MAGIC)] != MAGIC:
+                    raise ValueError("緩存文件格式不正確")
+                header_len, = struct.unpack_from('<I', mm, len(MAGIC))
+                header_start = len(MAGIC) + 4
+                header = json.loads(mm[header_start:header_start + header_len].decode('utf-8'))
+                data_start = _align(header_start + header_len)
+
+                fresh, touched = (self._is_fresh(sources, header['sources'])
+                                  if header.get('version') == CACHE_VERSION else (False, False))
+                if fresh:
+                    tracks = {}
+                    indexes = {}
+                    for lang in ('jp', 'zh'):
+                        meta = header['tracks'][lang]
+                        tracks[lang] = self._read_track(mm, data_start, meta, tracks)
+                        indexes[lang] = self._read_index(mm, data_start, meta, tracks[lang])
+                    tokens_meta = header['tracks']['jp'].get('tokens')
+                    tokens = self._read_tokens(mm, data_start, tokens_meta, tracks['jp']) if tokens_meta else None
+                else:
+                    print("字幕緩存已失效，重新解析字幕")
+        except Exception as e:
+            print(f"讀取字幕緩存失敗: {e}")
+            tracks = None
+
+        if tracks is None:
+            self.invalidate(sources)
+            return None
+        if touched:
+            self._rewrite_header(cache_path, header, data_start)
+        return tracks, indexes, tokens
+
+    def _rewrite_header(self, cache_path, header, data_start):
+        """以新的頭部重寫緩存文件，數據區原樣複製"""
+        try:
+            with open(cache_path, 'rb') as f:
+                f.seek(data_start)
+                self._write(cache_path, header, [f.read()])
+        except Exception as e:
+            print(f"更新字幕緩存失敗: {e}")
+
+    def _write(self, cache_path, header, sections):
+        """寫入頭部和數據段"""
+        header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        prefix = MAGIC + struct.pack('<I', len(header)) + header
+
+        # 先寫入臨時文件再替換，避免讀到寫了一半的緩存；
+        # 主線程和分詞線程可能同時保存同一個緩存，每次寫入使用不同的臨時文件
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(cache_path) + '.', suffix='.tmp',
+                                         dir=os.path.dirname(cache_path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(prefix)
+                f.write(b'\x00' * (_align(len(prefix)) - len(prefix)))
+                for data in sections:
+                    f.write(data)
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read_track(self, mm, data_start, meta, tracks):
+        """從內存映射中讀取一條字幕軌"""
+        count = meta['count']
+        if meta.get('shared_times'):
+            # 同步後的字幕軌與另一條字幕軌共用時間軸
+            other = tracks[meta['shared_times']]
+            starts, ends = other.starts, other.ends
+        else:
+            starts = array('d')
+            starts.frombytes(mm[data_start + meta['starts']:data_start + meta['starts'] + 8 * count])
+            ends = array('d')
+            ends.frombytes(mm[data_start + meta['ends']:data_start + meta['ends'] + 8 * count])
+
+        # 文本偏移以字符計算，整段解碼一次後再切分
+        offsets = array('q')
+        offsets.frombytes(mm[data_start + meta['offsets']:data_start + meta['offsets'] + 8 * (count + 1)])
+        text_start = data_start + meta['texts']
+        blob = mm[text_start:text_start + meta['texts_size']].decode('utf-8')
+        texts = [sys.intern(blob[offsets[i]:offsets[i + 1]]) for i in range(count)]
+
+        return CueTrack(starts, ends, texts)
+
+    def _read_index(self, mm, data_start, meta, track):
+        """從內存映射中讀取時間索引"""
+        bounds = array('d')
+        bounds.frombytes(mm[data_start + meta['bounds']:data_start + meta['bounds'] + 8 * meta['bounds_count']])
+        slots = array('i')
+        slots.frombytes(mm[data_start + meta['slots']:data_start + meta['slots'] + 4 * (2 * meta['bounds_count'] + 1)])
+        return SubtitleIndex.from_arrays(track, bounds, slots)
+
+    def _read_tokens(self, mm, data_start, meta, track):
+        """從內存映射中讀取日文字幕的分詞表"""
+        def read_column(name, count):
+            column = array('i')
+            column.frombytes(mm[data_start + meta[name]:data_start + meta[name] + 4 * count])
+            return column
+
+        columns = {name: read_column(name, meta['count']) for name in TokenTable.FIELDS if name != 'cue_offsets'}
+        columns['cue_offsets'] = read_column('cue_offsets', len(track) + 1)
+
+        offsets = array('q')
+        offsets.frombytes(mm[data_start + meta['string_offsets']:
+                             data_start + meta['string_offsets'] + 8 * (meta['string_count'] + 1)])
+        text_start = data_start + meta['strings']
+        blob = mm[text_start:text_start + meta['strings_size']].decode('utf-8')
+        strings = [sys.intern(blob[offsets[i]:offsets[i + 1]]) for i in range(meta['string_count'])]
+        return TokenTable(track.texts, strings=strings, **columns)
+
+    def save(self, sources, tracks, indexes, tokens=None):
+        """保存已解析的字幕軌
+
+        Args:
+            sources: 字幕文件路徑字典 {'jp': path1, 'zh': path2}
+            tracks: 字幕軌字典 {'jp': CueTrack, 'zh': CueTrack}
+            indexes: 對應的時間索引字典 {'jp': SubtitleIndex, 'zh': SubtitleIndex}
+            tokens: 日文字幕的 TokenTable，還沒有分詞時為 None
+        """
+        cache_path = self._cache_path(sources)
+        try:
+            recorded = {lang: self._source_info(sources[lang])
+                        for lang in ('jp', 'zh') if sources.get(lang)}
+
+            # 數據段的偏移量相對於數據區開頭，每段按 8 字節對齊
+            sections = []
+            track_meta = {}
+            size = 0
+
+            def add_section(data):
+                nonlocal size
+                position = size
+                padding = _align(len(data)) - len(data)
+                sections.append(data + b'\x00' * padding)
+                size += len(data) + padding
+                return position
+
+            for lang in ('jp', 'zh'):
+                track = CueTrack.from_cues(tracks.get(lang) or [])
+                meta = {'count': len(track)}
+                if lang == 'zh' and len(track) and track.starts is getattr(tracks.get('jp'), 'starts', None):
+                    meta['shared_times'] = 'jp'
+                else:
+                    meta['starts'] = add_section(array('d', track.starts).tobytes())
+                    meta['ends'] = add_section(array('d', track.ends).tobytes())
+
+                offsets = array('q', [0])
+                for text in track.texts:
+                    offsets.append(offsets[-1] + len(text))
+                encoded = ''.join(track.texts).encode('utf-8')
+                meta['offsets'] = add_section(offsets.tobytes())
+                meta['texts'] = add_section(encoded)
+                meta['texts_size'] = len(encoded)
+
+                index = indexes[lang]
+                meta['bounds_count'] = len(index.bounds)
+                meta['bounds'] = add_section(array('d', index.bounds).tobytes())
+                meta['slots'] = add_section(array('i', index.slots).tobytes())
+
+                if lang == 'jp' and tokens is not None:
+                    token_meta = {'count': len(tokens)}
+                    for name in TokenTable.FIELDS:
+                        token_meta[name] = add_section(getattr(tokens, name).tobytes())
+                    string_offsets = array('q', [0])
+                    for value in tokens.strings:
+                        string_offsets.append(string_offsets[-1] + len(value))
+                    encoded = ''.join(tokens.strings).encode('utf-8')
+                    token_meta['string_count'] = len(tokens.strings)
+                    token_meta['string_offsets'] = add_section(string_offsets.tobytes())
+                    token_meta['strings'] = add_section(encoded)
+                    token_meta['strings_size'] = len(encoded)
+                    meta['tokens'] = token_meta
+                track_meta[lang] = meta
+
+            self._write(cache_path, {
+                'version': CACHE_VERSION,
+                'sources': recorded,
+                'tracks': track_meta,
+            }, sections)
+        except Exception as e:
+            print(f"保存字幕緩存失敗: {e}")
+
+    def invalidate(self, sources):
+        """刪除指定字幕文件的緩存"""
+        try:
+            os.remove(self._cache_path(sources))
+        except OSError:
+            pass
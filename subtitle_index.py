@@ -0,0 +1,113 @@
+from array import array
+from bisect import bisect_left
+import heapq
+from cue_track import CueTrack
+
+
+class SubtitleIndex:
+    """字幕時間索引，用於在播放時快速查找當前字幕
+
+    加載字幕時把所有字幕的起止時間切分成互不重疊的時間段，
+    並預先計算每個時間段應顯示的字幕，之後每次查詢只需二分查找。
+    查詢結果與逐條掃描完全一致：若多條字幕同時覆蓋某個時間點，
+    返回列表中排在最前面的那一條。
+    """
+
+    def __init__(self, cues, default_duration=5):
+        """建立索引
+
+        Args:
+            cues: CueTrack 字幕軌，或每條為包含 'start_seconds'、'end_seconds' 的字典列表
+            default_duration: 缺少結束時間時假設的顯示秒數
+        """
+        self.cues = cues
+        self.bounds = array('d')   # 所有不重複的起止時間，已排序
+        self.slots = array('i')    # 每個時間段對應的字幕索引，-1 表示無字幕
+        self._cursor = 0           # 上一次查詢落在的位置，順序播放時可跳過二分查找
+        self._build(default_duration)
+
+    @classmethod
+    def from_arrays(cls, cues, bounds, slots):
+        """使用預先計算好的時間段創建索引，例如從字幕緩存讀取"""
+        index = cls.__new__(cls)
+        index.cues = cues
+        index.bounds = bounds
+        index.slots = slots
+        index._cursor = 0
+        return index
+
+    def _build(self, default_duration):
+        """掃描線方式計算每個時間段的字幕"""
+        if isinstance(self.cues, CueTrack):
+            # 列式存儲可以直接使用時間列
+            starts = self.cues.starts
+            ends = self.cues.ends
+        else:
+            starts = []
+            ends = []
+            for cue in self.cues:
+                start = cue['start_seconds']
+                starts.append(start)
+                ends.append(cue.get('end_seconds', start + default_duration))
+
+        self.bounds = array('d', sorted(set(starts) | set(ends)))
+
+        # 按開始時間排序的字幕順序
+        order = sorted(range(len(self.cues)), key=starts.__getitem__)
+
+        # 時間段編號：2i+1 為時間點 bounds[i]，2i 為開區間 (bounds[i-1], bounds[i])
+        slots = array('i', [-1]) * (2 * len(self.bounds) + 1)
+        active = []  # (字幕索引, 結束時間) 的最小堆，已過期的條目延遲移除
+        pos = 0
+        for i, t in enumerate(self.bounds):
+            while pos < len(order) and starts[order[pos]] <= t:
+                idx = order[pos]
+                heapq.heappush(active, (idx, ends[idx]))
+                pos += 1
+
+            # 時間點 t：結束時間 >= t 的字幕仍然有效
+            while active and active[0][1] < t:
+                heapq.heappop(active)
+            if active:
+                slots[2 * i + 1] = active[0][0]
+
+            # 開區間 (t, 下一個時間點)：結束時間必須 > t
+            while active and active[0][1] <= t:
+                heapq.heappop(active)
+            if active:
+                slots[2 * i + 2] = active[0][0]
+
+        self.slots = slots
+
+    def _locate(self, t):
+        """返回 bisect_left(bounds, t)，優先嘗試上一次的位置及其後一個位置"""
+        bounds = self.bounds
+        n = len(bounds)
+        for i in (self._cursor, self._cursor + 1):
+            if i <= n and (i == 0 or bounds[i - 1] < t) and (i == n or t <= bounds[i]):
+                return i
+        return bisect_left(bounds, t)
+
+    def lookup(self, t):
+        """返回時間 t（秒）應顯示的字幕，沒有則返回 None"""
+        if not self.bounds:
+            return None
+
+        i = self._locate(t)
+        self._cursor = i
+
+        if i < len(self.bounds) and self.bounds[i] == t:
+            idx = self.slots[2 * i + 1]
+        else:
+            idx = self.slots[2 * i]
+
+        return self.cues[idx] if idx >= 0 else None
+
+    def next_boundary(self, t):
+        """返回不早於時間 t（秒）的下一個字幕起止時間點，沒有則返回 None
+
+        字幕在結束時間點仍然顯示，因此 t 剛好落在某個時間點上時返回 t 本身，
+        調用方應在該時間點之後再查詢字幕。
+        """
+        i = bisect_left(self.bounds, t)
+        return self.bounds[i] if i < len(self.bounds) else None
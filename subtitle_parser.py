@@ -0,0 +1,102 @@
+import os
+import re
+from cue_track import CueTrack, parse_timestamp
+
+# 字幕文本中的標籤，例如 <c>、<i>、卡拉OK字幕的 <00:00:01.000>
+CUE_TEXT_TAGS = re.compile('<.*?>')
+
+# VTT 中不屬於字幕的區塊
+VTT_SKIP_BLOCKS = ('NOTE', 'STYLE', 'REGION')
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def iter_lines(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """按塊讀取文件並逐行產出，不需要一次讀入整個文件"""
+    # 通用換行模式會把 '\r\n' 和 '\r' 統一轉換為 '\n'
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        pending = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (pending + chunk).split('\n')
+            # 最後一行可能不完整，留到下一塊再處理
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+
+
+def iter_blocks(lines):
+    """把逐行輸入按空行分成區塊"""
+    block = []
+    for line in lines:
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def parse_block(block):
+    """解析一個字幕區塊，返回 (開始秒數, 結束秒數, 文本)，不是字幕時返回 None"""
+    for i, line in enumerate(block):
+        if '-->' in line:
+            start, _, rest = line.partition('-->')
+            # VTT 的結束時間後面可能跟着位置等設置
+            end = rest.split()[0] if rest.split() else ''
+            try:
+                start_seconds = parse_timestamp(start)
+                end_seconds = parse_timestamp(end)
+            except ValueError:
+                return None
+            # 與 webvtt-py 一致，文本行保留原來的空白
+            text = '\n'.join(block[i + 1:])
+            return start_seconds, end_seconds, CUE_TEXT_TAGS.sub('', text)
+    return None
+
+
+def iter_cues(path, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """流式解析 VTT 或 SRT 字幕文件，逐條產出 (開始秒數, 結束秒數, 文本)
+
+    Args:
+        path: 字幕文件路徑
+        start: 只需要這個時間（秒）之後仍在顯示的字幕
+        end: 只需要這個時間（秒）之前開始的字幕，讀到之後的字幕就停止讀取文件
+        chunk_size: 每次讀取的字符數
+    """
+    is_vtt = os.path.splitext(path)[1].lower() != '.srt'
+    first = True
+
+    for block in iter_blocks(iter_lines(path, chunk_size)):
+        if first:
+            first = False
+            if block[0].startswith('WEBVTT'):
+                # 文件頭，可能帶有 Kind/Language 等元數據
+                is_vtt = True
+                continue
+        if is_vtt and block[0].split(' ', 1)[0] in VTT_SKIP_BLOCKS:
+            continue
+
+        cue = parse_block(block)
+        if cue is None:
+            continue
+
+        cue_start, cue_end, text = cue
+        if end is not None and cue_start > end:
+            # 字幕按開始時間排序，之後的字幕都不在時間範圍內
+            break
+        if start is not None and cue_end < start:
+            continue
+        yield cue
+
+
+def read_subtitle_file(path, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """讀取 VTT 或 SRT 字幕文件為列式字幕軌，參數與 iter_cues 相同"""
+    track = CueTrack()
+    for cue_start, cue_end, text in iter_cues(path, start, end, chunk_size):
+        track.append(cue_start, cue_end, text)
+    return track
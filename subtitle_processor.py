@@ -1,10 +1,18 @@
-import webvtt
 import os
+import time
+import threading
 from PyQt6.QtCore import QObject, pyqtSignal
-import fugashi
 import requests
-import json
-from pathlib import Path
+import japanese_tagger
+from subtitle_index import SubtitleIndex
+from cue_track import CueTrack
+from subtitle_parser import read_subtitle_file
+from subtitle_cache import SubtitleCache
+from token_table import TokenTable, tokenize_texts
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class SubtitleProcessor(QObject):
     """字幕處理器，支持讀取、解析和翻譯字幕"""
@@ -13,27 +21,31 @@ class SubtitleProcessor(QObject):
     subtitles_loaded = pyqtSignal(dict)  # 字幕字典 {'jp': [...], 'zh': [...]}
     translation_finished = pyqtSignal(list)  # 翻譯後的字幕列表 - 保留以維持兼容性
     word_analyzed = pyqtSignal(dict)  # 單詞分析結果
+    cue_translated = pyqtSignal(int)  # 批量翻譯寫入了一條中文字幕 (字幕索引)
+    tokens_ready = pyqtSignal(int)  # 日文字幕分詞完成 (詞數)
     
     def __init__(self):
         """初始化字幕處理器"""
         super().__init__()
-        self.subtitles = {'jp': [], 'zh': []}
+        self.subtitles = {'jp': CueTrack(), 'zh': CueTrack()}
         self.translated_subtitles = []  # 保留以維持兼容性
-        
-        # 初始化日語分詞器 (暫時跳過)
-        self.tagger = None
-        print("注意: 日語分詞器未啟用，單詞分析功能將不可用")
-        
-        # 加載緩存的翻譯
-        self.translation_cache = {}
-        self.load_translation_cache()
+        self.subtitle_index = {'jp': None, 'zh': None}  # 字幕時間索引
+        self.subtitle_cache = SubtitleCache()  # 已解析字幕的磁盤緩存
+        self.translator = None  # BatchTranslator，沒有官方中文字幕時用於翻譯整條字幕軌
+        self.tokens = None  # 日文字幕的分詞表 TokenTable，在後台生成
+    
+    def reset(self):
+        """清空字幕和分詞表，停止上一條字幕軌的翻譯"""
+        self.subtitles = {'jp': CueTrack(), 'zh': CueTrack()}
+        self.tokens = None
+        if self.translator:
+            self.translator.cancel()
     
     def load_subtitles(self, subtitle_paths):
         """加載字幕文件
            subtitle_paths 可以是字符串(單個字幕文件)或字典{'jp': path1, 'zh': path2}
         """
-        # 重置字幕
-        self.subtitles = {'jp': [], 'zh': []}
+        self.reset()
         
         # 處理不同的輸入類型
         if isinstance(subtitle_paths, str):
@@ -49,35 +61,93 @@ class SubtitleProcessor(QObject):
             self.subtitles_loaded.emit(self.subtitles)
             return self.subtitles
         
+        # 優先使用已解析並同步過的緩存
+        sources = {
+            'jp': jp_path if jp_path and os.path.exists(jp_path) else None,
+            'zh': zh_path if zh_path and os.path.exists(zh_path) else None,
+        }
+        cached = self.subtitle_cache.load(sources) if sources['jp'] or sources['zh'] else None
+        if cached:
+            self.subtitles, self.subtitle_index, self.tokens = cached
+            print(f"從緩存加載字幕，日文 {len(self.subtitles['jp'])} 條，中文 {len(self.subtitles['zh'])} 條")
+        else:
+            parsed = self._parse_subtitles(sources['jp'], sources['zh'])
+            
+            # 建立時間索引，播放時查找字幕不需要逐條掃描
+            for lang in ('jp', 'zh'):
+                self._get_index(lang)
+            
+            if parsed:
+                self.subtitle_cache.save(sources, self.subtitles, self.subtitle_index)
+            else:
+                sources = None
+        
+        # 在後台為日文字幕分詞，完成後一起寫入緩存
+        if self.subtitles['jp'] and self.tokens is None:
+            self._tokenize_in_background(sources)
+        
+        # 為保持兼容性，設置translated_subtitles
+        if self.subtitles['zh']:
+            self.translated_subtitles = self.subtitles['zh']
+        
+        # 發射信號
+        self.subtitles_loaded.emit(self.subtitles)
+        return self.subtitles
+    
+    def _tokenize_in_background(self, sources):
+        """在進程池中為日文字幕分詞
+        
+        Args:
+            sources: 字幕文件路徑字典，分詞結果與字幕一起寫入緩存；None 表示不寫入緩存
+        """
+        track = CueTrack.from_cues(self.subtitles['jp'])
+        # 保存當前的字幕和索引，批量翻譯生成的中文字幕不寫入緩存
+        subtitles = dict(self.subtitles)
+        indexes = dict(self.subtitle_index)
+        
+        def tokenize():
+            started = time.monotonic()
+            tokenized = tokenize_texts(track.texts)
+            if tokenized is None:
+                return
+            tokens = TokenTable.from_tokens(track.texts, tokenized)
+            # 分詞期間換了字幕時丟棄結果
+            if self.subtitles['jp'] is not subtitles['jp']:
+                return
+            self.tokens = tokens
+            print(f"日文字幕分詞完成: {len(track)} 條字幕，{len(tokens)} 個詞，"
+                  f"耗時 {time.monotonic() - started:.2f} 秒")
+            if sources:
+                self.subtitle_cache.save(sources, subtitles, indexes, tokens)
+            self.tokens_ready.emit(len(tokens))
+        
+        threading.Thread(target=tokenize, name="subtitle-tokenizer", daemon=True).start()
+    
+    def vocabulary(self, limit=None):
+        """返回日文字幕中出現次數最多的詞 [(詞根, 次數)]，還沒有分詞完成時返回空列表"""
+        tokens = self.tokens
+        if tokens is None:
+            return []
+        return tokens.vocabulary().most_common(limit)
+    
+    def _parse_subtitles(self, jp_path, zh_path):
+        """解析字幕文件並同步時間軸，全部成功且至少有一種字幕時返回 True"""
+        success = True
+        
         # 加載日文字幕
-        if jp_path and os.path.exists(jp_path):
+        if jp_path:
             try:
-                jp_subtitles = []
-                for caption in webvtt.read(jp_path):
-                    jp_subtitles.append({
-                        'start': caption.start,
-                        'end': caption.end,
-                        'start_seconds': caption.start_in_seconds,
-                        'end_seconds': caption.end_in_seconds,
-                        'text': caption.text
-                    })
+                jp_subtitles = read_subtitle_file(jp_path)
                 self.subtitles['jp'] = jp_subtitles
                 print(f"成功加載日文字幕，共 {len(jp_subtitles)} 條")
             except Exception as e:
                 print(f"加載日文字幕失敗: {e}")
+                success = False
         
         # 加載繁體中文字幕
-        if zh_path and os.path.exists(zh_path):
+        if zh_path:
             try:
-                zh_subtitles = []
-                for caption in webvtt.read(zh_path):
-                    zh_subtitles.append({
-                        'start': caption.start,
-                        'end': caption.end,
-                        'start_seconds': caption.start_in_seconds,
-                        'end_seconds': caption.end_in_seconds,
-                        'text': caption.text
-                    })
+                zh_subtitles = read_subtitle_file(zh_path)
                 self.subtitles['zh'] = zh_subtitles
                 print(f"成功加載繁體中文字幕，共 {len(zh_subtitles)} 條")
                 
@@ -90,29 +160,30 @@ class SubtitleProcessor(QObject):
                     )
             except Exception as e:
                 print(f"加載繁體中文字幕失敗: {e}")
+                success = False
         
-        # 為保持兼容性，設置translated_subtitles
-        if self.subtitles['zh']:
-            self.translated_subtitles = self.subtitles['zh']
-        
-        # 發射信號
-        self.subtitles_loaded.emit(self.subtitles)
-        return self.subtitles
+        return success and bool(jp_path or zh_path)
     
-    def align_subtitle_timing(self, jp_subtitles, zh_subtitles):
-        """改進的字幕同步方法，處理中文字幕提前顯示的情況"""
+    def align_subtitle_timing(self, jp_subtitles, zh_subtitles, method='sweep'):
+        """改進的字幕同步方法，處理中文字幕提前顯示的情況
+        
+        Args:
+            jp_subtitles: 日文字幕軌（CueTrack 或字典列表）
+            zh_subtitles: 中文字幕軌（CueTrack 或字典列表）
+            method: 'sweep' 使用掃描線配對；'numpy' 使用 NumPy 重疊矩陣，適合批量處理
+        """
         if not jp_subtitles or not zh_subtitles:
             return zh_subtitles
                 
         print(f"字幕同步: 日文字幕 {len(jp_subtitles)} 條, 中文字幕 {len(zh_subtitles)} 條")
         
-        aligned_zh_subtitles = []
+        jp_track = CueTrack.from_cues(jp_subtitles)
+        zh_track = CueTrack.from_cues(zh_subtitles)
         
         # 針對問題的解決方案：分割過長的中文字幕
         # 首先處理一些中文字幕可能包含多句內容的情況
-        processed_zh_subtitles = []
-        for sub in zh_subtitles:
-            text = sub['text']
+        processed_zh_subtitles = CueTrack()
+        for start, end, text in zip(zh_track.starts, zh_track.ends, zh_track.texts):
             # 檢查文本是否包含可能的分句標記（如句號、換行等）
             if '\n' in text or '。' in text or '. ' in text:
                 parts = text.replace('\n', '。').replace('. ', '。').split('。')
@@ -120,137 +191,155 @@ class SubtitleProcessor(QObject):
                 
                 if len(parts) > 1:
                     # 將一條字幕分成多條
-                    duration = sub['end_seconds'] - sub['start_seconds']
+                    duration = end - start
                     part_duration = duration / len(parts)
                     
                     for i, part in enumerate(parts):
-                        new_start = sub['start_seconds'] + i * part_duration
+                        new_start = start + i * part_duration
                         new_end = new_start + part_duration
-                        
-                        processed_zh_subtitles.append({
-                            'start': sub['start'],  # 保持原始格式
-                            'end': sub['end'],      # 保持原始格式
-                            'start_seconds': new_start,
-                            'end_seconds': new_end,
-                            'text': part.strip()
-                        })
+                        processed_zh_subtitles.append(new_start, new_end, part.strip())
                 else:
-                    processed_zh_subtitles.append(sub)
+                    processed_zh_subtitles.append(start, end, text)
             else:
-                processed_zh_subtitles.append(sub)
+                processed_zh_subtitles.append(start, end, text)
+        
+        # 為每條日文字幕找出時間重疊最多的中文字幕
+        if method == 'numpy' and np is not None:
+            best_matches = self._match_overlap_matrix(jp_track, processed_zh_subtitles)
+        else:
+            best_matches = self._match_overlap_sweep(jp_track, processed_zh_subtitles)
         
-        # 對日文字幕逐一配對中文字幕
-        for jp_sub in jp_subtitles:
-            jp_start = jp_sub['start_seconds']
-            jp_end = jp_sub['end_seconds']
-            jp_text = jp_sub['text']
+        # 新的中文字幕直接共用日文字幕的時間軸，找不到對應的中文字幕時使用空字幕
+        aligned_zh_subtitles = jp_track.with_texts(
+            processed_zh_subtitles.texts[best] if best >= 0 else ""
+            for best in best_matches
+        )
+        
+        print(f"字幕同步完成，生成 {len(aligned_zh_subtitles)} 條同步中文字幕")
+        return aligned_zh_subtitles
+    
+    def _match_overlap_sweep(self, jp_track, zh_track):
+        """掃描線配對：按開始時間排序後用雙指針維護與當前日文字幕可能重疊的中文字幕
+        
+        返回與 jp_track 等長的列表，每項為重疊時間最長的中文字幕索引，沒有則為 -1。
+        重疊時間相同時選擇排在前面的中文字幕。
+        """
+        jp_starts, jp_ends = jp_track.starts, jp_track.ends
+        zh_starts, zh_ends = zh_track.starts, zh_track.ends
+        jp_order = sorted(range(len(jp_track)), key=jp_starts.__getitem__)
+        zh_order = sorted(range(len(zh_track)), key=zh_starts.__getitem__)
+        
+        best_matches = [-1] * len(jp_track)
+        active = []  # 已開始且可能仍在顯示的中文字幕索引
+        pos = 0
+        
+        for jp_idx in jp_order:
+            jp_start = jp_starts[jp_idx]
+            jp_end = jp_ends[jp_idx]
             
-            # 嘗試找到時間重疊的中文字幕
-            matching_zh_subs = []
-            for zh_sub in processed_zh_subtitles:
-                zh_start = zh_sub['start_seconds']
-                zh_end = zh_sub['end_seconds']
-                
-                # 檢查時間重疊
-                if (zh_start <= jp_end and zh_end >= jp_start):
-                    matching_zh_subs.append(zh_sub)
+            # 加入在日文字幕結束前開始的中文字幕
+            while pos < len(zh_order) and zh_starts[zh_order[pos]] < jp_end:
+                active.append(zh_order[pos])
+                pos += 1
             
-            # 如果找到多條匹配的中文字幕，選擇時間重疊最多的
-            best_zh_sub = None
-            max_overlap = 0
+            # 移除已經結束的中文字幕，之後的日文字幕開始得更晚，也不會再與它們重疊
+            active = [i for i in active if zh_ends[i] > jp_start]
             
-            for zh_sub in matching_zh_subs:
-                zh_start = zh_sub['start_seconds']
-                zh_end = zh_sub['end_seconds']
-                
-                # 計算重疊時間
-                overlap_start = max(jp_start, zh_start)
-                overlap_end = min(jp_end, zh_end)
-                overlap = max(0, overlap_end - overlap_start)
-                
-                if overlap > max_overlap:
+            best_idx = -1
+            max_overlap = 0
+            for zh_idx in active:
+                overlap = max(0, min(jp_end, zh_ends[zh_idx]) - max(jp_start, zh_starts[zh_idx]))
+                if overlap > max_overlap or (overlap == max_overlap and overlap > 0 and zh_idx < best_idx):
                     max_overlap = overlap
-                    best_zh_sub = zh_sub
+                    best_idx = zh_idx
             
-            # 創建新的中文字幕條目，使用日文字幕的時間軸
-            if best_zh_sub:
-                aligned_zh_sub = {
-                    'start': jp_sub['start'],
-                    'end': jp_sub['end'],
-                    'start_seconds': jp_sub['start_seconds'],
-                    'end_seconds': jp_sub['end_seconds'],
-                    'text': best_zh_sub['text']
-                }
-            else:
-                # 如果找不到對應的中文字幕，創建一個空的
-                aligned_zh_sub = {
-                    'start': jp_sub['start'],
-                    'end': jp_sub['end'],
-                    'start_seconds': jp_sub['start_seconds'],
-                    'end_seconds': jp_sub['end_seconds'],
-                    'text': ""  # 空字幕
-                }
+            best_matches[jp_idx] = best_idx
+        
+        return best_matches
+    
+    def _match_overlap_matrix(self, jp_track, zh_track, block_size=4_000_000):
+        """NumPy 配對：分塊計算日文與中文字幕的重疊時間矩陣並取每行最大值"""
+        best_matches = [-1] * len(jp_track)
+        if not jp_track or not zh_track:
+            return best_matches
+        
+        jp_start = np.frombuffer(jp_track.starts, dtype=np.float64)
+        jp_end = np.frombuffer(jp_track.ends, dtype=np.float64)
+        zh_start = np.frombuffer(zh_track.starts, dtype=np.float64)
+        zh_end = np.frombuffer(zh_track.ends, dtype=np.float64)
+        
+        # 每次處理的日文字幕行數，限制矩陣大小避免佔用過多內存
+        rows = max(1, block_size // len(zh_track))
+        
+        for row in range(0, len(jp_track), rows):
+            block = slice(row, row + rows)
+            overlap = (np.minimum(jp_end[block, None], zh_end[None, :])
+                       - np.maximum(jp_start[block, None], zh_start[None, :]))
+            best = overlap.argmax(axis=1)  # 相同時取第一個，與逐條比較一致
+            has_overlap = overlap[np.arange(len(best)), best] > 0
             
-            aligned_zh_subtitles.append(aligned_zh_sub)
+            for offset in np.flatnonzero(has_overlap):
+                best_matches[row + offset] = int(best[offset])
         
-        print(f"字幕同步完成，生成 {len(aligned_zh_subtitles)} 條同步中文字幕")
-        return aligned_zh_subtitles
+        return best_matches
     
     def translate_subtitles(self, target_language="zh-TW"):
         """翻譯字幕
            注意：如果已經有繁體中文字幕，這個方法什麼也不做
+           
+           沒有中文字幕時創建與日文字幕共用時間軸的空白中文字幕軌，
+           由批量翻譯器在後台逐條填入譯文。
         """
         # 如果已經有繁體中文字幕，直接返回
         if self.subtitles['zh']:
-            self.translation_finished.emit(self.subtitles['zh'])
+            self.translation_finished.emit(list(self.subtitles['zh']))
             return self.subtitles['zh']
             
         # 如果沒有日文字幕或中文字幕，則無法進行翻譯
         if not self.subtitles['jp']:
             print("沒有日文字幕可翻譯")
             return []
-            
-        print("未找到官方中文字幕，建議使用專業翻譯服務API進行翻譯")
-        return []
+        
+        if not self.translator:
+            print("未找到官方中文字幕，建議使用專業翻譯服務API進行翻譯")
+            return []
+        
+        jp_track = CueTrack.from_cues(self.subtitles['jp'])
+        zh_track = jp_track.with_texts("" for _ in range(len(jp_track)))
+        self.subtitles['zh'] = zh_track
+        self.translated_subtitles = zh_track
+        
+        def on_translated(index, text):
+            # 翻譯期間換了字幕時丟棄結果
+            if self.subtitles['zh'] is zh_track:
+                zh_track.set_text(index, text)
+                self.cue_translated.emit(index)
+        
+        self.translator.start(jp_track.texts, on_translated, "ja", target_language)
+        return zh_track
     
     def analyze_word(self, word):
         """分析日語單詞"""
-        if not word or not self.tagger:
-            # 返回基本信息
-            word_info = {
-                'surface': word,
-                'lemma': word,
-                'pos': '未知',
-                'pronunciation': word,
-            }
-            self.word_analyzed.emit(word_info)
-            return word_info
-            
-        try:
-            # 使用fugashi進行形態素分析
-            words = self.tagger.parse(word)
-            
-            if not words:
-                return None
-                
-            # 提取第一個單詞的信息
-            word_obj = words[0]
-            
-            # 構建單詞信息
-            word_info = {
-                'surface': word_obj.surface,  # 單詞表面形式
-                'lemma': word_obj.feature.lemma or word_obj.surface,  # 詞根形式
-                'pos': word_obj.feature.pos,  # 詞性
-                'pronunciation': word_obj.feature.pronunciation,  # 發音
-            }
-            
-            # 發射信號
-            self.word_analyzed.emit(word_info)
-            
-            return word_info
-        except Exception as e:
-            print(f"分析單詞失敗: {e}")
-            
+        word_info = None
+        tokens = self.tokens
+        if word and tokens is not None:
+            # 字幕中出現過的詞直接從分詞表查找
+            token = tokens.find(word)
+            if token:
+                word_info = {
+                    'surface': token['surface'],
+                    'lemma': token['lemma'],
+                    'pos': token['pos'],
+                    'pronunciation': token['reading'],
+                }
+        if word and word_info is None:
+            try:
+                # 使用fugashi進行形態素分析，分詞器未加載完時等待加載完成
+                word_info = japanese_tagger.analyze(word)
+            except Exception as e:
+                print(f"分析單詞失敗: {e}")
+        
+        if word_info is None:
             # 返回基本信息
             word_info = {
                 'surface': word,
@@ -258,50 +347,28 @@ class SubtitleProcessor(QObject):
                 'pos': '未知',
                 'pronunciation': word,
             }
-            self.word_analyzed.emit(word_info)
-            return word_info
-    
-    def load_translation_cache(self):
-        """加載翻譯緩存"""
-        cache_path = Path('downloads/translation_cache.json')
-        if cache_path.exists():
-            try:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    self.translation_cache = json.load(f)
-            except Exception as e:
-                print(f"加載翻譯緩存失敗: {e}")
-                self.translation_cache = {}
+        
+        # 發射信號
+        self.word_analyzed.emit(word_info)
+        return word_info
     
-    def save_translation_cache(self):
-        """保存翻譯緩存"""
-        cache_path = Path('downloads/translation_cache.json')
-        try:
-            cache_path.parent.mkdir(exist_ok=True)
-            with open(cache_path, 'w', encoding='utf-8') as f:
-                json.dump(self.translation_cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"保存翻譯緩存失敗: {e}")
+    def _get_index(self, lang):
+        """獲取字幕時間索引，字幕列表被替換後自動重建"""
+        index = self.subtitle_index.get(lang)
+        if index is None or index.cues is not self.subtitles[lang]:
+            index = SubtitleIndex(self.subtitles[lang])
+            self.subtitle_index[lang] = index
+        return index
     
     def get_current_subtitle(self, current_time):
         """根據當前時間獲取字幕"""
-        result = {'jp': None, 'zh': None}
-        
-        # 查找當前時間對應的日文字幕
-        for subtitle in self.subtitles['jp']:
-            start_time = subtitle['start_seconds']
-            end_time = subtitle.get('end_seconds', start_time + 5)  # 假設每條字幕顯示5秒
-            
-            if start_time <= current_time <= end_time:
-                result['jp'] = subtitle
-                break
-        
-        # 查找當前時間對應的中文字幕
-        for subtitle in self.subtitles['zh']:
-            start_time = subtitle['start_seconds']
-            end_time = subtitle.get('end_seconds', start_time + 5)  # 假設每條字幕顯示5秒
-            
-            if start_time <= current_time <= end_time:
-                result['zh'] = subtitle
-                break
-        
-        return result
\ No newline at end of file
+        return {
+            'jp': self._get_index('jp').lookup(current_time),
+            'zh': self._get_index('zh').lookup(current_time),
+        }
+    
+    def next_subtitle_change(self, current_time):
+        """返回不早於當前時間（秒）的下一個日文或中文字幕起止時間點，沒有則返回 None"""
+        changes = [self._get_index(lang).next_boundary(current_time) for lang in ('jp', 'zh')]
+        changes = [t for t in changes if t is not None]
+        return min(changes) if changes else None
\ No newline at end of file
@@ -0,0 +1,69 @@
+"""AIAssistant 的請求合併：預取和用戶請求的同一句只調用一次模型"""
+import time
+import threading
+import pytest
+import ai_assistant
+from ai_assistant import AIAssistant, request_key
+from ai_scheduler import PRIORITY_INTERACTIVE
+from translation_cache import TranslationCache
+
+
+class FakeBackend:
+    """記錄調用次數的假後端，收到 release 之前不返回"""
+    name = "fake"
+    chat_model = "fake-chat"
+    translation_model = "fake-translate"
+    max_concurrency = 1
+    max_batch_tokens = 600
+    max_batch_cues = 15
+    stream = False
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+
+    def chat(self, messages, model=None, temperature=0.7, **options):
+        self.calls.append(messages[-1]["content"])
+        self.release.wait(5)
+        return "翻譯：你好"
+
+
+@pytest.fixture
+def assistant(tmp_path, monkeypatch):
+    monkeypatch.setattr(ai_assistant, 'TranslationCache',
+                        lambda: TranslationCache(str(tmp_path / 'translation_cache.sqlite3')))
+    return AIAssistant(backend=FakeBackend())
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_request_key_normalizes_text():
+    assert request_key('translate', " 今日は　いい天気\n", 'ja', 'zh-TW') == \
+        request_key('translate', "今日は いい天気", 'ja', 'zh-TW')
+
+
+def test_translation_joins_prefetch(assistant):
+    # 預取時字幕文本已去掉首尾空白，用戶點擊的字幕帶有換行
+    assert assistant.prefetch_translation("今日は")
+    assistant.translate_text("今日は\n")
+    request = assistant.scheduler.get(request_key('translate', "今日は", 'ja', 'zh-TW'))
+    assert request.group == 'translate'
+    assert request.priority == PRIORITY_INTERACTIVE
+
+    assistant.backend.release.set()
+    wait_for(lambda: assistant.scheduler.get(request_key('translate', "今日は", 'ja', 'zh-TW')) is None)
+    assert assistant.backend.calls == ["今日は"]
+
+
+def test_grammar_joins_prefetch(assistant):
+    assert assistant.prefetch_grammar("今日は")
+    assistant.analyze_grammar(" 今日は ")
+    assert assistant.scheduler.get(request_key('grammar', "今日は")).group == 'grammar'
+    assistant.backend.release.set()
+    wait_for(lambda: assistant.scheduler.get(request_key('grammar', "今日は")) is None)
+    assert len(assistant.backend.calls) == 1
@@ -0,0 +1,123 @@
+"""聊天組件的流式回覆：取消後的新請求、同時進行的回覆"""
+import os
+import time
+import threading
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt6.QtWidgets import QApplication
+import ai_assistant
+from ai_assistant import AIAssistant
+from ai_chat_widget import AIChatWidget, MessageWidget
+from translation_cache import TranslationCache
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def widget(app):
+    widget = AIChatWidget()
+    yield widget
+    widget.deleteLater()
+
+
+def bubbles(widget):
+    """聊天區中的回覆文本，不包括歡迎消息和"正在思考"消息"""
+    thinking = getattr(widget, 'thinking_message', None)
+    items = (widget.chat_layout.itemAt(i).widget() for i in range(widget.chat_layout.count()))
+    return [item.text_label.toPlainText() for item in items
+            if isinstance(item, MessageWidget) and item is not thinking and not item.is_user][1:]
+
+
+def test_cancelled_stream_then_new_reply(widget):
+    widget.current_subtitle = "今日は"
+    widget.request_subtitle_analysis()
+    widget.handle_ai_chunk(1, "第一")
+    widget._flush_chunks()
+
+    # 換到另一句：舊的分析被取消，新的分析命中緩存
+    widget.request_subtitle_analysis()
+    widget.end_ai_response(1)
+    widget.handle_ai_response(2, "緩存的分析")
+    # 取消前已發出的文本晚到，不再顯示
+    widget.handle_ai_chunk(1, "晚到")
+    widget._flush_chunks()
+
+    assert bubbles(widget) == ["第一", "緩存的分析"]
+    assert not hasattr(widget, 'thinking_message')
+    assert widget.streaming_messages == {}
+
+    # 之後的流式回覆使用新的消息
+    widget.handle_ai_chunk(3, "新的")
+    widget._flush_chunks()
+    widget.handle_ai_response(3, "新的回覆")
+    assert bubbles(widget) == ["第一", "緩存的分析", "新的回覆"]
+
+
+def test_concurrent_streams_use_separate_messages(widget):
+    widget.handle_ai_chunk(1, "聊天")
+    widget.handle_ai_chunk(2, "語法")
+    widget.handle_ai_chunk(1, "回覆")
+    widget._flush_chunks()
+    assert bubbles(widget) == ["聊天回覆", "語法"]
+    widget.handle_ai_response(2, "語法分析")
+    widget.handle_ai_response(1, "聊天回覆")
+    assert bubbles(widget) == ["聊天回覆", "語法分析"]
+
+
+class StreamingBackend:
+    """逐段返回文本的假後端，第一段之後等待 release"""
+    name = "fake"
+    chat_model = "fake-chat"
+    translation_model = "fake-translate"
+    max_concurrency = 2
+    max_batch_tokens = 600
+    max_batch_cues = 15
+    stream = True
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def chat_stream(self, messages, model, on_chunk, temperature=0.7, **options):
+        on_chunk("分析")
+        self.release.wait(5)
+        on_chunk("完畢")
+        return "分析完畢", 0.001
+
+
+def process_until(app, condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_grammar_cancel_with_assistant(app, widget, tmp_path, monkeypatch):
+    cache = TranslationCache(str(tmp_path / 'translation_cache.sqlite3'))
+    monkeypatch.setattr(ai_assistant, 'TranslationCache', lambda: cache)
+    backend = StreamingBackend()
+    assistant = AIAssistant(backend=backend)
+    assistant.response_chunk.connect(widget.handle_ai_chunk)
+    assistant.response_ready.connect(widget.handle_ai_response)
+    assistant.response_ended.connect(widget.end_ai_response)
+    cache.put("二文目", "ja", "grammar", backend.chat_model, ai_assistant.GRAMMAR_PROMPT_VERSION, "緩存的分析")
+
+    widget.current_subtitle = "一文目"
+    widget.grammar_analysis_requested.connect(assistant.analyze_grammar)
+    widget.request_subtitle_analysis()
+    process_until(app, lambda: widget.streaming_messages)
+    widget._flush_chunks()
+
+    widget.current_subtitle = "二文目"
+    widget.request_subtitle_analysis()
+    backend.release.set()
+    time.sleep(0.1)
+    process_until(app, lambda: "緩存的分析" in bubbles(widget))
+    widget._flush_chunks()
+    assert bubbles(widget) == ["分析", "緩存的分析"]
+    assert widget.streaming_messages == {}
+    assert not hasattr(widget, 'thinking_message')
@@ -0,0 +1,162 @@
+"""AIClient 對本地 OpenAI 兼容模擬服務器的測試：連接復用、重試、限額和 SSE 流式回覆"""
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from ai_client import AIClient, AIClientError, StreamCancelled, TokenBucket
+
+
+def completion(content):
+    return json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+
+def sse(*chunks):
+    """把文本片段組成 SSE 事件流，中間夾帶註釋行和沒有內容的 delta"""
+    events = [": keep-alive", 'data: {"choices": [{"delta": {"role": "assistant"}}]}']
+    events += [f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False)}"
+               for chunk in chunks]
+    events.append("data: [DONE]")
+    return ''.join(event + "\n\n" for event in events)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.requests.append((self.client_address[1], json.loads(self.rfile.read(length))))
+        status, headers, body = self.server.responses.pop(0) if self.server.responses else (200, {}, completion("好"))
+        body = body.encode('utf-8')
+        self.send_response(status)
+        headers = {'Content-Type': 'application/json', **headers}
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+    httpd.requests = []
+    httpd.responses = []
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = AIClient(f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions", "test-key",
+                      timeout=(1, 5), max_retries=3, backoff_base=0.01, backoff_max=0.05)
+    yield client
+    client.close()
+
+
+def test_chat_reuses_connection(server, client):
+    for _ in range(20):
+        assert client.chat([{"role": "user", "content": "你好"}], "test-model") == "好"
+    assert len(server.requests) == 20
+    assert len({port for port, _ in server.requests}) == 1
+    assert server.requests[0][1]["model"] == "test-model"
+
+
+def test_retries_until_success(server, client):
+    server.responses = [(429, {'retry-after': '0'}, "{}"), (503, {}, "{}"), (429, {}, "{}"),
+                        (200, {}, completion("終於"))]
+    assert client.chat([{"role": "user", "content": "你好"}], "test-model") == "終於"
+    assert len(server.requests) == 4
+
+
+def test_retries_reserve_quota_once(server, client):
+    client.request_bucket = TokenBucket(capacity=10, refill_rate=0.001)
+    client.token_bucket = TokenBucket(capacity=1000, refill_rate=0.001)
+    server.responses = [(503, {}, "{}"), (503, {}, "{}"), (503, {}, "{}"), (200, {}, completion("好"))]
+    client.chat([{"role": "user", "content": "你好"}], "test-model", max_tokens=98)
+    assert len(server.requests) == 4
+    assert client.request_bucket.tokens == pytest.approx(9, abs=0.01)
+    assert client.token_bucket.tokens == pytest.approx(900, abs=0.01)
+
+
+def test_non_retryable_error(server, client):
+    server.responses = [(400, {}, '{"error": "bad request"}')]
+    with pytest.raises(AIClientError) as error:
+        client.chat([{"role": "user", "content": "你好"}], "test-model")
+    assert error.value.status_code == 400
+    assert len(server.requests) == 1
+
+
+def test_gives_up_after_max_retries(server, client):
+    server.responses = [(500, {}, "{}")] * 10
+    with pytest.raises(AIClientError) as error:
+        client.chat([{"role": "user", "content": "你好"}], "test-model")
+    assert error.value.status_code == 500
+    assert len(server.requests) == client.max_retries + 1
+
+
+def test_unreachable_host():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    client = AIClient(f"http://127.0.0.1:{port}/v1/chat/completions", "test-key",
+                      timeout=(0.5, 1), max_retries=2, backoff_base=0.01, backoff_max=0.05)
+    with pytest.raises(AIClientError) as error:
+        client.chat([{"role": "user", "content": "你好"}], "test-model")
+    assert error.value.status_code is None
+    client.close()
+
+
+def test_rate_limit_headers_calibrate_buckets(server, client):
+    server.responses = [(200, {'x-ratelimit-limit-requests': '5', 'x-ratelimit-remaining-requests': '4',
+                               'x-ratelimit-reset-requests': '200ms', 'x-ratelimit-limit-tokens': '1000',
+                               'x-ratelimit-remaining-tokens': '900', 'x-ratelimit-reset-tokens': '6m0s'},
+                         completion("好"))]
+    client.chat([{"role": "user", "content": "你好"}], "test-model")
+    assert client.request_bucket.capacity == 5
+    assert client.request_bucket.refill_rate == pytest.approx(5.0)
+    assert client.token_bucket.capacity == 1000
+    assert client.token_bucket.tokens <= 900
+
+
+def test_chat_stream(server, client):
+    server.responses = [(200, {'Content-Type': 'text/event-stream'}, sse("你", "好", "呀"))]
+    chunks = []
+    text, first_token_time = client.chat_stream([{"role": "user", "content": "你好"}], "test-model",
+                                                chunks.append)
+    assert chunks == ["你", "好", "呀"]
+    assert text == "你好呀"
+    assert first_token_time is not None and first_token_time >= 0
+    assert server.requests[0][1]["stream"] is True
+
+
+def test_chat_stream_without_content(server, client):
+    server.responses = [(200, {'Content-Type': 'text/event-stream'}, sse())]
+    assert client.chat_stream([{"role": "user", "content": "你好"}], "test-model", print) == ('', None)
+
+
+def test_chat_stream_cancelled(server, client):
+    server.responses = [(200, {'Content-Type': 'text/event-stream'}, sse("你", "好", "呀"))]
+    chunks = []
+
+    def on_chunk(chunk):
+        chunks.append(chunk)
+        raise StreamCancelled()
+
+    with pytest.raises(StreamCancelled):
+        client.chat_stream([{"role": "user", "content": "你好"}], "test-model", on_chunk)
+    assert chunks == ["你"]
+    # 中止後的連接已關閉，之後的請求仍然正常
+    assert client.chat([{"role": "user", "content": "你好"}], "test-model") == "好"
+
+
+def test_chat_stream_bad_event(server, client):
+    server.responses = [(200, {'Content-Type': 'text/event-stream'}, "data: not json\n\n")]
+    with pytest.raises(AIClientError):
+        client.chat_stream([{"role": "user", "content": "你好"}], "test-model", print)
@@ -0,0 +1,157 @@
+"""align_subtitle_timing 與原來逐條比較的 O(n·m) 配對算法的一致性測試
+
+reference_align 保留原來的實現（只刪去了打印），在隨機生成的字幕軌上比較
+掃描線（sweep）和 NumPy 重疊矩陣（numpy）兩種模式的輸出。
+"""
+import random
+import pytest
+import subtitle_processor
+from cue_track import CueTrack, format_timestamp
+from subtitle_processor import SubtitleProcessor
+
+
+def reference_align(jp_subtitles, zh_subtitles):
+    """原來的字幕同步實現"""
+    if not jp_subtitles or not zh_subtitles:
+        return zh_subtitles
+
+    aligned_zh_subtitles = []
+
+    processed_zh_subtitles = []
+    for sub in zh_subtitles:
+        text = sub['text']
+        if '\n' in text or '。' in text or '. ' in text:
+            parts = text.replace('\n', '。').replace('. ', '。').split('。')
+            parts = [p for p in parts if p.strip()]
+
+            if len(parts) > 1:
+                duration = sub['end_seconds'] - sub['start_seconds']
+                part_duration = duration / len(parts)
+
+                for i, part in enumerate(parts):
+                    new_start = sub['start_seconds'] + i * part_duration
+                    new_end = new_start + part_duration
+
+                    processed_zh_subtitles.append({
+                        'start': sub['start'],
+                        'end': sub['end'],
+                        'start_seconds': new_start,
+                        'end_seconds': new_end,
+                        'text': part.strip()
+                    })
+            else:
+                processed_zh_subtitles.append(sub)
+        else:
+            processed_zh_subtitles.append(sub)
+
+    for jp_sub in jp_subtitles:
+        jp_start = jp_sub['start_seconds']
+        jp_end = jp_sub['end_seconds']
+
+        matching_zh_subs = []
+        for zh_sub in processed_zh_subtitles:
+            zh_start = zh_sub['start_seconds']
+            zh_end = zh_sub['end_seconds']
+            if (zh_start <= jp_end and zh_end >= jp_start):
+                matching_zh_subs.append(zh_sub)
+
+        best_zh_sub = None
+        max_overlap = 0
+
+        for zh_sub in matching_zh_subs:
+            overlap_start = max(jp_start, zh_sub['start_seconds'])
+            overlap_end = min(jp_end, zh_sub['end_seconds'])
+            overlap = max(0, overlap_end - overlap_start)
+
+            if overlap > max_overlap:
+                max_overlap = overlap
+                best_zh_sub = zh_sub
+
+        aligned_zh_subtitles.append({
+            'start': jp_sub['start'],
+            'end': jp_sub['end'],
+            'start_seconds': jp_sub['start_seconds'],
+            'end_seconds': jp_sub['end_seconds'],
+            'text': best_zh_sub['text'] if best_zh_sub else ""
+        })
+
+    return aligned_zh_subtitles
+
+
+def _cue(start, end, text):
+    return {'start': format_timestamp(start), 'end': format_timestamp(end),
+            'start_seconds': start, 'end_seconds': end, 'text': text}
+
+
+def synthetic_tracks(seed, jp_count):
+    """生成一對字幕軌：亂序、互相重疊、首尾相接、包含多句的中文字幕，時間取整到 0.1 秒以產生相同的重疊時間"""
+    rng = random.Random(seed)
+    jp = []
+    time = 0.0
+    for i in range(jp_count):
+        time += rng.choice((0.0, 0.0, 0.5, 1.0, 3.0))
+        duration = rng.choice((0.5, 1.0, 1.5, 2.0, 4.0))
+        jp.append(_cue(round(time, 1), round(time + duration, 1), f"日本語{i}"))
+        time += rng.choice((duration, duration / 2, 0.0))
+
+    zh = []
+    for i in range(int(jp_count * 0.7)):
+        start = round(rng.uniform(0, time), 1)
+        end = round(start + rng.choice((0.5, 1.0, 2.0, 3.0, 6.0)), 1)
+        text = rng.choice((f"中文{i}", f"第一句{i}。第二句{i}", f"上{i}\n下{i}", f"one{i}. two{i}", f"只有句號{i}。"))
+        zh.append(_cue(start, end, text))
+
+    if seed % 2:
+        rng.shuffle(jp)
+        rng.shuffle(zh)
+    return jp, zh
+
+
+def _rows(track):
+    return [(cue['start_seconds'], cue['end_seconds'], cue['text']) for cue in track]
+
+
+METHODS = ['sweep', pytest.param('numpy', marks=pytest.mark.skipif(
+    subtitle_processor.np is None, reason="未安裝 numpy"))]
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return SubtitleProcessor()
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('seed', range(40))
+def test_matches_reference(processor, method, seed):
+    jp, zh = synthetic_tracks(seed, jp_count=random.Random(seed).choice((1, 5, 60, 400)))
+    expected = reference_align(jp, zh)
+    actual = processor.align_subtitle_timing(jp, zh, method=method)
+    assert _rows(actual) == _rows(expected)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_accepts_cue_tracks(processor, method):
+    jp, zh = synthetic_tracks(7, jp_count=200)
+    expected = reference_align(jp, zh)
+    actual = processor.align_subtitle_timing(CueTrack.from_cues(jp), CueTrack.from_cues(zh), method=method)
+    assert _rows(actual) == _rows(expected)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_ties_keep_earlier_chinese_cue(processor, method):
+    jp = [_cue(1.0, 3.0, "日")]
+    zh = [_cue(0.0, 2.0, "前"), _cue(2.0, 4.0, "後")]
+    assert _rows(processor.align_subtitle_timing(jp, zh, method=method)) == [(1.0, 3.0, "前")]
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_touching_cues_do_not_match(processor, method):
+    jp = [_cue(1.0, 2.0, "日")]
+    zh = [_cue(2.0, 3.0, "中"), _cue(0.0, 1.0, "中")]
+    assert _rows(processor.align_subtitle_timing(jp, zh, method=method)) == [(1.0, 2.0, "")]
+    assert _rows(reference_align(jp, zh)) == [(1.0, 2.0, "")]
+
+
+def test_empty_tracks(processor):
+    assert processor.align_subtitle_timing([], [_cue(0.0, 1.0, "中")]) == [_cue(0.0, 1.0, "中")]
+    assert processor.align_subtitle_timing([_cue(0.0, 1.0, "日")], []) == []
@@ -0,0 +1,168 @@
+"""批量翻譯的分批、回覆解析，以及回覆缺少或格式錯誤時拆分重試"""
+import json
+import time
+import threading
+import pytest
+from PyQt6.QtCore import Qt
+from ai_scheduler import RequestScheduler
+from batch_translator import (BatchTranslator, BATCH_PROMPT_VERSION, CUE_OVERHEAD_TOKENS,
+                              pack_batches, parse_batch_reply)
+from translation_cache import TranslationCache
+
+
+def test_pack_batches_token_budget():
+    items = [(i, "あ" * 10) for i in range(5)]
+    budget = 2 * (10 + CUE_OVERHEAD_TOKENS)
+    batches = pack_batches(items, budget, max_cues=40)
+    assert [[key for key, _ in batch] for batch in batches] == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_batches_max_cues():
+    items = [(i, "あ") for i in range(7)]
+    assert [len(batch) for batch in pack_batches(items, 10000, max_cues=3)] == [3, 3, 1]
+
+
+def test_pack_batches_oversized_cue():
+    items = [(0, "あ"), (1, "い" * 100), (2, "う")]
+    batches = pack_batches(items, 50, max_cues=40)
+    assert [[key for key, _ in batch] for batch in batches] == [[0], [1], [2]]
+    assert pack_batches([], 50, 40) == []
+
+
+@pytest.mark.parametrize('reply, expected', [
+    ('{"1": "你好", "2": "再見"}', {1: "你好", 2: "再見"}),
+    # 模型常把 JSON 放在代碼塊中或加上說明
+    ('```json\n{"1": "你好", "2": "再見"}\n```', {1: "你好", 2: "再見"}),
+    ('譯文如下：{"1": " 你好 ", "2": "再見"} 以上', {1: "你好", 2: "再見"}),
+    # 缺少、空白和不是文本的條目不包含在結果中
+    ('{"1": "你好"}', {1: "你好"}),
+    ('{"1": "", "2": 3}', {}),
+    # 多出的編號被忽略
+    ('{"1": "你好", "2": "再見", "3": "多餘"}', {1: "你好", 2: "再見"}),
+    ('{"1": "你好", "2": "再見"', {}),
+    ('["你好", "再見"]', {}),
+    ('沒有 JSON', {}),
+    ('} {', {}),
+])
+def test_parse_batch_reply(reply, expected):
+    assert parse_batch_reply(reply, 2) == expected
+
+
+class ScriptedBackend:
+    """按批次的字幕決定回覆：reply(texts) 返回回覆文本"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def chat(self, messages, model=None, temperature=0.7, **options):
+        numbered = json.loads(messages[-1]["content"])
+        texts = [numbered[str(number)] for number in range(1, len(numbered) + 1)]
+        with self._lock:
+            self.batches.append(texts)
+        return self.reply(texts)
+
+
+def full_reply(texts, skip=()):
+    return json.dumps({str(number): f"譯:{text}" for number, text in enumerate(texts, 1) if text not in skip},
+                      ensure_ascii=False)
+
+
+class Harness:
+    def __init__(self, tmp_path, reply, max_batch_cues=4):
+        self.backend = ScriptedBackend(reply)
+        self.scheduler = RequestScheduler(max_workers=2)
+        self.scheduler.start()
+        self.cache = TranslationCache(str(tmp_path / 'translation_cache.sqlite3'))
+        self.translator = BatchTranslator(self.backend, self.scheduler, self.cache, "test-model",
+                                          max_batch_tokens=1000, max_batch_cues=max_batch_cues)
+        self.translated = {}
+        self.finished = []
+        self.failed = []
+        self.translator.finished.connect(self.finished.append, Qt.ConnectionType.DirectConnection)
+        self.translator.failed.connect(self.failed.append, Qt.ConnectionType.DirectConnection)
+
+    def run(self, texts):
+        self.finished.clear()
+        self.translator.start(texts, self.translated.__setitem__)
+        deadline = time.monotonic() + 5
+        while not (self.finished or self.failed):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    def close(self):
+        self.scheduler.stop()
+        self.cache.close()
+
+
+@pytest.fixture
+def harness(tmp_path):
+    harnesses = []
+
+    def make(reply, **options):
+        harness = Harness(tmp_path, reply, **options)
+        harnesses.append(harness)
+        return harness
+
+    yield make
+    for harness in harnesses:
+        harness.close()
+
+
+TEXTS = [f"字幕{i}" for i in range(8)]
+
+
+def test_translates_and_caches(harness):
+    h = harness(full_reply)
+    h.run(TEXTS + ["字幕0"])
+    assert h.finished == [0]
+    assert [len(batch) for batch in h.backend.batches] == [4, 4]
+    # 重複的字幕只翻譯一次
+    assert h.translated == {**{i: f"譯:{text}" for i, text in enumerate(TEXTS)}, 8: "譯:字幕0"}
+    assert h.cache.get("字幕3", "ja", "zh-TW", "test-model", BATCH_PROMPT_VERSION) == "譯:字幕3"
+
+    # 再次開始時全部從緩存讀取
+    h.translated.clear()
+    h.run(TEXTS)
+    assert h.finished == [0]
+    assert len(h.backend.batches) == 2
+    assert len(h.translated) == len(TEXTS)
+
+
+def test_short_reply_is_split_and_retried(harness):
+    # 多條字幕的批次只回覆第一條
+    h = harness(lambda texts: full_reply(texts[:1]) if len(texts) > 1 else full_reply(texts))
+    h.run(TEXTS)
+    assert h.finished == [0]
+    assert h.translated == {i: f"譯:{text}" for i, text in enumerate(TEXTS)}
+    # 每個批次缺少的部分拆成兩半重試
+    assert sorted(len(batch) for batch in h.backend.batches) == [1, 1, 1, 1, 2, 2, 4, 4]
+
+
+def test_malformed_reply_is_split_and_retried(harness):
+    h = harness(lambda texts: "抱歉" if len(texts) > 1 else full_reply(texts))
+    h.run(TEXTS[:4])
+    assert h.finished == [0]
+    assert h.translated == {i: f"譯:{text}" for i, text in enumerate(TEXTS[:4])}
+    assert sorted(len(batch) for batch in h.backend.batches) == [1, 1, 1, 1, 2, 2, 4]
+
+
+def test_single_cue_failure_is_counted(harness):
+    # 模型總是漏掉同一句
+    h = harness(lambda texts: full_reply(texts, skip={"字幕2"}))
+    h.run(TEXTS[:4] + ["字幕2"])
+    # 同一句出現兩次，兩條都算作失敗
+    assert h.finished == [2]
+    assert set(h.translated) == {0, 1, 3}
+
+
+def test_request_error_aborts_job(harness):
+    def reply(texts):
+        raise RuntimeError("服務不可用")
+
+    h = harness(reply)
+    h.run(TEXTS)
+    assert h.failed == ["字幕翻譯失敗: 服務不可用"]
+    assert h.finished == []
+    assert h.translator._job is None
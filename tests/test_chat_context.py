@@ -0,0 +1,40 @@
+"""聊天上下文的預算和摘要折疊"""
+from chat_context import ConversationContext
+
+
+def test_build_keeps_recent_turns_within_budget():
+    context = ConversationContext(budget=60)
+    for i in range(10):
+        context.add("user", f"第{i}個問題" * 3)
+    messages, used, overflow = context.build([{"role": "system", "content": "系統"}])
+    assert used <= 60
+    assert messages[-1]["content"] == "第9個問題" * 3
+    assert overflow == 10 - (len(messages) - 1)
+
+
+def test_fold_removes_only_summarized_turns():
+    context = ConversationContext(max_turns=4)
+    for i in range(4):
+        context.add("user", f"問題{i}")
+    turns = context.turns[:2]
+    context.summary_messages(turns)
+    # 生成摘要期間繼續對話，max_turns 刪除了最舊的一條
+    context.add("assistant", "回答4")
+    context.fold(turns, "摘要")
+    assert [turn["content"] for turn in context.turns] == ["問題2", "問題3", "回答4"]
+    assert context.summary == "摘要"
+
+
+def test_summary_messages_include_previous_summary():
+    context = ConversationContext()
+    context.add("user", "問題")
+    context.fold([], "舊摘要")
+    transcript = context.summary_messages(context.turns)[-1]["content"]
+    assert transcript.startswith("之前的摘要: 舊摘要")
+    assert "用戶: 問題" in transcript
+
+
+def test_fold_truncates_long_summary():
+    context = ConversationContext(summary_budget=10)
+    context.fold([], "長" * 100)
+    assert len(context.summary) <= 10
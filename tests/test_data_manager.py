@@ -0,0 +1,141 @@
+"""DataManager 的下載流程，用本地視頻信息和不訪問網絡的 YoutubeDL 替身"""
+import os
+import json
+import pytest
+from yt_dlp.utils import DownloadError
+import data_manager
+import download_manager
+import media_library
+import video_info
+from data_manager import DataManager, ZH_SUBTITLE_LANGS
+from download_manager import DownloadManager
+from video_info import LocalInfoExtractor
+
+URL = "https://www.youtube.com/watch?v=abcdefghijk"
+INFO = {'id': 'abcdefghijk', 'webpage_url': URL, 'title': 'テスト',
+        'subtitles': {'ja': [{'ext': 'vtt'}]}}
+
+
+class StubYoutubeDL:
+    """按視頻信息寫出空的視頻和字幕文件，已過期的信息拋出 DownloadError"""
+    instances = []
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.processed = []
+        StubYoutubeDL.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        self.processed.append(info)
+        if info.get('expired'):
+            raise DownloadError("HTTP Error 403: Forbidden")
+        base_path = self.opts['outtmpl'].replace('%(title)s', info['title']).replace('.%(ext)s', '')
+        if not self.opts.get('skip_download'):
+            with open(base_path + '.mp4', 'wb') as f:
+                f.write(b'video')
+        requested = {lang: info['subtitles'][lang] for lang in self.opts['subtitleslangs']
+                     if lang in info['subtitles']}
+        for lang in requested:
+            with open(f"{base_path}.{lang}.vtt", 'w', encoding='utf-8') as f:
+                f.write("WEBVTT\n")
+        return dict(info, requested_subtitles=requested)
+
+
+class FakeWatcher:
+    def __init__(self, library):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    downloads = tmp_path / 'downloads'
+    (downloads / 'manifest').mkdir(parents=True)
+    info_dir = tmp_path / 'infos'
+    info_dir.mkdir()
+    (info_dir / 'test.info.json').write_text(json.dumps(INFO), encoding='utf-8')
+
+    def get_download_path(filename=None):
+        return str(downloads / filename) if filename else str(downloads)
+
+    for module in (data_manager, download_manager, media_library):
+        monkeypatch.setattr(module, 'get_download_path', get_download_path)
+    monkeypatch.setattr(video_info, 'get_manifest_path', lambda: str(downloads / 'manifest'))
+    monkeypatch.setattr(data_manager, 'LibraryWatcher', FakeWatcher)
+    monkeypatch.setattr(data_manager, 'YoutubeDL', StubYoutubeDL)
+    # 不啟動工作線程，測試直接調用下載函數
+    monkeypatch.setattr(DownloadManager, 'start', lambda self: None)
+    StubYoutubeDL.instances = []
+    manager = DataManager(info_extractor=LocalInfoExtractor(str(info_dir)))
+    yield manager
+    manager.library.close()
+
+
+def run_job(manager, language='ja'):
+    job_id = manager.download_manager.add_job(URL, language)
+    job = manager.download_manager.jobs[job_id]
+    return manager._download_video(dict(job), lambda progress: None)
+
+
+def test_full_download(manager, tmp_path):
+    video_path, subtitle_paths = run_job(manager)
+    base_path = str(tmp_path / 'downloads' / 'テスト')
+    assert video_path == base_path + '.mp4'
+    assert subtitle_paths == {'jp': base_path + '.ja.vtt', 'zh': None}
+    (ydl,) = StubYoutubeDL.instances
+    assert ydl.opts['subtitleslangs'] == ['ja'] + ZH_SUBTITLE_LANGS
+    assert manager.library.get(video_path)['url'] == URL
+
+
+def test_expired_cached_info_is_refetched(manager):
+    manager.video_info._save(manager.video_info._cache_path(URL), dict(INFO, expired=True))
+    video_path, _ = run_job(manager)
+    (ydl,) = StubYoutubeDL.instances
+    assert [info.get('expired', False) for info in ydl.processed] == [True, False]
+    assert manager.video_info.cached(URL).get('expired') is None
+    assert os.path.exists(video_path)
+
+
+def test_local_video_only_fetches_subtitles(manager, tmp_path):
+    video_path = tmp_path / 'downloads' / 'テスト.mp4'
+    video_path.write_bytes(b'video')
+    manager.library.add_video(str(video_path), title='テスト', url=URL)
+
+    _, subtitle_paths = run_job(manager)
+    (ydl,) = StubYoutubeDL.instances
+    assert ydl.opts['skip_download']
+    assert ydl.opts['subtitleslangs'] == ['ja'] + ZH_SUBTITLE_LANGS
+    assert subtitle_paths['jp'].endswith('テスト.ja.vtt')
+    assert subtitle_paths['zh'] is None
+
+
+def test_unavailable_subtitles_are_not_requeried(manager, tmp_path):
+    video_path = tmp_path / 'downloads' / 'テスト.mp4'
+    video_path.write_bytes(b'video')
+    manager.library.add_video(str(video_path), title='テスト', url=URL)
+
+    run_job(manager)
+    assert len(StubYoutubeDL.instances) == 1
+    # 上游沒有中文字幕，再次播放時不再查詢
+    run_job(manager)
+    assert len(StubYoutubeDL.instances) == 1
+    # 另一種語言的任務只查詢新的語言
+    run_job(manager, language='en')
+    assert StubYoutubeDL.instances[-1].opts['subtitleslangs'] == ['en']
+
+    # 超過重試時間後重新查詢
+    for job in manager.download_manager.jobs.values():
+        job['subtitle_attempts'] = {lang: 0 for lang in job.get('subtitle_attempts', {})}
+    run_job(manager)
+    assert StubYoutubeDL.instances[-1].opts['subtitleslangs'] == ZH_SUBTITLE_LANGS
@@ -0,0 +1,117 @@
+"""詞典查詢緩存的有效期、「沒有結果」緩存、內存和磁盤兩級緩存以及清理"""
+import pytest
+import dictionary_cache
+from dictionary_cache import DictionaryCache, MEMORY, DISK
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(dictionary_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'lookup_cache.sqlite3')
+
+
+@pytest.fixture
+def cache(db_path, clock):
+    cache = DictionaryCache(db_path, found_ttl=100, not_found_ttl=10)
+    yield cache
+    cache.close()
+
+
+RESULTS = [{'slug': '食べる'}]
+
+
+def test_memory_hit_returns_copy(cache):
+    assert cache.get('食べる') == (None, None)
+    cache.put('食べる', RESULTS)
+    results, tier = cache.get('食べる')
+    assert (results, tier) == (RESULTS, MEMORY)
+    results.append('changed')
+    assert cache.get('食べる')[0] == RESULTS
+    # 查詢時統一寫法
+    assert cache.get('食べる ')[1] == MEMORY
+
+
+def test_disk_hit_is_promoted_to_memory(db_path, clock):
+    first = DictionaryCache(db_path)
+    first.put('食べる', RESULTS)
+    first.close()
+
+    second = DictionaryCache(db_path)
+    assert second.get('食べる') == (RESULTS, DISK)
+    assert second.get('食べる') == (RESULTS, MEMORY)
+    second.close()
+
+
+def test_memory_limit(db_path, clock):
+    cache = DictionaryCache(db_path, memory_entries=2)
+    for word in ('あ', 'い', 'う'):
+        cache.put(word, [word])
+    assert cache.get('う')[1] == MEMORY
+    # 最久沒有使用的從內存中移除，仍然可以從磁盤讀取
+    assert cache.get('あ') == (['あ'], DISK)
+    assert cache.get('あ')[1] == MEMORY
+    cache.close()
+
+
+def test_found_ttl(cache, clock):
+    cache.put('食べる', RESULTS)
+    clock.now += 99
+    assert cache.get('食べる')[1] == MEMORY
+    clock.now += 2
+    assert cache.get('食べる') == (None, None)
+    # 過期的條目從磁盤刪除
+    assert len(cache) == 0
+
+
+def test_not_found_uses_shorter_ttl(cache, clock):
+    cache.put('たべる', RESULTS)
+    cache.put('のみもの', [])
+    assert cache.get('のみもの') == ([], MEMORY)
+    clock.now += 11
+    assert cache.get('のみもの') == (None, None)
+    assert cache.get('たべる')[0] == RESULTS
+
+
+def test_expired_entries_removed_on_open(db_path, clock):
+    cache = DictionaryCache(db_path, found_ttl=100, not_found_ttl=10)
+    cache.put('たべる', RESULTS)
+    cache.put('のみもの', [])
+    cache.close()
+    clock.now += 50
+    cache = DictionaryCache(db_path)
+    assert len(cache) == 1
+    assert cache.get('たべる') == (RESULTS, DISK)
+    cache.close()
+
+
+def test_evict_earliest_expiring(db_path, clock):
+    cache = DictionaryCache(db_path, max_entries=10, memory_entries=100, found_ttl=100)
+    for i in range(10):
+        cache.put(f"詞{i}", [i])
+        clock.now += 1
+    assert len(cache) == 10
+    cache.put("詞10", [10])
+    # 超出上限時刪除到上限的 EVICT_TO
+    assert len(cache) == int(10 * dictionary_cache.EVICT_TO)
+    assert cache.get("詞0") == (None, None)
+    assert cache.get("詞1") == (None, None)
+    assert cache.get("詞2") == ([2], MEMORY)
+    assert cache.get("詞10") == ([10], MEMORY)
+    # 重新寫入已有的單詞不增加條目數
+    cache.put("詞10", [10])
+    assert len(cache) == 9
+    cache.close()
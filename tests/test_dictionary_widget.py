@@ -0,0 +1,91 @@
+"""JishoWorker 的緩存命中、合併相同的查詢和關閉"""
+import os
+import time
+import threading
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt6.QtWidgets import QApplication
+from dictionary_cache import DictionaryCache, MEMORY
+from dictionary_widget import JishoWorker, LOOKUP_MISS, LOOKUP_SHARED
+
+RESULTS = [{'slug': '食べる'}]
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def wait_for(app, predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超時")
+        app.processEvents()
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def worker(app, tmp_path):
+    worker = JishoWorker(cache=DictionaryCache(str(tmp_path / 'lookup_cache.sqlite3')))
+    worker.results = []
+    worker.result_ready.connect(worker.results.append)
+    worker.no_results.connect(worker.results.append)
+    yield worker
+    worker.close()
+
+
+def test_concurrent_lookups_share_one_request(app, worker, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def search_jisho(word):
+        calls.append(word)
+        release.wait(5)
+        return RESULTS
+
+    monkeypatch.setattr(worker, '_search_jisho', search_jisho)
+    worker.search_word('食べる')
+    worker.search_word('食べる ')
+    assert worker.stats[LOOKUP_MISS] == 1
+    assert worker.stats[LOOKUP_SHARED] == 1
+    release.set()
+    wait_for(app, lambda: len(worker.results) == 2)
+    assert calls == ['食べる']
+    assert worker.results == [RESULTS, RESULTS]
+
+    # 之後的查詢由緩存回答
+    worker.search_word('食べる')
+    assert worker.stats[MEMORY] == 1
+    assert worker.results[-1] == RESULTS
+    assert len(calls) == 1
+
+
+def test_no_results_are_cached(app, worker, monkeypatch):
+    calls = []
+    monkeypatch.setattr(worker, '_search_jisho', lambda word: calls.append(word) or [])
+    worker.search_word('のみもの')
+    wait_for(app, lambda: worker.results == ['のみもの'])
+    worker.search_word('のみもの')
+    assert worker.results == ['のみもの', 'のみもの']
+    assert calls == ['のみもの']
+    assert "未命中 1" in worker.stats_text()
+
+
+def test_close_stops_scheduler(app, worker, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(worker, '_search_jisho', lambda word: release.wait(5) and RESULTS)
+    worker.search_word('食べる')
+    worker.search_word('飲む')
+    threads = list(worker.scheduler._workers)
+    worker.close()
+    release.set()
+    # 關閉後排隊和正在進行的查詢都不再回調
+    time.sleep(0.1)
+    app.processEvents()
+    assert worker.results == []
+    assert worker.scheduler.pending_count() == 0
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
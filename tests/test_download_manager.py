@@ -0,0 +1,165 @@
+"""下載隊列的暫停、取消、恢復和斷點續傳，用假的下載函數代替 yt_dlp"""
+import os
+import json
+import time
+import threading
+import pytest
+from download_manager import (DownloadManager, QUEUED, DOWNLOADING, PAUSED, COMPLETED, FAILED, CANCELLED,
+                              file_is_complete, file_record)
+
+URL = "https://www.youtube.com/watch?v=abcdefghijk"
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("等待超時")
+        time.sleep(0.01)
+
+
+class FakeDownload:
+    """每次調用寫入一部分 .part 文件並回報進度，放行後合併為視頻文件"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.calls = []
+        self.release = threading.Event()
+        self.error = None
+
+    def __call__(self, job, progress_hook):
+        # 記錄調用時的臨時文件，任務完成後同一個字典會被清空
+        self.calls.append(dict(job, partial_files=dict(job.get('partial_files', {}))))
+        video_path = os.path.join(self.directory, 'video.mp4')
+        tmp_path = video_path + '.part'
+        while True:
+            with open(tmp_path, 'ab') as f:
+                f.write(b'x')
+            progress_hook({'status': 'downloading', 'filename': video_path, 'tmpfilename': tmp_path,
+                           'downloaded_bytes': os.path.getsize(tmp_path), 'total_bytes': 1000})
+            if self.release.is_set():
+                break
+            time.sleep(0.01)
+        if self.error:
+            raise self.error
+        os.replace(tmp_path, video_path)
+        progress_hook({'status': 'finished', 'filename': video_path})
+        return video_path, None
+
+
+@pytest.fixture
+def download(tmp_path):
+    return FakeDownload(str(tmp_path))
+
+
+@pytest.fixture
+def manager(tmp_path, download):
+    manager = DownloadManager(download, max_workers=1, queue_file=str(tmp_path / 'queue.json'))
+    manager.start()
+    return manager
+
+
+def state(manager, job_id):
+    return manager.jobs[job_id]['state']
+
+
+def test_completes_and_saves_records(manager, download, tmp_path):
+    download.release.set()
+    job_id = manager.add_job(URL)
+    wait_for(lambda: state(manager, job_id) == COMPLETED)
+    job = manager.jobs[job_id]
+    assert job['video_path'] == str(tmp_path / 'video.mp4')
+    assert job['partial_files'] == {}
+    assert file_is_complete(job['media'][0])
+    with open(manager.queue_file, encoding='utf-8') as f:
+        assert json.load(f)[0]['state'] == COMPLETED
+
+
+def test_pause_keeps_partial_file_and_resume_continues(manager, download, tmp_path):
+    job_id = manager.add_job(URL)
+    wait_for(lambda: state(manager, job_id) == DOWNLOADING and manager.jobs[job_id]['partial_files'])
+    manager.pause(job_id)
+    wait_for(lambda: state(manager, job_id) == PAUSED)
+    tmp_path_part = str(tmp_path / 'video.mp4.part')
+    assert os.path.exists(tmp_path_part)
+    assert manager.jobs[job_id]['partial_files'] == {str(tmp_path / 'video.mp4'): tmp_path_part}
+    assert manager.jobs[job_id]['error'] == ''
+
+    download.release.set()
+    manager.resume(job_id)
+    wait_for(lambda: state(manager, job_id) == COMPLETED)
+    assert len(download.calls) == 2
+    # 恢復的任務帶著上次的臨時文件記錄
+    assert download.calls[1]['partial_files'] == {str(tmp_path / 'video.mp4'): tmp_path_part}
+
+
+def test_cancel_discards_partial_file(manager, download, tmp_path):
+    job_id = manager.add_job(URL)
+    wait_for(lambda: state(manager, job_id) == DOWNLOADING and manager.jobs[job_id]['partial_files'])
+    manager.cancel(job_id)
+    wait_for(lambda: state(manager, job_id) == CANCELLED)
+    assert not os.path.exists(tmp_path / 'video.mp4.part')
+    assert manager.jobs[job_id]['partial_files'] == {}
+
+
+def test_cancel_queued_job(tmp_path, download):
+    manager = DownloadManager(download, queue_file=str(tmp_path / 'queue.json'))
+    job_id = manager.add_job(URL)
+    manager.cancel(job_id)
+    assert state(manager, job_id) == CANCELLED
+    manager.resume(job_id)
+    assert state(manager, job_id) == QUEUED
+
+
+def test_failure_records_error(manager, download):
+    download.error = RuntimeError("網絡錯誤")
+    download.release.set()
+    job_id = manager.add_job(URL)
+    wait_for(lambda: state(manager, job_id) == FAILED)
+    assert manager.jobs[job_id]['error'] == "網絡錯誤"
+
+
+def test_reload_requeues_interrupted_job(tmp_path, download):
+    queue_file = str(tmp_path / 'queue.json')
+    first = DownloadManager(download, queue_file=queue_file)
+    job_id = first.add_job(URL)
+    with first._condition:
+        first._set_state(first.jobs[job_id], DOWNLOADING)
+    first.update_job(job_id, partial_files={'video.mp4': 'video.mp4.part'})
+
+    # 重新打開程序
+    download.release.set()
+    second = DownloadManager(download, max_workers=1, queue_file=queue_file)
+    assert state(second, job_id) == QUEUED
+    second.start()
+    wait_for(lambda: state(second, job_id) == COMPLETED)
+    assert download.calls[0]['partial_files'] == {'video.mp4': 'video.mp4.part'}
+
+
+def test_add_job_deduplicates(tmp_path, download):
+    manager = DownloadManager(download, queue_file=str(tmp_path / 'queue.json'))
+    job_id = manager.add_job(URL)
+    assert manager.add_job("https://youtu.be/abcdefghijk") == job_id
+    assert manager.add_job(URL, language='en') != job_id
+
+
+def test_complete_files_are_not_downloaded_again(manager, download, tmp_path):
+    download.release.set()
+    job_id = manager.add_job(URL)
+    wait_for(lambda: state(manager, job_id) == COMPLETED)
+
+    # 修改時間變化但內容相同，仍然算作完整
+    video_path = str(tmp_path / 'video.mp4')
+    stat = os.stat(video_path)
+    os.utime(video_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert manager.add_job(URL) == job_id
+    wait_for(lambda: state(manager, job_id) == COMPLETED)
+    assert len(download.calls) == 1
+
+    # 內容變化則重新下載
+    record = file_record(video_path)
+    with open(video_path, 'r+b') as f:
+        f.write(b'y')
+    assert not file_is_complete(record)
+    manager.add_job(URL)
+    wait_for(lambda: len(download.calls) == 2 and state(manager, job_id) == COMPLETED)
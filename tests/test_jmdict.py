@@ -0,0 +1,165 @@
+"""JMdict 索引的編譯和查詢，用一個小的 JMdict XML 文件"""
+import os
+import pytest
+from jmdict import (JMdictIndex, LocalDictionary, compile_index, index_version, find_source,
+                    INDEX_VERSION, INDEX_NAME)
+
+
+def entry_xml(seq, kanji=(), readings=(), priorities=(), glosses=('gloss',), lang=None):
+    k_ele = ''.join(f"<k_ele><keb>{text}</keb>{''.join(f'<ke_pri>{p}</ke_pri>' for p in priorities)}</k_ele>"
+                    for text in kanji)
+    r_ele = ''.join(f"<r_ele><reb>{text}</reb>{''.join(f'<re_pri>{p}</re_pri>' for p in priorities)}</r_ele>"
+                    for text in readings)
+    lang_attr = f' xml:lang="{lang}"' if lang else ''
+    gloss = ''.join(f"<gloss{lang_attr}>{text}</gloss>" for text in glosses)
+    return f"<entry><ent_seq>{seq}</ent_seq>{k_ele}{r_ele}<sense><pos>verb</pos>{gloss}</sense></entry>"
+
+
+ENTRIES = [
+    entry_xml(1, ['食べる'], ['たべる'], ['ichi1', 'nf10'], ['to eat']),
+    entry_xml(2, ['食べ物'], ['たべもの'], ['ichi1'], ['food']),
+    entry_xml(3, ['食べ放題'], ['たべほうだい'], [], ['all you can eat']),
+    entry_xml(4, ['旅'], ['たび'], ['news1', 'nf02'], ['travel']),
+    entry_xml(5, ['足袋'], ['たび'], [], ['tabi socks']),
+    entry_xml(6, ['旅立ち'], ['たびだち'], ['nf01'], ['departure']),
+    entry_xml(7, [], ['コーヒー'], ['gai1'], ['coffee']),
+    entry_xml(8, ['学校'], ['がっこう'], ['nf01'], ['school']),
+    entry_xml(9, ['抹茶'], ['まっちゃ'], ['spec1'], ['matcha']),
+    entry_xml(10, ['今日は'], ['こんにちは'], ['spec1'], ['hello']),
+    entry_xml(11, ['切手'], ['きって'], ['ichi1'], ['stamp']),
+    entry_xml(12, ['独語'], ['どくご'], [], ['Deutsch'], lang='ger'),
+]
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('dictionary')
+    path = directory / 'JMdict_e.xml'
+    path.write_text(f"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n<JMdict>{''.join(ENTRIES)}</JMdict>",
+                    encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def index(source, tmp_path_factory):
+    index_path = str(tmp_path_factory.mktemp('index') / INDEX_NAME)
+    assert compile_index(source, index_path) == len(ENTRIES) - 1
+    index = JMdictIndex(index_path)
+    yield index
+    index.close()
+
+
+def words(entries):
+    return [(entry['kanji'] or entry['readings'])[0] for entry in entries]
+
+
+def test_compile_round_trip(index):
+    assert index.entry_count == 11
+    (entry,) = index.lookup('食べる')
+    assert entry == {'seq': 1, 'kanji': ['食べる'], 'readings': ['たべる'], 'common': True,
+                     'senses': [{'english_definitions': ['to eat'], 'parts_of_speech': ['verb'],
+                                 'tags': [], 'restrictions': []}]}
+    assert index_version(index._file.name) == INDEX_VERSION
+
+
+def test_entries_without_english_are_skipped(index):
+    assert index.lookup('独語') == []
+
+
+def test_lookup_by_reading_sorts_common_first(index):
+    assert words(index.lookup('たび')) == ['旅', '足袋']
+    assert words(index.lookup('たび', limit=1)) == ['旅']
+
+
+def test_lookup_normalizes_kana(index):
+    # 片假名查詢平假名寫的詞，平假名和半角片假名查詢片假名寫的詞
+    assert words(index.lookup('タベル')) == ['食べる']
+    assert words(index.lookup('こーひー')) == ['コーヒー']
+    assert words(index.lookup('ｺｰﾋｰ')) == ['コーヒー']
+    assert index.lookup('のみもの') == []
+
+
+def test_not_an_index(tmp_path):
+    path = tmp_path / INDEX_NAME
+    path.write_bytes(b'not an index' * 20)
+    assert index_version(str(path)) is None
+    with pytest.raises(ValueError):
+        JMdictIndex(str(path))
+
+
+@pytest.fixture
+def dictionary(source):
+    dictionary = LocalDictionary(os.path.dirname(source))
+    assert dictionary.lookup('食べる') is None
+    dictionary._load()
+    yield dictionary
+    dictionary.close()
+    os.remove(dictionary.index_path)
+
+
+def test_local_dictionary_compiles_and_looks_up(dictionary, source):
+    assert find_source(os.path.dirname(source)) == source
+    assert dictionary.ready.is_set() and dictionary.available
+    (result,) = dictionary.lookup('旅立ち')
+    assert result['slug'] == '旅立ち'
+    assert result['japanese'] == [{'word': '旅立ち', 'reading': 'たびだち'}]
+    # 只有詞頻組標記，沒有常用詞標記
+    assert not result['is_common']
+    assert dictionary.lookup('旅')[0]['is_common']
+    (result,) = dictionary.lookup('コーヒー')
+    assert result['japanese'] == [{'reading': 'コーヒー'}]
+
+
+def test_local_dictionary_lemma_fallback(dictionary):
+    # 活用形查不到時使用詞根，UniDic 外來語詞根中的原文被去掉
+    assert [r['slug'] for r in dictionary.lookup('食べた', lemma='食べる')] == ['食べる']
+    assert [r['slug'] for r in dictionary.lookup('コーヒ', lemma='コーヒー-coffee')] == ['コーヒー']
+    assert dictionary.lookup('食べた') == []
+    # 原形能查到時不使用詞根
+    assert [r['slug'] for r in dictionary.lookup('旅', lemma='食べる')] == ['旅']
+
+
+def test_local_dictionary_close(dictionary):
+    dictionary.close()
+    assert not dictionary.available
+    assert dictionary.lookup('旅') is None
+    assert dictionary.suggest('tabi') == []
+
+
+def ranked_words(index, results):
+    return [words([index.entry(entry_id)])[0] for _, entry_id in results]
+
+
+def test_prefix_search_ranking(index):
+    # 常用程度高的在前，相同常用程度時短的在前
+    assert ranked_words(index, index.prefix_search('たべ', 10)) == ['食べる', '食べ物', '食べ放題']
+    # 完全匹配排在更常用的長詞前面
+    assert ranked_words(index, index.prefix_search('たび', 10)) == ['旅', '足袋', '旅立ち']
+    assert ranked_words(index, index.prefix_search('たべ', 2)) == ['食べる', '食べ物']
+    assert index.prefix_search('のみ', 10) == []
+
+
+def test_prefix_search_scan_limit(index):
+    # 只排序最常用的一組詞時仍然包括完全匹配
+    assert ranked_words(index, index.prefix_search('たび', 1, scan_limit=1)) == ['旅']
+    # 先查找最常用的一組，不按鍵的順序取前面的詞
+    assert ranked_words(index, index.prefix_search('たべ', 1, scan_limit=1)) == ['食べる']
+
+
+def test_fuzzy_search_ranking(index):
+    # 替換、插入、刪除和交換一個字
+    assert ranked_words(index, index.fuzzy_search('たべもお', 10)) == ['食べ物']
+    assert ranked_words(index, index.fuzzy_search('たべるる', 10)) == ['食べる']
+    assert ranked_words(index, index.fuzzy_search('がこう', 10)) == ['学校']
+    assert ranked_words(index, index.fuzzy_search('たべもの', 10)) == []
+    assert ranked_words(index, index.fuzzy_search('まちっゃ', 10)) == ['抹茶']
+    # 太短的詞不做模糊匹配
+    assert index.fuzzy_search('たぶ', 10) == []
+
+
+def test_suggest(index):
+    assert words(entry for _, entry in index.suggest('tab')) == ['旅', '足袋', '旅立ち', '食べる', '食べ物', '食べ放題']
+    assert words(entry for _, entry in index.suggest('taberu')) == ['食べる']
+    # 前綴沒有結果時使用模糊匹配
+    assert words(entry for _, entry in index.suggest('gakou')) == ['学校']
+    assert words(entry for _, entry in index.suggest('kitte')) == ['切手']
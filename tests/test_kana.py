@@ -0,0 +1,59 @@
+"""羅馬字轉換、促音和撥音規則，以及不完整羅馬字的展開"""
+import pytest
+from kana import katakana_to_hiragana, normalize, query_prefixes, romaji_completions, romaji_to_hiragana
+
+
+@pytest.mark.parametrize('romaji, expected', [
+    ('kitte', 'きって'),
+    ('gakkou', 'がっこう'),
+    ('matcha', 'まっちゃ'),
+    ('zasshi', 'ざっし'),
+])
+def test_sokuon(romaji, expected):
+    assert romaji_to_hiragana(romaji) == (expected, '')
+
+
+@pytest.mark.parametrize('romaji, expected', [
+    ('konnichiwa', 'こんにちわ'),
+    ('onna', 'おんな'),
+    ('kanji', 'かんじ'),
+    ('sanpo', 'さんぽ'),
+    ("kon'ya", 'こんや'),
+    ('konnya', 'こんにゃ'),
+    ('hon\'', 'ほん'),
+    ('nn', 'ん'),
+])
+def test_n_rules(romaji, expected):
+    assert romaji_to_hiragana(romaji) == (expected, '')
+
+
+def test_incomplete_romaji():
+    assert romaji_to_hiragana('tab') == ('た', 'b')
+    assert romaji_to_hiragana('ky') == ('', 'ky')
+    assert romaji_to_hiragana('hon') == ('ほ', 'n')
+    # 不是任何羅馬字開頭的字符原樣保留
+    assert romaji_to_hiragana('q') == ('q', '')
+
+
+def test_completions():
+    assert romaji_completions('ky') == ['きゃ', 'きゅ', 'きょ']
+    assert romaji_completions('b') == ['ば', 'び', 'ぶ', 'べ', 'ぼ']
+    # し 已經包括 しゃ、しゅ、しょ
+    assert romaji_completions('sh') == ['し']
+
+
+def test_query_prefixes():
+    assert query_prefixes('tab') == ['たば', 'たび', 'たぶ', 'たべ', 'たぼ']
+    assert query_prefixes('ky') == ['きゃ', 'きゅ', 'きょ']
+    assert query_prefixes('taberu') == ['たべる']
+    assert query_prefixes('hon') == ['ほな', 'ほに', 'ほぬ', 'ほね', 'ほの', 'ほん']
+    assert query_prefixes('  ') == []
+    # 假名和漢字不經過羅馬字轉換
+    assert query_prefixes('タベ') == ['たべ']
+    assert query_prefixes('食べ') == ['食べ']
+
+
+def test_normalize():
+    assert katakana_to_hiragana('コーヒー') == 'こーひー'
+    assert normalize('ｺｰﾋｰ') == 'こーひー'
+    assert normalize(' ＴＡＢＥ ') == 'tabe'
@@ -0,0 +1,45 @@
+"""下載目錄監視線程的啟動和停止"""
+import os
+import pytest
+from library_watcher import LibraryWatcher
+from media_library import MediaLibrary
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = MediaLibrary(str(tmp_path / 'library.sqlite3'))
+    yield library
+    library.close()
+
+
+def assert_closed(fd):
+    with pytest.raises(OSError):
+        os.fstat(fd)
+
+
+def test_stop_closes_pipe(tmp_path, library):
+    root = tmp_path / 'videos'
+    root.mkdir()
+    (root / 'a.mp4').write_bytes(b'')
+    watcher = LibraryWatcher(library, str(root))
+    fds = watcher._stop_read, watcher._stop_write
+    watcher.start()
+    assert watcher.ready.wait(5)
+    assert watcher.subtitles_for(str(root / 'a.mp4'))[0]
+
+    watcher.stop()
+    assert watcher._thread is None
+    for fd in fds:
+        assert_closed(fd)
+    # 重複停止和停止後啟動都不做任何事
+    watcher.stop()
+    watcher.start()
+    assert watcher._thread is None
+
+
+def test_stop_without_start_closes_pipe(tmp_path, library):
+    watcher = LibraryWatcher(library, str(tmp_path))
+    fds = watcher._stop_read, watcher._stop_write
+    watcher.stop()
+    for fd in fds:
+        assert_closed(fd)
@@ -0,0 +1,53 @@
+"""媒體庫的最近播放列表和搜索"""
+import pytest
+from media_library import MediaLibrary
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = MediaLibrary(str(tmp_path / 'library.sqlite3'))
+    yield library
+    library.close()
+
+
+def test_recent_excludes_scanned_videos(tmp_path, library):
+    videos = tmp_path / 'videos'
+    videos.mkdir()
+    for name in ('a', 'b', 'c'):
+        (videos / f'{name}.mp4').write_bytes(b'')
+    (videos / 'a.ja.vtt').write_text("WEBVTT\n", encoding='utf-8')
+    library.scan(str(videos))
+    assert len(library.search()) == 3
+    assert library.recent() == []
+
+    library.mark_played(str(videos / 'b.mp4'))
+    recent = library.recent()
+    assert [record['title'] for record in recent] == ['b']
+
+
+def test_recent_includes_downloads_newest_first(tmp_path, library):
+    for name, played_at in (('old', '2024-01-01 10:00:00'), ('new', '2024-02-01 10:00:00')):
+        path = tmp_path / f'{name}.mp4'
+        path.write_bytes(b'')
+        library.add_video(str(path), played_at=played_at)
+    assert [record['title'] for record in library.recent()] == ['new', 'old']
+    assert [record['title'] for record in library.recent(limit=1)] == ['new']
+
+
+def test_search_matches_substrings(tmp_path, library):
+    for name, url in (('Nihongo Lesson 1', 'https://youtu.be/aaaaaaaaaaa'), ('100% 日本語', None),
+                      ('my_video', None), ('myXvideo', None)):
+        path = tmp_path / f'{name}.mp4'
+        path.write_bytes(b'')
+        library.add_video(str(path), title=name, url=url)
+    (tmp_path / 'my_video.ja.vtt').write_text("WEBVTT\n", encoding='utf-8')
+    library.add_video(str(tmp_path / 'my_video.mp4'), title='my_video')
+
+    assert [record['title'] for record in library.search('lesson')] == ['Nihongo Lesson 1']
+    assert [record['title'] for record in library.search('aaaaaaa')] == ['Nihongo Lesson 1']
+    # 通配符按原文匹配
+    assert [record['title'] for record in library.search('%')] == ['100% 日本語']
+    assert [record['title'] for record in library.search('my_')] == ['my_video']
+    assert [record['title'] for record in library.search('video', language='ja')] == ['my_video']
+    # 按標題排序，不區分大小寫
+    assert [record['title'] for record in library.search('', limit=2)] == ['100% 日本語', 'my_video']
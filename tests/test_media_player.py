@@ -0,0 +1,185 @@
+"""MediaPlayer 字幕計時與輪詢的測試，用假的 vlc 模組和可控的時鐘"""
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+import pytest
+from PyQt6.QtWidgets import QApplication
+import media_player
+from media_player import MediaPlayer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakePlayer:
+    """播放器時間每 250 毫秒才更新一次，並且落後實際位置 100 毫秒"""
+    GRANULARITY_MS = 250
+    LAG_MS = 100
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.position = 0.0  # 實際播放位置（毫秒）
+        self.started = None
+        self.media = None
+
+    def actual_time(self):
+        if self.started is None:
+            return self.position
+        return self.position + (self.clock() - self.started) * 1000
+
+    def get_time(self):
+        coarse = self.actual_time() - self.LAG_MS
+        return max(0, int(coarse // self.GRANULARITY_MS * self.GRANULARITY_MS))
+
+    def play(self):
+        if self.started is None:
+            self.started = self.clock()
+
+    def pause(self):
+        self.position = self.actual_time()
+        self.started = None
+
+    def stop(self):
+        self.pause()
+
+    def set_time(self, time_ms):
+        self.position = time_ms
+        if self.started is not None:
+            self.started = self.clock()
+
+    def get_length(self):
+        return 600000
+
+    def get_rate(self):
+        return 1.0
+
+    def get_media(self):
+        return self.media
+
+    def set_media(self, media):
+        self.media = media
+
+    def set_xwindow(self, window):
+        pass
+
+    set_hwnd = set_nsobject = set_xwindow
+
+    def audio_set_volume(self, volume):
+        pass
+
+    def release(self):
+        pass
+
+
+class FakeInstance:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def media_player_new(self):
+        return FakePlayer(self.clock)
+
+    def media_new(self, path):
+        return object()
+
+
+class FakeVlc:
+    def __init__(self, clock):
+        self.clock = clock
+
+    def Instance(self, *args):
+        return FakeInstance(self.clock)
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(media_player, 'monotonic', clock)
+    monkeypatch.setattr(media_player, 'vlc', FakeVlc(clock))
+    return clock
+
+
+@pytest.fixture
+def player(app, clock, tmp_path):
+    media = tmp_path / "video.mp4"
+    media.write_bytes(b"")
+    player = MediaPlayer()
+    assert player.load_media(str(media))
+    # 每秒一次字幕變化
+    player.set_next_event_provider(lambda seconds: int(seconds) + 1.0)
+    yield player
+    player.cleanup()
+
+
+def run(player, clock, seconds, step=0.05):
+    """推進時鐘，按時觸發字幕計時器和輪詢"""
+    next_event = clock.now + player.subtitle_timer.remainingTime() / 1000
+    next_poll = clock.now + player.POLL_INTERVAL_MS / 1000
+    end = clock.now + seconds
+    while clock.now < end:
+        clock.now += step
+        if player.subtitle_timer.isActive() and clock.now >= next_event:
+            player._on_subtitle_timer()
+            next_event = clock.now + player.subtitle_timer.remainingTime() / 1000
+        if clock.now >= next_poll:
+            player.update_position()
+            next_poll += player.POLL_INTERVAL_MS / 1000
+
+
+def test_poll_does_not_emit_position(player, clock):
+    positions = []
+    player.position_changed.connect(positions.append)
+    player.play()
+    clock.now += 0.5
+    player.resync()
+    emitted = len(positions)
+    player.update_position()
+    assert len(positions) == emitted
+    assert player.update_timer.isActive()
+
+
+def test_positions_never_go_backwards(player, clock):
+    positions = []
+    player.position_changed.connect(positions.append)
+    player.play()
+    clock.now += 0.5
+    player.resync()
+    run(player, clock, 10)
+    assert positions == sorted(positions)
+    # 每條字幕邊界都在變化時間之後觸發
+    boundaries = positions[1:]
+    assert len(boundaries) >= 9
+    assert all(position % 1000 < 100 for position in boundaries)
+
+
+def test_poll_reanchors_after_drift(player, clock):
+    player.play()
+    player.resync()
+    # 播放器跳了一段而字幕計時器不知道
+    player.player.position += 5000
+    clock.now += 0.5
+    player.update_position()
+    anchor_time, anchor_clock = player._clock_anchor
+    assert anchor_time == player.player.get_time()
+    assert anchor_clock == clock.now
+
+
+def test_poll_stops_while_paused(player, clock):
+    player.play()
+    assert player.update_timer.isActive()
+    player.pause()
+    assert not player.update_timer.isActive()
+    player.resume_update_timer()
+    assert not player.update_timer.isActive()
+    # 暫停時跳轉也會更新進度條
+    player.seek_relative(60000)
+    player.resync()
+    assert player.time_label.text().startswith("00:59")
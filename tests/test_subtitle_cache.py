@@ -0,0 +1,110 @@
+"""字幕緩存的讀寫和失效檢查"""
+import os
+import threading
+import pytest
+import subtitle_cache
+from cue_track import CueTrack
+from subtitle_cache import SubtitleCache
+from subtitle_index import SubtitleIndex
+from token_table import TokenTable
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = {'jp': tmp_path / 'jp.vtt', 'zh': tmp_path / 'zh.vtt'}
+    for lang, path in paths.items():
+        path.write_text(f"WEBVTT\n\n00:00:01.000 --> 00:00:02.000\n{lang}\n", encoding='utf-8')
+    return {lang: str(path) for lang, path in paths.items()}
+
+
+def save(cache, sources):
+    tracks = {'jp': CueTrack([1.0, 3.0], [2.0, 4.0], ["一", "二"]),
+              'zh': CueTrack([1.0], [2.5], ["一"])}
+    cache.save(sources, tracks, {lang: SubtitleIndex(track) for lang, track in tracks.items()})
+
+
+def test_round_trip(tmp_path, sources):
+    cache = SubtitleCache(str(tmp_path))
+    save(cache, sources)
+    tracks, indexes, tokens = cache.load(sources)
+    assert tracks['jp'].texts == ["一", "二"]
+    assert list(tracks['zh'].ends) == [2.5]
+    assert indexes['jp'].lookup(3.5).text == "二"
+    assert tokens is None
+
+
+def test_round_trip_with_tokens(tmp_path, sources):
+    cache = SubtitleCache(str(tmp_path))
+    tracks = {'jp': CueTrack([1.0, 3.0], [2.0, 4.0], ["今日は", "晴れ"]),
+              'zh': CueTrack([1.0], [2.5], ["一"])}
+    tokens = TokenTable.from_tokens(tracks['jp'].texts, [
+        [(0, 2, '今日', '名詞-普通名詞', 'キョー'), (2, 3, 'は', '助詞-係助詞', 'ワ')],
+        [(0, 2, '晴れ', '名詞-普通名詞', 'ハレ')],
+    ])
+    cache.save(sources, tracks, {lang: SubtitleIndex(track) for lang, track in tracks.items()}, tokens)
+
+    _, _, loaded = cache.load(sources)
+    for name in TokenTable.FIELDS:
+        assert getattr(loaded, name) == getattr(tokens, name)
+    assert loaded.strings == tokens.strings
+    assert loaded.cue_tokens(0) == tokens.cue_tokens(0)
+    assert loaded.find('晴れ') == {'surface': '晴れ', 'lemma': '晴れ', 'pos': '名詞-普通名詞',
+                                  'reading': 'ハレ', 'start': 0, 'end': 2}
+    assert loaded.vocabulary() == {'今日': 1, 'は': 1, '晴れ': 1}
+
+
+def test_changed_content_invalidates(tmp_path, sources):
+    cache = SubtitleCache(str(tmp_path))
+    save(cache, sources)
+    with open(sources['zh'], 'a', encoding='utf-8') as f:
+        f.write("\n")
+    assert cache.load(sources) is None
+    assert not os.path.exists(cache._cache_path(sources))
+
+
+def test_touched_file_records_new_mtime(tmp_path, sources, monkeypatch):
+    cache = SubtitleCache(str(tmp_path))
+    save(cache, sources)
+    stat = os.stat(sources['jp'])
+    os.utime(sources['jp'], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert cache.load(sources)[0]['jp'].texts == ["一", "二"]
+
+    # 修改時間已寫回緩存，再次讀取不需要計算哈希
+    def fail(path):
+        raise AssertionError("不應重新計算哈希")
+    monkeypatch.setattr(subtitle_cache, 'file_digest', fail)
+    tracks, indexes, _ = cache.load(sources)
+    assert tracks['jp'].texts == ["一", "二"]
+    assert indexes['zh'].lookup(2.0).text == "一"
+
+
+def test_concurrent_saves(tmp_path, sources, capsys):
+    cache = SubtitleCache(str(tmp_path / 'cache'))
+    os.makedirs(cache.cache_dir)
+
+    def worker():
+        for _ in range(20):
+            save(cache, sources)
+
+    # 主線程和分詞線程同時保存同一個緩存，save 出錯時只打印信息
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "保存字幕緩存失敗" not in capsys.readouterr().out
+    assert os.listdir(cache.cache_dir) == [os.path.basename(cache._cache_path(sources))]
+    assert cache.load(sources)[0]['jp'].texts == ["一", "二"]
+
+
+def test_failed_write_removes_temp_file(tmp_path, sources, monkeypatch):
+    cache = SubtitleCache(str(tmp_path / 'cache'))
+    os.makedirs(cache.cache_dir)
+
+    def fail(source, target):
+        raise OSError("磁盤已滿")
+
+    monkeypatch.setattr(subtitle_cache.os, 'replace', fail)
+    save(cache, sources)
+    assert os.listdir(cache.cache_dir) == []
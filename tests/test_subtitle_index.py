@@ -0,0 +1,24 @@
+"""SubtitleIndex 與原來逐條掃描的一致性測試，完整的性能測試見 benchmark_subtitle_index.py"""
+import random
+import pytest
+from benchmark_subtitle_index import synthetic_track, linear_scan, check_parity
+from subtitle_index import SubtitleIndex
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_lookup_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    track = synthetic_track(rng.choice((1, 20, 300)), rng)
+    index = SubtitleIndex(track)
+    times = list(index.bounds)
+    times += [t - 0.05 for t in times] + [t + 0.05 for t in times] + [-1.0, track.ends[-1] + 1]
+    assert check_parity(track, index, sorted(times)) == 0
+    rng.shuffle(times)
+    assert check_parity(track, index, times) == 0
+
+
+def test_dict_cues_without_end_use_default_duration():
+    cues = [{'start_seconds': 1.0, 'text': "甲"}, {'start_seconds': 3.0, 'end_seconds': 4.0, 'text': "乙"}]
+    index = SubtitleIndex(cues)
+    for t in (0.5, 1.0, 3.5, 6.0, 6.1):
+        assert index.lookup(t) is linear_scan(cues, t)
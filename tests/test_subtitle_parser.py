@@ -0,0 +1,26 @@
+"""流式字幕解析與 webvtt-py 的一致性測試，完整的比較見 benchmark_subtitle_parser.py"""
+import random
+import pytest
+from subtitle_parser import iter_cues
+
+webvtt = pytest.importorskip('webvtt')
+from benchmark_subtitle_parser import write_vtt, write_srt, read_with_webvtt
+
+
+@pytest.mark.parametrize('kind', ['karaoke', 'crlf', 'srt'])
+def test_matches_webvtt(tmp_path, kind):
+    rng = random.Random(kind)
+    path = str(tmp_path / ('cues.srt' if kind == 'srt' else 'cues.vtt'))
+    if kind == 'srt':
+        write_srt(path, 300, rng)
+    else:
+        write_vtt(path, 300, rng, karaoke=kind == 'karaoke', newline='\r\n' if kind == 'crlf' else '\n')
+    expected = read_with_webvtt(path)
+    for chunk_size in (7, 1000, 65536):
+        assert list(iter_cues(path, chunk_size=chunk_size)) == expected
+
+
+def test_keeps_line_whitespace(tmp_path):
+    path = tmp_path / 'cues.vtt'
+    path.write_text("WEBVTT\n\n00:00:01.000 --> 00:00:02.000\n  前 <c>後</c>  \n\t二行\t\n", encoding='utf-8')
+    assert list(iter_cues(str(path))) == [(1.0, 2.0, "  前 後  \n\t二行\t")]
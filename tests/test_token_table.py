@@ -0,0 +1,72 @@
+"""分詞表的查詢和詞彙統計"""
+import pytest
+import japanese_tagger
+import token_table
+from token_table import TokenTable, tokenize_texts
+
+TEXTS = ["今日は晴れ。", "", "晴れの日は 散歩"]
+TOKENS = [
+    [(0, 2, '今日', '名詞-普通名詞', 'キョー'), (2, 3, 'は', '助詞-係助詞', 'ワ'),
+     (3, 5, '晴れ', '名詞-普通名詞', 'ハレ'), (5, 6, '。', '補助記号-句点', '')],
+    [],
+    [(0, 2, '晴れ', '名詞-普通名詞', 'ハレ'), (2, 3, 'の', '助詞-格助詞', 'ノ'), (3, 4, '日', '名詞-普通名詞', 'ヒ'),
+     (4, 5, 'は', '助詞-係助詞', 'ワ'), (5, 6, ' ', '空白', ''), (6, 8, '散歩', '名詞-普通名詞', 'サンポ')],
+]
+
+
+@pytest.fixture
+def table():
+    return TokenTable.from_tokens(TEXTS, TOKENS)
+
+
+def test_columns(table):
+    assert len(table) == 10
+    assert list(table.cue_offsets) == [0, 4, 4, 10]
+    # 相同的字符串只保存一次
+    assert len(table.strings) == len(set(table.strings))
+    assert table.strings.count('晴れ') == 1
+
+
+def test_cue_tokens(table):
+    assert [token['surface'] for token in table.cue_tokens(0)] == ['今日', 'は', '晴れ', '。']
+    assert table.cue_tokens(1) == []
+    assert table.cue_tokens(2)[-1] == {'surface': '散歩', 'lemma': '散歩', 'pos': '名詞-普通名詞',
+                                       'reading': 'サンポ', 'start': 6, 'end': 8}
+
+
+def test_token_at(table):
+    assert table.token_at(0, 0)['surface'] == '今日'
+    assert table.token_at(0, 1)['surface'] == '今日'
+    assert table.token_at(0, 2)['surface'] == 'は'
+    assert table.token_at(2, 7)['surface'] == '散歩'
+    assert table.token_at(0, 6) is None
+    assert table.token_at(1, 0) is None
+
+
+def test_find(table):
+    # 返回第一次出現的位置
+    assert table.find('晴れ') == {'surface': '晴れ', 'lemma': '晴れ', 'pos': '名詞-普通名詞',
+                                 'reading': 'ハレ', 'start': 3, 'end': 5}
+    assert table.find('散歩')['start'] == 6
+    assert table.find('雨') is None
+
+
+def test_vocabulary(table):
+    vocabulary = table.vocabulary()
+    # 標點和空白不計入
+    assert vocabulary == {'今日': 1, 'は': 2, '晴れ': 2, 'の': 1, '日': 1, '散歩': 1}
+    assert table.vocabulary() is vocabulary
+
+
+def test_tokenize_texts_without_process_pool(monkeypatch):
+    if japanese_tagger.tokenize("今日") is None:
+        pytest.skip("沒有安裝分詞器")
+
+    def unavailable():
+        raise OSError("不能創建進程")
+
+    monkeypatch.setattr(token_table, '_get_executor', unavailable)
+    tokenized = tokenize_texts(["今日は", ""])
+    assert tokenized[1] == []
+    table = TokenTable.from_tokens(["今日は", ""], tokenized)
+    assert table.cue_tokens(0)[0]['surface'] == '今日'
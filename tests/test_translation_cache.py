@@ -0,0 +1,119 @@
+"""翻譯緩存的鍵、持久化和按最近使用清理"""
+import pytest
+import translation_cache
+from translation_cache import TranslationCache, normalize_text, translation_key
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(translation_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'translation_cache.sqlite3')
+
+
+@pytest.fixture
+def cache(db_path, clock):
+    cache = TranslationCache(db_path)
+    yield cache
+    cache.close()
+
+
+ARGS = ("ja", "zh-TW", "model-a", 1)
+
+
+def test_normalized_text_shares_key(cache):
+    assert normalize_text(" 今日は　ＡＢＣ\n ") == "今日は ABC"
+    cache.put("今日は ABC", *ARGS, "今天 ABC")
+    assert cache.get("今日は　ＡＢＣ\n", *ARGS) == "今天 ABC"
+
+
+@pytest.mark.parametrize('changed', [
+    ("en", "zh-TW", "model-a", 1),
+    ("ja", "zh-CN", "model-a", 1),
+    ("ja", "zh-TW", "model-b", 1),
+    ("ja", "zh-TW", "model-a", 2),
+])
+def test_model_and_prompt_version_invalidate(db_path, clock, changed):
+    cache = TranslationCache(db_path)
+    cache.put("今日は", *ARGS, "今天")
+    assert translation_key("今日は", *changed) != translation_key("今日は", *ARGS)
+    assert cache.get("今日は", *changed) is None
+    cache.close()
+    # 重新打開後同樣不命中
+    cache = TranslationCache(db_path)
+    assert cache.get("今日は", *changed) is None
+    assert cache.get("今日は", *ARGS) == "今天"
+    cache.close()
+
+
+def test_persists_across_instances(db_path, clock):
+    first = TranslationCache(db_path)
+    first.put("今日は", *ARGS, "今天")
+    first.close()
+    second = TranslationCache(db_path)
+    assert len(second) == 1
+    assert second.get("今日は", *ARGS) == "今天"
+    second.close()
+
+
+def test_evicts_least_recently_used(db_path, clock):
+    cache = TranslationCache(db_path, max_entries=10, memory_entries=100)
+    for i in range(10):
+        cache.put(f"字幕{i}", *ARGS, f"譯{i}")
+        clock.now += 1
+    # 內存命中也會更新使用時間，在下一次寫入時保存
+    assert cache.get("字幕0", *ARGS) == "譯0"
+    clock.now += 1
+    cache.put("字幕10", *ARGS, "譯10")
+    # 超出上限時刪除到上限的 EVICT_TO
+    assert len(cache) == int(10 * translation_cache.EVICT_TO)
+    assert cache.get("字幕1", *ARGS) is None
+    assert cache.get("字幕2", *ARGS) is None
+    assert cache.get("字幕0", *ARGS) == "譯0"
+    assert cache.get("字幕10", *ARGS) == "譯10"
+    # 重新寫入已有的條目不增加條目數
+    cache.put("字幕10", *ARGS, "新譯10")
+    assert len(cache) == 9
+    assert cache.get("字幕10", *ARGS) == "新譯10"
+    cache.close()
+
+
+def test_close_saves_last_used(db_path, clock):
+    cache = TranslationCache(db_path, max_entries=3)
+    for i in range(3):
+        cache.put(f"字幕{i}", *ARGS, f"譯{i}")
+        clock.now += 1
+    cache.get("字幕0", *ARGS)
+    cache.close()
+
+    # 關閉時保存了內存命中的使用時間，所以刪除的是字幕1和字幕2
+    cache = TranslationCache(db_path, max_entries=3)
+    clock.now += 1
+    cache.put("字幕3", *ARGS, "譯3")
+    assert cache.get("字幕1", *ARGS) is None
+    assert cache.get("字幕2", *ARGS) is None
+    assert cache.get("字幕0", *ARGS) == "譯0"
+    cache.close()
+
+
+def test_memory_limit(db_path, clock):
+    cache = TranslationCache(db_path, memory_entries=2)
+    for i in range(3):
+        cache.put(f"字幕{i}", *ARGS, f"譯{i}")
+    assert len(cache._memory) == 2
+    assert cache.get("字幕0", *ARGS) == "譯0"
+    assert len(cache._memory) == 2
+    cache.close()
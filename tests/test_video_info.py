@@ -0,0 +1,68 @@
+"""視頻信息緩存的有效期和重新獲取"""
+import os
+import json
+import time
+import pytest
+from yt_dlp.utils import DownloadError
+from video_info import LocalInfoExtractor, VideoInfoCache
+
+URL = "https://www.youtube.com/watch?v=abcdefghijk"
+
+
+class CountingExtractor(LocalInfoExtractor):
+    def __init__(self, info_dir):
+        super().__init__(info_dir)
+        self.calls = 0
+
+    def extract(self, url):
+        self.calls += 1
+        return super().extract(url)
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    info_dir = tmp_path / 'infos'
+    info_dir.mkdir()
+    info = {'id': 'abcdefghijk', 'webpage_url': URL, 'title': 'テスト'}
+    (info_dir / 'test.info.json').write_text(json.dumps(info), encoding='utf-8')
+    (info_dir / 'ignored.json').write_text('{}', encoding='utf-8')
+    return CountingExtractor(str(info_dir))
+
+
+@pytest.fixture
+def cache(tmp_path, extractor):
+    return VideoInfoCache(extractor, str(tmp_path), max_age=60)
+
+
+def test_local_extractor(extractor):
+    assert extractor.extract("https://youtu.be/abcdefghijk")['title'] == 'テスト'
+    with pytest.raises(DownloadError):
+        extractor.extract("https://youtu.be/zzzzzzzzzzz")
+
+
+def test_get_uses_cache(cache, extractor):
+    assert cache.get(URL)['title'] == 'テスト'
+    # 同一個視頻的不同網址共用緩存
+    assert cache.get("https://youtu.be/abcdefghijk")['title'] == 'テスト'
+    assert extractor.calls == 1
+    cache.get(URL, refresh=True)
+    assert extractor.calls == 2
+
+
+def test_expired_cache_is_refetched(cache, extractor):
+    cache.get(URL)
+    old = time.time() - 120
+    os.utime(cache._cache_path(URL), (old, old))
+    assert cache.cached(URL) is None
+    cache.get(URL)
+    assert extractor.calls == 2
+    assert cache.cached(URL)['title'] == 'テスト'
+
+
+def test_invalidate(cache, extractor):
+    cache.get(URL)
+    cache.invalidate(URL)
+    cache.invalidate(URL)
+    assert cache.cached(URL) is None
+    cache.get(URL)
+    assert extractor.calls == 2
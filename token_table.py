@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+import multiprocessing
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import japanese_tagger
+
+# 每個工作進程一次處理的字幕條數
+TOKENIZE_CHUNK_SIZE = 256
+# 每個工作進程都要加載自己的 UniDic 詞典，一條字幕軌用兩個進程就足夠
+TOKENIZE_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _tokenize_chunk(texts):
+    """在工作進程中分詞一批字幕，每個進程有自己的分詞器"""
+    return [japanese_tagger.tokenize(text) for text in texts]
+
+
+def _get_executor():
+    """返回共用的進程池，第一次調用時創建"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # 不使用 fork，避免子進程繼承 Qt 和其他線程的狀態
+            _executor = ProcessPoolExecutor(max_workers=min(TOKENIZE_WORKERS, os.cpu_count() or 1),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def tokenize_texts(texts):
+    """在進程池中分詞所有字幕，進程池不可用時在當前線程中分詞
+
+    Returns:
+        每條字幕的 [(開始, 結束, 詞根, 詞性, 讀音)] 列表，分詞器不可用時返回 None
+    """
+    texts = list(texts)
+    chunks = [texts[i:i + TOKENIZE_CHUNK_SIZE] for i in range(0, len(texts), TOKENIZE_CHUNK_SIZE)]
+    try:
+        results = list(_get_executor().map(_tokenize_chunk, chunks))
+    except Exception as e:
+        print(f"分詞進程池不可用，改為在後台線程中分詞: {e}")
+        results = [_tokenize_chunk(chunk) for chunk in chunks]
+
+    tokenized = [tokens for chunk in results for tokens in chunk]
+    if any(tokens is None for tokens in tokenized):
+        return None
+    return tokenized
+
+
+class TokenTable:
+    """一條字幕軌的分詞結果，列式存儲
+
+    每個詞記錄在字幕中的起止字符位置，以及詞根、詞性、讀音在字符串表中的編號；
+    表面形式直接從字幕文本切出，不另外保存。cue_offsets[i]:cue_offsets[i+1] 是第 i 條字幕的詞。
+    """
+
+    FIELDS = ('cue_offsets', 'starts', 'ends', 'lemmas', 'pos', 'readings')
+
+    def __init__(self, texts, cue_offsets, starts, ends, lemmas, pos, readings, strings):
+        """初始化分詞表
+
+        Args:
+            texts: 字幕文本列表
+            cue_offsets: 每條字幕第一個詞的編號 array('i')，長度為字幕數 + 1
+            starts, ends: 詞在字幕中的起止字符位置 array('i')
+            lemmas, pos, readings: 詞根、詞性、讀音在 strings 中的編號 array('i')
+            strings: 字符串表
+        """
+        self.texts = texts
+        self.cue_offsets = cue_offsets
+        self.starts = starts
+        self.ends = ends
+        self.lemmas = lemmas
+        self.pos = pos
+        self.readings = readings
+        self.strings = strings
+        self._by_surface = None
+        self._vocabulary = None
+
+    @classmethod
+    def from_tokens(cls, texts, tokenized):
+        """從 tokenize_texts 的結果創建分詞表"""
+        string_ids = {}
+        strings = []
+
+        def string_id(value):
+            index = string_ids.get(value)
+            if index is None:
+                index = string_ids[value] = len(strings)
+                strings.append(sys.intern(value))
+            return index
+
+        columns = {field: array('i') for field in cls.FIELDS}
+        columns['cue_offsets'].append(0)
+        for tokens in tokenized:
+            for start, end, lemma, pos, reading in tokens:
+                columns['starts'].append(start)
+                columns['ends'].append(end)
+                columns['lemmas'].append(string_id(lemma))
+                columns['pos'].append(string_id(pos))
+                columns['readings'].append(string_id(reading))
+            columns['cue_offsets'].append(len(columns['starts']))
+        return cls(texts, strings=strings, **columns)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _token(self, cue_index, token_index):
+        """組裝一個詞的信息字典"""
+        start = self.starts[token_index]
+        end = self.ends[token_index]
+        return {
+            'surface': self.texts[cue_index][start:end],
+            'lemma': self.strings[self.lemmas[token_index]],
+            'pos': self.strings[self.pos[token_index]],
+            'reading': self.strings[self.readings[token_index]],
+            'start': start,
+            'end': end,
+        }
+
+    def cue_tokens(self, cue_index):
+        """返回一條字幕的所有詞"""
+        return [self._token(cue_index, i)
+                for i in range(self.cue_offsets[cue_index], self.cue_offsets[cue_index + 1])]
+
+    def token_at(self, cue_index, offset):
+        """返回字幕中第 offset 個字符所在的詞，沒有則返回 None"""
+        first = self.cue_offsets[cue_index]
+        last = self.cue_offsets[cue_index + 1]
+        i = bisect_right(self.starts, offset, first, last) - 1
+        if i >= first and offset < self.ends[i]:
+            return self._token(cue_index, i)
+        return None
+
+    def find(self, surface):
+        """按表面形式查找字幕中出現過的詞，沒有則返回 None"""
+        if self._by_surface is None:
+            by_surface = {}
+            for cue_index in range(len(self.cue_offsets) - 1):
+                text = self.texts[cue_index]
+                for i in range(self.cue_offsets[cue_index], self.cue_offsets[cue_index + 1]):
+                    by_surface.setdefault(text[self.starts[i]:self.ends[i]], (cue_index, i))
+            self._by_surface = by_surface
+        position = self._by_surface.get(surface)
+        return self._token(*position) if position else None
+
+    def vocabulary(self):
+        """返回 {詞根: 出現次數}，不包括標點和符號"""
+        if self._vocabulary is None:
+            skipped = {index for index, value in enumerate(self.strings)
+                       if value.startswith(('補助記号', '空白'))}
+            self._vocabulary = Counter(self.strings[lemma] for lemma, pos in zip(self.lemmas, self.pos)
+                                       if pos not in skipped)
+        return self._vocabulary
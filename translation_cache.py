@@ -0,0 +1,154 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from paths import get_download_path
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# 超出上限時一次刪除到上限的這個比例，避免之後每次寫入都要清理
+EVICT_TO = 0.9
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    key TEXT PRIMARY KEY,
+    source_text TEXT NOT NULL,
+    source_lang TEXT NOT NULL,
+    target_lang TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations(last_used);
+"""
+
+
+def normalize_text(text):
+    """統一全角半角和空白，使只有格式不同的字幕得到相同的鍵"""
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def translation_key(text, source_lang, target_lang, model, prompt_version):
+    """按內容生成緩存鍵：正規化文本、語言對、模型和提示詞版本"""
+    parts = [normalize_text(text), source_lang, target_lang, model, str(prompt_version)]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class TranslationCache:
+    """翻譯結果的持久化緩存
+
+    數據保存在 SQLite 中，每次只寫入新增的條目；最近使用的條目同時保存在內存中。
+    條目數超過上限時一次刪除一批最久未使用的條目。多個線程或進程可以同時寫入。
+    """
+
+    def __init__(self, db_path=None, max_entries=50000, memory_entries=2048):
+        """初始化翻譯緩存
+
+        Args:
+            db_path: 資料庫文件路徑
+            max_entries: 資料庫中保留的最多條目數
+            memory_entries: 內存中保留的最多條目數
+        """
+        self.db_path = db_path or get_download_path("translation_cache.sqlite3")
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # 鍵 -> 翻譯，按最近使用排序
+        self._touched = set()  # 內存命中但還沒有更新資料庫使用時間的鍵
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript(SCHEMA)
+            # 資料庫的大約條目數，寫入時累加，只在超出上限時重新統計
+            self._count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def close(self):
+        """保存使用時間並關閉資料庫"""
+        with self._lock:
+            try:
+                with self._conn:
+                    self._flush_touched()
+            except sqlite3.Error as e:
+                print(f"保存翻譯緩存使用時間失敗: {e}")
+            self._conn.close()
+
+    def get(self, text, source_lang, target_lang, model, prompt_version):
+        """查詢翻譯，沒有緩存時返回 None"""
+        key = translation_key(text, source_lang, target_lang, model, prompt_version)
+        with self._lock:
+            translation = self._memory.get(key)
+            if translation is not None:
+                self._memory.move_to_end(key)
+                self._touched.add(key)
+                return translation
+
+            row = self._conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched.add(key)
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, text, source_lang, target_lang, model, prompt_version, translation):
+        """保存翻譯"""
+        key = translation_key(text, source_lang, target_lang, model, prompt_version)
+        now = time.time()
+        with self._lock:
+            self._remember(key, translation)
+            try:
+                with self._conn:
+                    exists = self._conn.execute("SELECT 1 FROM translations WHERE key = ?", (key,)).fetchone()
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO translations (key, source_text, source_lang, target_lang, model,"
+                        " prompt_version, translation, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (key, text, source_lang, target_lang, model, str(prompt_version), translation, now, now))
+                    if not exists:
+                        self._count += 1
+                    self._touched.discard(key)
+                    self._flush_touched()
+                    if self._count > self.max_entries:
+                        self._evict()
+            except sqlite3.Error as e:
+                print(f"保存翻譯緩存失敗: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+
+    def _remember(self, key, translation):
+        """加入內存緩存，調用時需持有鎖"""
+        self._memory[key] = translation
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_touched(self):
+        """把內存命中的使用時間寫入資料庫，調用時需持有鎖"""
+        if not self._touched:
+            return
+        now = time.time()
+        self._conn.executemany("UPDATE translations SET last_used = ? WHERE key = ?",
+                               [(now, key) for key in self._touched])
+        self._touched.clear()
+
+    def _evict(self):
+        """條目數超出上限時刪除最久未使用的條目，直到上限的 EVICT_TO，調用時需持有鎖"""
+        # 其他進程也可能寫入，清理前重新統計
+        self._count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        excess = self._count - int(self.max_entries * EVICT_TO)
+        evicted = [row[0] for row in self._conn.execute(
+            "SELECT key FROM translations ORDER BY last_used LIMIT ?", (excess,))]
+        self._conn.executemany("DELETE FROM translations WHERE key = ?", [(key,) for key in evicted])
+        self._count -= len(evicted)
+        for key in evicted:
+            self._memory.pop(key, None)
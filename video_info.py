@@ -0,0 +1,115 @@
+import os
+import json
+import copy
+import time
+import hashlib
+import threading
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError
+from download_manager import video_key
+from paths import get_manifest_path
+
+# 視頻信息中的下載地址（包括字幕地址）會過期，超過這個時間（秒）就重新獲取
+INFO_MAX_AGE = 5 * 60 * 60
+
+
+class YoutubeInfoExtractor:
+    """通過 yt_dlp 從網絡獲取視頻信息"""
+
+    def extract(self, url):
+        """獲取未經格式選擇的視頻信息字典"""
+        with YoutubeDL({'quiet': True, 'noplaylist': True}) as ydl:
+            info = ydl.extract_info(url, download=False, process=False)
+            return ydl.sanitize_info(info)
+
+
+class LocalInfoExtractor:
+    """從本地的 .info.json 文件讀取視頻信息，不訪問網絡
+
+    用於測試和離線環境，可以讀取 yt-dlp --write-info-json 保存的文件。
+    """
+
+    def __init__(self, info_dir):
+        self.infos = {}
+        for name in os.listdir(info_dir):
+            if not name.endswith('.info.json'):
+                continue
+            with open(os.path.join(info_dir, name), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            self.infos[video_key(info.get('webpage_url') or info['id'])] = info
+
+    def extract(self, url):
+        """返回本地保存的視頻信息，找不到時拋出 DownloadError"""
+        info = self.infos.get(video_key(url))
+        if info is None:
+            raise DownloadError(f"本地沒有視頻信息: {url}")
+        return copy.deepcopy(info)
+
+
+class VideoInfoCache:
+    """按視頻緩存的視頻信息
+
+    同一個視頻的下載、斷點續傳和切換字幕語言共用一份視頻信息，
+    不需要每次都重新解析網頁。
+    """
+
+    def __init__(self, extractor=None, cache_dir=None, max_age=INFO_MAX_AGE):
+        """初始化視頻信息緩存
+
+        Args:
+            extractor: 獲取視頻信息的對象，需提供 extract(url) 方法
+            cache_dir: 緩存目錄
+            max_age: 緩存的有效時間（秒）
+        """
+        self.extractor = extractor or YoutubeInfoExtractor()
+        self.cache_dir = cache_dir or get_manifest_path()
+        self.max_age = max_age
+        self._lock = threading.Lock()
+
+    def _cache_path(self, url):
+        """根據視頻 ID 生成緩存文件路徑"""
+        name = hashlib.sha1(video_key(url).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{name}.info.json")
+
+    def get(self, url, refresh=False):
+        """獲取視頻信息，緩存不存在、已過期或 refresh 為 True 時重新獲取"""
+        if not refresh:
+            info = self.cached(url)
+            if info is not None:
+                return info
+
+        info = self.extractor.extract(url)
+        self._save(self._cache_path(url), info)
+        return info
+
+    def cached(self, url):
+        """讀取未過期的緩存，不存在或已過期時返回 None"""
+        cache_path = self._cache_path(url)
+        try:
+            if time.time() - os.path.getmtime(cache_path) > self.max_age:
+                return None
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except OSError:
+            return None
+        except Exception as e:
+            print(f"讀取視頻信息失敗: {e}")
+            return None
+
+    def _save(self, cache_path, info):
+        """保存視頻信息"""
+        try:
+            with self._lock:
+                temp_path = cache_path + '.tmp'
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(info, f, ensure_ascii=False)
+                os.replace(temp_path, cache_path)
+        except Exception as e:
+            print(f"保存視頻信息失敗: {e}")
+
+    def invalidate(self, url):
+        """刪除指定視頻的緩存"""
+        try:
+            os.remove(self._cache_path(url))
+        except OSError:
+            pass